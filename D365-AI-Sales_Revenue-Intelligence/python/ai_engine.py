@@ -1,23 +1,34 @@
 """
 ai_engine.py — D365 AI Sales & Revenue Intelligence
 Builds sales performance prompts and calls Ollama qwen3:8b.
-Async httpx pattern identical to Projects 1 & 2.
+Async httpx pattern identical to Projects 1 & 2, routed through ollama_pool.
+Each Ollama attempt is an "ollama" trace span with model, prompt size and token
+counts; a background narrative job runs as its own trace (tracing.py).
 """
 
 import re
 import logging
 import asyncio
-import httpx
 
-from config import OLLAMA_URL, OLLAMA_MODEL
+from config import OLLAMA_MODEL, NARRATIVE_CACHE_ENABLED
+from narrative_cache import fingerprint, get_cache
+from ollama_pool import pool
+import tracing
 
 log = logging.getLogger(__name__)
 
+# call_ollama() returns these instead of raising — never cache them
+_FAILURE_PREFIXES = (
+    "AI narrative unavailable",
+    "Cannot reach Ollama",
+    "Ollama did not respond",
+)
+
 
 # ── Warm-up (exact Projects 1 & 2 pattern) ───────────────────────────────────
 
-async def warm_up_ollama():
-    """Ping Ollama on startup — exact same pattern as Projects 1 & 2."""
+async def warm_up_ollama() -> bool:
+    """Ping every Ollama backend on startup. True if the model loaded on at least one."""
     payload = {
         "model":      OLLAMA_MODEL,
         "messages":   [{"role": "user", "content": "hello"}],
@@ -26,23 +37,22 @@ async def warm_up_ollama():
         "options":    {"num_predict": 5},
     }
     try:
-        log.info(f"Warming up Ollama: {OLLAMA_MODEL}")
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            r = await client.post(f"{OLLAMA_URL}/api/chat", json=payload)
-            if r.status_code == 200:
-                log.info("Ollama warm-up complete")
-            else:
-                log.warning(f"Ollama warm-up status: {r.status_code}")
+        log.info(f"Warming up Ollama: {OLLAMA_MODEL} on {len(pool.backends)} backend(s)")
+        loaded = await pool.each("/api/chat", payload, timeout=300.0)
+        if any(loaded):
+            log.info(f"Ollama warm-up complete ({sum(loaded)}/{len(loaded)} backends)")
+            return True
     except Exception as e:
         log.warning(f"Ollama warm-up failed (non-fatal): {e}")
+    return False
 
 
 # ── Ollama Call ───────────────────────────────────────────────────────────────
 
 async def call_ollama(prompt: str) -> str:
     """
-    Send prompt to Ollama, return clean response.
-    Retries once if first attempt fails.
+    Send prompt to the least-loaded healthy Ollama backend, return clean response.
+    The pool fails over between backends; if none answers, re-warms and retries once.
     Strips <think> tags from qwen3 output.
     """
     payload = {
@@ -55,25 +65,30 @@ async def call_ollama(prompt: str) -> str:
     }
 
     for attempt in range(2):
-        try:
-            if attempt == 1:
-                log.info("Retrying Ollama after warm-up...")
-                await warm_up_ollama()
-                await asyncio.sleep(3)
+        with tracing.span("ollama", attempt=attempt + 1, model=OLLAMA_MODEL, prompt_chars=len(prompt)) as span:
+            try:
+                if attempt == 1:
+                    log.info("Retrying Ollama after warm-up...")
+                    await warm_up_ollama()
+                    await asyncio.sleep(3)
 
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                r = await client.post(f"{OLLAMA_URL}/api/chat", json=payload)
+                r = await pool.post("/api/chat", payload, timeout=300.0)
+                span.set(status=r.status_code)
                 if r.status_code == 200:
-                    raw   = r.json().get("message", {}).get("content", "")
+                    body  = r.json()
+                    raw   = body.get("message", {}).get("content", "")
                     clean = re.sub(r"<think>.*?</think>", "", raw, flags=re.DOTALL).strip()
+                    span.set(prompt_tokens=body.get("prompt_eval_count"), output_tokens=body.get("eval_count"),
+                             chars=len(clean))
                     log.info(f"Ollama responded: {len(clean)} chars")
                     return clean or "AI narrative unavailable — empty response."
                 log.error(f"Ollama {r.status_code}: {r.text[:200]}")
 
-        except Exception as e:
-            log.error(f"Ollama attempt {attempt + 1} failed: {e}")
-            if attempt == 1:
-                return f"Cannot reach Ollama after retry: {e}"
+            except Exception as e:
+                span.set(error=str(e) or type(e).__name__)
+                log.error(f"Ollama attempt {attempt + 1} failed: {e}")
+                if attempt == 1:
+                    return f"Cannot reach Ollama after retry: {e}"
 
     return "Ollama did not respond. Check that Ollama is running."
 
@@ -133,6 +148,134 @@ Be direct, use the actual numbers. No disclaimers."""
 
 # ── Narrative Pipeline ────────────────────────────────────────────────────────
 
-async def generate_sales_narrative(summary: dict) -> str:
-    """Build prompt -> call Ollama -> return narrative."""
-    return await call_ollama(build_sales_prompt(summary))
+async def generate_sales_narrative(summary: dict, regenerate: bool = False) -> str:
+    """
+    Build prompt -> narrative cache -> call Ollama on a miss -> return narrative.
+    regenerate=True skips the cache lookup and overwrites the entry.
+    """
+    with tracing.span("prompt_build") as span:
+        prompt = build_sales_prompt(summary)
+        span.set(chars=len(prompt))
+    if not NARRATIVE_CACHE_ENABLED:
+        return await call_ollama(prompt)
+
+    key = fingerprint(prompt, OLLAMA_MODEL)
+    if not regenerate:
+        cached = await _cache_get(key)
+        if cached is not None:
+            log.info(f"Narrative cache hit ({key[:12]})")
+            tracing.annotate(narrative_cache="hit")
+            return cached
+
+    narrative = await call_ollama(prompt)
+    if not narrative.startswith(_FAILURE_PREFIXES):
+        await asyncio.to_thread(lambda: get_cache().put(key, OLLAMA_MODEL, narrative))
+    return narrative
+
+
+async def _cache_get(key: str):
+    """Narrative cache lookup off the event loop (SQLite; the first call opens the file)."""
+    return await asyncio.to_thread(lambda: get_cache().get(key))
+
+
+
+# ── Progressive delivery ──────────────────────────────────────────────────────
+# The dashboard renders without waiting for Ollama: start_sales_narrative()
+# kicks generation off in the background and the page's loader script fetches
+# the result from /dashboard/narrative/{key} (see server.py).
+
+_jobs = {}        # prompt fingerprint -> asyncio.Task / Future with the narrative
+_MAX_JOBS = 32    # finished jobs kept for late pollers (cache may be disabled)
+
+
+async def start_sales_narrative(summary: dict, regenerate: bool = False, on_ready=None) -> tuple:
+    """
+    Return (key, narrative) if the narrative is already available, otherwise
+    start generating it in the background and return (key, None).
+    Concurrent dashboards with the same summary share one Ollama call; a
+    finished job is reused only if it produced a narrative, so a failed
+    generation is retried by the next dashboard instead of being served.
+    on_ready(narrative) runs in a worker thread once a started job succeeds.
+    """
+    key = fingerprint(build_sales_prompt(summary), OLLAMA_MODEL)
+
+    if not regenerate:
+        if NARRATIVE_CACHE_ENABLED:
+            cached = await _cache_get(key)
+            if cached is not None:
+                return key, cached
+        job = _jobs.get(key)
+        if job is not None and _succeeded(job):
+            return key, job.result()
+
+    job = _jobs.get(key)
+    if job is None or job.done():
+        _prune_jobs()
+        # cache already checked above, so always regenerate inside the job
+        _jobs[key] = asyncio.create_task(_narrative_job(summary, on_ready))
+        log.info(f"Narrative generation started in background ({key[:12]})")
+        tracing.annotate(narrative_job=key[:12])
+    return key, None
+
+
+async def _narrative_job(summary: dict, on_ready) -> str:
+    # outlives the request that started it, so it is traced on its own (parent = that request)
+    with tracing.trace("narrative job"):
+        narrative = await generate_sales_narrative(summary, regenerate=True)
+    if on_ready is not None and not narrative.startswith(_FAILURE_PREFIXES):
+        try:
+            await asyncio.to_thread(on_ready, narrative)
+        except Exception as e:
+            log.warning(f"Narrative on_ready callback failed: {e}")
+    return narrative
+
+
+def narrative_ok(narrative: str) -> bool:
+    """False for the fallback text returned when Ollama is unavailable."""
+    return bool(narrative) and not narrative.startswith(_FAILURE_PREFIXES)
+
+
+def _succeeded(job) -> bool:
+    """Finished job whose result is a narrative, not an exception or Ollama's failure text."""
+    return job.done() and not job.cancelled() and job.exception() is None and narrative_ok(job.result())
+
+
+def seed_narrative(summary: dict, narrative: str) -> None:
+    """Register a known narrative (e.g. from the summary snapshot) as a finished job."""
+    key = fingerprint(build_sales_prompt(summary), OLLAMA_MODEL)
+    if key in _jobs:
+        return
+    done = asyncio.get_running_loop().create_future()
+    done.set_result(narrative)
+    _jobs[key] = done
+
+
+async def await_narrative(key: str, timeout: float) -> tuple:
+    """
+    Wait up to timeout seconds for the narrative behind key. Returns
+    ("ready", narrative), ("pending", None) while it is still running, or
+    ("failed", message) when the job raised or Ollama did not answer.
+    KeyError if unknown.
+    """
+    job = _jobs.get(key)
+    if job is None:
+        cached = await _cache_get(key) if NARRATIVE_CACHE_ENABLED else None
+        if cached is None:
+            raise KeyError(key)
+        return "ready", cached
+
+    await asyncio.wait({job}, timeout=timeout)
+    if not job.done():
+        return "pending", None
+    if job.cancelled() or job.exception() is not None:
+        return "failed", f"AI narrative unavailable — {job.exception() if not job.cancelled() else 'cancelled'}."
+    if not narrative_ok(job.result()):
+        return "failed", f"AI narrative unavailable — {job.result()}"
+    return "ready", job.result()
+
+
+def _prune_jobs() -> None:
+    """Drop the oldest finished jobs once more than _MAX_JOBS are held."""
+    finished = [k for k, job in _jobs.items() if job.done()]
+    for k in finished[: max(0, len(_jobs) - _MAX_JOBS + 1)]:
+        del _jobs[k]
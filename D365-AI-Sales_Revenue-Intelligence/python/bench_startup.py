@@ -0,0 +1,101 @@
+"""
+bench_startup.py — D365 AI Sales & Revenue Intelligence
+Measure server time-to-listen: process start → first /health 200, then the
+time until /health reports "ready" (all background startup tasks finished).
+
+  python bench_startup.py                                  # this server, 5 runs
+  python bench_startup.py --runs 10
+  python bench_startup.py --app-dir ../../D365_AI_Sales-Assistant/python
+
+Each run starts `uvicorn server:app` in a fresh process on a free port with the
+.env of --app-dir. Unreachable Ollama / D365 only make "ready" faster (the
+tasks fail, non-fatally); time-to-listen should not depend on them at all.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+POLL_SECONDS = 0.005
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _health(port: int):
+    """Parsed /health JSON, or None while the server is not answering."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as r:
+            return json.loads(r.read())
+    except OSError:
+        return None
+
+
+def run_once(app_dir: str, ready_timeout: float) -> tuple:
+    """(seconds to first /health, seconds to ready or None) for one server start."""
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=app_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        listen = ready = None
+        while time.perf_counter() - started < ready_timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            body = _health(port)
+            if body is not None:
+                now = time.perf_counter() - started
+                listen = listen or now
+                if body.get("ready", True):
+                    ready = now
+                    break
+            time.sleep(POLL_SECONDS)
+        if listen is None:
+            raise RuntimeError(f"no /health answer within {ready_timeout:g}s")
+        return listen, ready
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    listens, readies = [], []
+    for i in range(args.runs):
+        listen, ready = run_once(args.app_dir, args.ready_timeout)
+        listens.append(listen)
+        if ready is not None:
+            readies.append(ready)
+        print(
+            f"run {i + 1}: listen {listen * 1000:8.0f} ms   "
+            f"ready {'timeout' if ready is None else f'{ready * 1000:8.0f} ms'}"
+        )
+
+    print(
+        f"\ntime-to-listen  median {statistics.median(listens) * 1000:.0f} ms  "
+        f"min {min(listens) * 1000:.0f} ms  max {max(listens) * 1000:.0f} ms"
+    )
+    if readies:
+        print(f"time-to-ready   median {statistics.median(readies) * 1000:.0f} ms  ({len(readies)}/{args.runs} runs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+bench_summary.py — D365 AI Sales & Revenue Intelligence
+Benchmark the Python vs NumPy summary engines on synthetic SalesOrderLines.
+
+  python bench_summary.py              # 10k, 1M, 10M lines
+  python bench_summary.py 50000 2000000
+
+Up to 1M lines both engines run end-to-end on line dicts and the outputs are
+compared for equality. Above that, building 10M Python dicts needs several GB,
+so only the NumPy aggregation is timed, on columns generated directly.
+"""
+
+import sys
+import time
+import random
+
+import numpy as np
+
+from odata import _summarise_python
+from columnar import build_columns, summarise_columns
+
+DICT_LIMIT  = 1_000_000
+CUSTOMERS   = 500
+ITEMS       = 20_000
+CATEGORIES  = ["Televisions", "Speakers", "Projectors", "Cables", "Mounts", ""]
+
+
+def synthetic_lines(n: int, seed: int = 7) -> list:
+    """Line dicts shaped like odata.fetch_sales_lines() output."""
+    rnd = random.Random(seed)
+    return [
+        {
+            "sales_order_num":  f"{rnd.randrange(n // 8 + 1):06d}",
+            "customer_account": f"US-{rnd.randrange(CUSTOMERS):03d}",
+            "item_number":      f"T{rnd.randrange(ITEMS):05d}",
+            "product_name":     f"Product {rnd.randrange(ITEMS)}",
+            "quantity":         float(rnd.randint(1, 20)),
+            "line_amount":      round(rnd.uniform(10, 25_000), 2),
+            "category":         rnd.choice(CATEGORIES),
+        }
+        for _ in range(n)
+    ]
+
+
+def synthetic_columns(n: int, seed: int = 7) -> dict:
+    """build_columns()-shaped columns generated without any Python dicts."""
+    rng = np.random.default_rng(seed)
+    n_orders = n // 8 + 1
+    amount   = rng.uniform(10, 25_000, n).round(2)
+    return {
+        "customer":        rng.integers(0, CUSTOMERS, n),
+        "customer_labels": np.array([f"US-{i:03d}" for i in range(CUSTOMERS)], dtype=object),
+        "item":            rng.integers(0, ITEMS, n),
+        "item_labels":     np.array([f"T{i:05d}" for i in range(ITEMS)], dtype=object),
+        "product_names":   [f"Product {i}" for i in range(ITEMS)],
+        "category":        rng.integers(0, len(CATEGORIES), n),
+        "category_labels": np.array([c or "Other" for c in CATEGORIES], dtype=object),
+        "order":           rng.integers(0, n_orders, n),
+        "n_orders":        n_orders,
+        "amount":          amount,
+        "quantity":        rng.integers(1, 21, n).astype(np.float64),
+        "grand_total":     float(amount.sum()),
+        "total_lines":     n,
+    }
+
+
+def _timed(fn, *args) -> tuple:
+    started = time.perf_counter()
+    result  = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def bench(n: int) -> None:
+    if n <= DICT_LIMIT:
+        lines = synthetic_lines(n)
+        py_summary, py_s   = _timed(_summarise_python, lines)
+        cols, build_s      = _timed(build_columns, lines)
+        np_summary, agg_s  = _timed(summarise_columns, cols)
+        same = "identical" if py_summary == np_summary else "MISMATCH"
+        print(
+            f"{n:>12,} lines | python {py_s:7.2f}s | numpy {build_s + agg_s:7.2f}s "
+            f"(columns {build_s:.2f}s + aggregate {agg_s:.2f}s) | "
+            f"{py_s / (build_s + agg_s):5.1f}x | {same}"
+        )
+    else:
+        cols          = synthetic_columns(n)
+        _, agg_s      = _timed(summarise_columns, cols)
+        print(f"{n:>12,} lines | python     skip | numpy aggregate {agg_s:.2f}s (pre-built columns)")
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 1_000_000, 10_000_000]
+    for size in sizes:
+        bench(size)
@@ -4,9 +4,15 @@ Builds Chart.js HTML visualisations from sales performance summary.
 Single self-contained HTML string for D365 WebControl rendering.
 All styles are INLINE — D365 strips <style> blocks, inline styles survive sandboxing.
 Chart.js loaded from D365 AOT resource: /resources/scripts/SalesIntelligenceChartJS.js
+in F&O, and from the same bundled file via /static/chart.<hash>.js elsewhere.
 """
 
+import html
+import json
 import re
+from functools import lru_cache
+
+from static_assets import chartjs_src
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
@@ -14,6 +20,13 @@ def _safe_label(text: str) -> str:
     """Escape quotes/backslashes so the label is safe inside a JS double-quoted string."""
     return text.replace("\\", "\\\\").replace('"', '\\"').replace("'", "\\'")
 
+def _company_label(summary: dict) -> str:
+    """USMF for a single entity, "USMF + DEMF (consolidated)" for company=ALL."""
+    companies = summary.get("companies")
+    if companies:
+        return f"{' + '.join(companies)} (consolidated)"
+    return summary.get("company") or "USMF"
+
 # ── Tier Colours ──────────────────────────────────────────────────────────────
 
 TIER_COLOURS = {
@@ -23,6 +36,12 @@ TIER_COLOURS = {
     "Bronze":   "#92400e",
 }
 
+CATEGORY_COLOURS = [
+    "#7c3aed", "#3b82f6", "#22c55e", "#f97316",
+    "#ec4899", "#14b8a6", "#d97706", "#6b7280",
+    "#dc2626", "#0ea5e9"
+]
+
 # ── Inline Style Constants ────────────────────────────────────────────────────
 
 S = {
@@ -56,12 +75,27 @@ S = {
 
 # ── Main Entry Point ──────────────────────────────────────────────────────────
 
-def build_sales_dashboard_html(summary: dict, narrative: str = "") -> str:
-    stats_html     = _build_stats_bar(summary)
+def build_sales_dashboard_html(
+    summary: dict,
+    narrative: str = "",
+    scope: str = "",
+    narrative_url: str = "",
+) -> str:
+    """
+    Full dashboard document. With narrative_url (and no narrative) the AI
+    section is a placeholder that a loader script fills from that URL.
+    """
+    stats_html     = _build_stats_bar(_stats_values(summary))
     chart1_js      = _build_customer_revenue_chart(summary["customer_stats"][:15])
     chart2_js      = _build_product_revenue_chart(summary["product_stats"][:10])
     chart3_js      = _build_category_chart(summary["category_stats"])
     narrative_html = _build_narrative_section(narrative) if narrative else ""
+    loader_js      = ""
+    if narrative_url and not narrative:
+        narrative_html = _build_narrative_placeholder()
+        loader_js      = _build_narrative_loader(narrative_url)
+    scope_html     = f" | {html.escape(scope)}" if scope else ""
+    company        = html.escape(_company_label(summary))
 
     return f"""<!DOCTYPE html>
 <html lang="en">
@@ -70,43 +104,16 @@ def build_sales_dashboard_html(summary: dict, narrative: str = "") -> str:
   <meta name="viewport" content="width=device-width, initial-scale=1.0">
   <title>D365 AI Sales &amp; Revenue Intelligence</title>
   <style>* {{ box-sizing: border-box; margin: 0; padding: 0; }}</style>
-  <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"></script>
+  <script src="{chartjs_src()}"></script>
 </head>
 <body style="{S['body']}">
 
   <h2 style="{S['h2']}">AI Sales &amp; Revenue Intelligence</h2>
-  <p style="{S['subtitle']}">Customer Sales Performance Analysis — USMF | Live data via D365 OData</p>
+  <p style="{S['subtitle']}">Customer Sales Performance Analysis — {company}{scope_html} | Live data via D365 OData</p>
 
   {stats_html}
 
-  <div style="{S['chart_section']}">
-    <div style="{S['chart_title']}">&#x1F4B0; Top 15 Customers by Revenue</div>
-    <div style="{S['tier_legend']}">
-      <div style="{S['tier_item']}"><span style="{S['tier_dot']}background:#7c3aed;"></span>&nbsp;Platinum ($10M+)</div>
-      <div style="{S['tier_item']}"><span style="{S['tier_dot']}background:#d97706;"></span>&nbsp;Gold ($5M-$10M)</div>
-      <div style="{S['tier_item']}"><span style="{S['tier_dot']}background:#6b7280;"></span>&nbsp;Silver ($1M-$5M)</div>
-      <div style="{S['tier_item']}"><span style="{S['tier_dot']}background:#92400e;"></span>&nbsp;Bronze (under $1M)</div>
-    </div>
-    <br>
-    <div style="{S['chart_cont']}">
-      <canvas id="customerChart"></canvas>
-    </div>
-  </div>
-
-  <div style="{S['charts_row']}">
-    <div style="{S['chart_section0']}">
-      <div style="{S['chart_title']}">&#x1F4E6; Top 10 Products by Revenue</div>
-      <div style="{S['chart_cont_md']}">
-        <canvas id="productChart"></canvas>
-      </div>
-    </div>
-    <div style="{S['chart_section0']}">
-      <div style="{S['chart_title']}">&#x1F5C2;&#xFE0F; Revenue by Category</div>
-      <div style="{S['chart_cont_md']}">
-        <canvas id="categoryChart"></canvas>
-      </div>
-    </div>
-  </div>
+  {_build_chart_sections()}
 
   <br>
   {narrative_html}
@@ -133,11 +140,47 @@ def build_sales_dashboard_html(summary: dict, narrative: str = "") -> str:
       setTimeout(initCharts, 200);
     }}
   </script>
+  {loader_js}
 
 </body>
 </html>"""
 
 
+# ── Chart Sections (canvases, shared by the full page and the shell) ─────────
+
+def _build_chart_sections() -> str:
+    return f"""
+  <div style="{S['chart_section']}">
+    <div style="{S['chart_title']}">&#x1F4B0; Top 15 Customers by Revenue</div>
+    <div style="{S['tier_legend']}">
+      <div style="{S['tier_item']}"><span style="{S['tier_dot']}background:#7c3aed;"></span>&nbsp;Platinum ($10M+)</div>
+      <div style="{S['tier_item']}"><span style="{S['tier_dot']}background:#d97706;"></span>&nbsp;Gold ($5M-$10M)</div>
+      <div style="{S['tier_item']}"><span style="{S['tier_dot']}background:#6b7280;"></span>&nbsp;Silver ($1M-$5M)</div>
+      <div style="{S['tier_item']}"><span style="{S['tier_dot']}background:#92400e;"></span>&nbsp;Bronze (under $1M)</div>
+    </div>
+    <br>
+    <div style="{S['chart_cont']}">
+      <canvas id="customerChart"></canvas>
+    </div>
+  </div>
+
+  <div style="{S['charts_row']}">
+    <div style="{S['chart_section0']}">
+      <div style="{S['chart_title']}">&#x1F4E6; Top 10 Products by Revenue</div>
+      <div style="{S['chart_cont_md']}">
+        <canvas id="productChart"></canvas>
+      </div>
+    </div>
+    <div style="{S['chart_section0']}">
+      <div style="{S['chart_title']}">&#x1F5C2;&#xFE0F; Revenue by Category</div>
+      <div style="{S['chart_cont_md']}">
+        <canvas id="categoryChart"></canvas>
+      </div>
+    </div>
+  </div>
+    """
+
+
 # ── Chart 1 — Customer Revenue ────────────────────────────────────────────────
 
 def _build_customer_revenue_chart(customer_stats: list) -> str:
@@ -240,11 +283,7 @@ def _build_category_chart(category_stats: dict) -> str:
 
     labels  = []
     values  = []
-    colours = [
-        "#7c3aed", "#3b82f6", "#22c55e", "#f97316",
-        "#ec4899", "#14b8a6", "#d97706", "#6b7280",
-        "#dc2626", "#0ea5e9"
-    ]
+    colours = CATEGORY_COLOURS
 
     for cat, data in sorted_cats:
         labels.append(f'"{_safe_label(cat)}"')
@@ -285,37 +324,46 @@ def _build_category_chart(category_stats: dict) -> str:
 
 # ── Stats Bar ─────────────────────────────────────────────────────────────────
 
-def _build_stats_bar(summary: dict) -> str:
+def _stats_values(summary: dict) -> dict:
+    """Formatted stats-bar values, shared by the HTML page and /dashboard/data."""
     total       = summary["grand_total"]
-    customers   = summary["total_customers"]
     orders      = summary["total_orders"]
-    top_cust    = summary["top_customer"]
-    top_product = summary["top_product"]
-
     top_stats   = summary["customer_stats"][0] if summary["customer_stats"] else {}
     top_rev     = top_stats.get("total_revenue", 0)
     top_pct     = top_stats.get("revenue_pct", 0)
 
+    return {
+        "total":        f"${total/1_000_000:.1f}M",
+        "counts":       f"{summary['total_customers']} customers | {orders} orders",
+        "top_customer": str(summary["top_customer"]),
+        "top_share":    f"${top_rev/1_000_000:.1f}M — {top_pct}% of total",
+        "top_product":  str(summary["top_product"])[:20],
+        "avg_order":    f"${total/orders/1000:.1f}K" if orders else "$0.0K",
+    }
+
+
+def _build_stats_bar(v: dict) -> str:
+    """Stats cards from _stats_values() output (ids let the shell fill them)."""
     return f"""
     <div style="{S['stats_bar']}">
       <div style="{S['stat_card']}">
         <p style="{S['stat_label']}">Total Revenue</p>
-        <p style="{S['stat_value']}">${total/1_000_000:.1f}M</p>
-        <p style="{S['stat_sub']}">{customers} customers | {orders} orders</p>
+        <p id="stat_total" style="{S['stat_value']}">{v['total']}</p>
+        <p id="stat_counts" style="{S['stat_sub']}">{v['counts']}</p>
       </div>
       <div style="{S['stat_card_gold']}">
         <p style="{S['stat_label']}">Top Customer</p>
-        <p style="{S['stat_value']}">{top_cust}</p>
-        <p style="{S['stat_sub']}">${top_rev/1_000_000:.1f}M — {top_pct}% of total</p>
+        <p id="stat_top_customer" style="{S['stat_value']}">{v['top_customer']}</p>
+        <p id="stat_top_share" style="{S['stat_sub']}">{v['top_share']}</p>
       </div>
       <div style="{S['stat_card_grn']}">
         <p style="{S['stat_label']}">Top Product</p>
-        <p style="{S['stat_value_sm']}">{top_product[:20]}</p>
+        <p id="stat_top_product" style="{S['stat_value_sm']}">{v['top_product']}</p>
         <p style="{S['stat_sub']}">by total revenue</p>
       </div>
       <div style="{S['stat_card_blu']}">
         <p style="{S['stat_label']}">Avg Order Value</p>
-        <p style="{S['stat_value']}">${total/orders/1000:.1f}K</p>
+        <p id="stat_avg_order" style="{S['stat_value']}">{v['avg_order']}</p>
         <p style="{S['stat_sub']}">across all customers</p>
       </div>
     </div>
@@ -324,6 +372,11 @@ def _build_stats_bar(summary: dict) -> str:
 
 # ── Narrative Section ─────────────────────────────────────────────────────────
 
+def build_narrative_html(narrative: str) -> str:
+    """Narrative block on its own — served by /dashboard/narrative for the loader."""
+    return _build_narrative_section(narrative)
+
+
 def _build_narrative_section(narrative: str) -> str:
     clean = re.sub(r"<think>.*?</think>", "", narrative, flags=re.DOTALL).strip()
     clean = clean.replace("\n", "<br>")
@@ -333,3 +386,223 @@ def _build_narrative_section(narrative: str) -> str:
       <p style="{S['narr_text']}">{clean}</p>
     </div>
     """
+
+
+def _build_narrative_placeholder() -> str:
+    return f"""
+    <div id="narrativeSection" style="{S['narrative']}">
+      <p style="{S['narr_title']}">&#x1F916; AI Sales Intelligence</p>
+      <p style="{S['narr_text']}">Generating AI narrative&hellip;</p>
+    </div>
+    """
+
+
+# Narrative long-poll, shared by the progressive page (_build_narrative_loader)
+# and the static shell (_SHELL_SCRIPT): fetch url until the narrative is
+# ready (or failed), then swap it into the placeholder.
+_LOAD_NARRATIVE_JS = """function loadNarrative(url, attempt) {
+        var box = document.getElementById('narrativeSection');
+        if (!box) { return; }
+        fetch(url).then(function (r) { return r.json(); }).then(function (d) {
+          if (d.status === 'ready' || d.status === 'failed') {
+            box.outerHTML = d.html;
+          } else if (attempt < 20) {
+            setTimeout(function () { loadNarrative(url, attempt + 1); }, 500);
+          }
+        }).catch(function () {
+          if (attempt < 20) { setTimeout(function () { loadNarrative(url, attempt + 1); }, 2000); }
+        });
+      }"""
+
+
+def _build_narrative_loader(url: str) -> str:
+    """
+    Starts loadNarrative on url. Absolute URL and no DOMContentLoaded
+    dependency, because the D365 control re-runs page scripts via new Function
+    inside the F&O page.
+    """
+    return f"""<script>
+    (function () {{
+      {_LOAD_NARRATIVE_JS}
+      loadNarrative("{_safe_label(url)}", 0);
+    }})();
+  </script>"""
+
+
+# ── Static Shell + Data Payload (/dashboard/app, /dashboard/data) ─────────────
+# The shell is the dashboard layout with empty cards and canvases; its script
+# fetches the compact JSON from build_dashboard_data() and draws the charts
+# client-side. The shell only depends on the data URL, so it is built once.
+
+_SHELL_SCRIPT = """<script>
+    (function () {
+      var DATA_URL = "__DATA_URL__";
+
+      function setText(id, value) {
+        var el = document.getElementById(id);
+        if (el) { el.textContent = value; }
+      }
+      function money(v) { return ' $' + v.toLocaleString('en-US'); }
+      function millions(v) { return '$' + (v / 1000000).toFixed(1) + 'M'; }
+
+      function hbar(id, series, label, colours) {
+        new Chart(document.getElementById(id), {
+          type: 'bar',
+          data: {
+            labels: series.labels,
+            datasets: [{ label: label, data: series.values, backgroundColor: colours, borderRadius: 4 }]
+          },
+          options: {
+            indexAxis: 'y',
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+              legend: { display: false },
+              tooltip: { callbacks: { label: function (ctx) { return money(ctx.parsed.x); } } }
+            },
+            scales: {
+              x: { ticks: { callback: millions }, grid: { color: '#f0f0f0' } },
+              y: { grid: { display: false } }
+            }
+          }
+        });
+      }
+
+      function doughnut(id, series) {
+        new Chart(document.getElementById(id), {
+          type: 'doughnut',
+          data: {
+            labels: series.labels,
+            datasets: [{ data: series.values, backgroundColor: series.colours, borderWidth: 2, borderColor: '#fff' }]
+          },
+          options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+              legend: { position: 'bottom', labels: { boxWidth: 10, font: { size: 10 } } },
+              tooltip: { callbacks: { label: function (ctx) { return money(ctx.parsed); } } }
+            }
+          }
+        });
+      }
+
+      __LOAD_NARRATIVE__
+
+      function render(d) {
+        if (typeof Chart === 'undefined' || !document.getElementById('customerChart')) {
+          setTimeout(function () { render(d); }, 100);
+          return;
+        }
+        setText('dashCompany', d.company);
+        setText('dashScope', d.scope ? ' | ' + d.scope : '');
+        for (var key in d.stats) { setText('stat_' + key, d.stats[key]); }
+        hbar('customerChart', d.customers, 'Total Revenue (USD)', d.customers.colours);
+        hbar('productChart', d.products, 'Revenue (USD)', '#3b82f6');
+        doughnut('categoryChart', d.categories);
+
+        var box = document.getElementById('narrativeSection');
+        if (d.narrative_html && box) {
+          box.outerHTML = d.narrative_html;
+        } else if (d.narrative_url) {
+          loadNarrative(d.narrative_url, 0);
+        } else if (box) {
+          box.style.display = 'none';
+        }
+      }
+
+      fetch(DATA_URL).then(function (r) {
+        return r.json().then(function (d) {
+          if (!r.ok) { throw new Error(d.detail || ('HTTP ' + r.status)); }
+          return d;
+        });
+      }).then(render).catch(function (e) {
+        setText('dashScope', ' | Error: ' + e.message);
+      });
+    })();
+  </script>"""
+
+
+_SHELL_SCRIPT = _SHELL_SCRIPT.replace("__LOAD_NARRATIVE__", _LOAD_NARRATIVE_JS)
+
+
+@lru_cache(maxsize=64)
+def build_dashboard_shell(data_url: str) -> str:
+    """Static dashboard document that renders from the JSON at data_url."""
+    placeholder = {
+        "total": "—", "counts": "loading…", "top_customer": "—",
+        "top_share": "", "top_product": "—", "avg_order": "—",
+    }
+    script = _SHELL_SCRIPT.replace("__DATA_URL__", _safe_label(data_url))
+
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>D365 AI Sales &amp; Revenue Intelligence</title>
+  <style>* {{ box-sizing: border-box; margin: 0; padding: 0; }}</style>
+  <script src="{chartjs_src()}"></script>
+</head>
+<body style="{S['body']}">
+
+  <h2 style="{S['h2']}">AI Sales &amp; Revenue Intelligence</h2>
+  <p style="{S['subtitle']}">Customer Sales Performance Analysis — <span id="dashCompany">&hellip;</span><span id="dashScope"></span> | Live data via D365 OData</p>
+
+  {_build_stats_bar(placeholder)}
+
+  {_build_chart_sections()}
+
+  <br>
+  {_build_narrative_placeholder()}
+
+  <p style="{S['footer']}">D365 AI Sales &amp; Revenue Intelligence &middot; OHMS Model &middot; Omar Hesham Shehab</p>
+
+  {script}
+
+</body>
+</html>"""
+
+
+def build_dashboard_data(
+    summary: dict,
+    narrative: str = "",
+    scope: str = "",
+    narrative_url: str = "",
+) -> dict:
+    """Compact chart series + stats + narrative for the shell."""
+    customers = summary["customer_stats"][:15]
+    products  = summary["product_stats"][:10]
+    cats      = sorted(summary["category_stats"].items(), key=lambda x: x[1]["revenue"], reverse=True)
+
+    return {
+        "company": _company_label(summary),
+        "scope": scope,
+        "stats": _stats_values(summary),
+        "customers": {
+            "labels":  [c["customer_account"] for c in customers],
+            "values":  [round(c["total_revenue"], 0) for c in customers],
+            "colours": [TIER_COLOURS[c["revenue_tier"]] for c in customers],
+        },
+        "products": {
+            "labels": [p["product_name"][:20] if p["product_name"] else p["item_number"] for p in products],
+            "values": [round(p["total_revenue"], 0) for p in products],
+        },
+        "categories": {
+            "labels":  [cat for cat, _ in cats],
+            "values":  [round(data["revenue"], 0) for _, data in cats],
+            "colours": CATEGORY_COLOURS[:len(cats)],
+        },
+        "narrative_html": _build_narrative_section(narrative) if narrative else "",
+        "narrative_url":  "" if narrative else narrative_url,
+    }
+
+
+def encode_dashboard_data(
+    summary: dict,
+    narrative: str = "",
+    scope: str = "",
+    narrative_url: str = "",
+) -> bytes:
+    """build_dashboard_data() as compact UTF-8 JSON (one picklable render stage)."""
+    data = build_dashboard_data(summary, narrative, scope, narrative_url)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
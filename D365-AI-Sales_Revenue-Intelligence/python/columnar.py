@@ -0,0 +1,227 @@
+"""
+columnar.py — D365 AI Sales & Revenue Intelligence
+NumPy columnar engine for summarise_sales_performance.
+
+Line dicts are turned into columns once, string keys are factorized into
+integer codes (first-seen order, so sort ties match the Python engine), and
+every aggregate is a single vectorised pass:
+    revenue / quantity sums   → np.bincount(codes, weights=...)
+    distinct counts           → sorted, deduplicated (key, other key) code pairs
+np.bincount adds weights in input order, so per-key sums are bit-identical to
+the Python loop's `+=`. The output dict is identical to odata._summarise_python.
+
+numpy is optional — available() is False when it isn't installed and the
+dispatcher in odata.py stays on the Python engine.
+"""
+
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:   # optional dependency
+    np = None
+
+from odata import _finalise_summary
+
+
+def available() -> bool:
+    return np is not None
+
+
+# ── Factorize ─────────────────────────────────────────────────────────────────
+
+def factorize(values) -> tuple:
+    """
+    Encode values as int codes numbered in first-appearance order.
+    Returns (codes, labels) with labels[codes] == values.
+
+    A dict pass beats np.unique on string arrays (no O(n log n) string sort)
+    and yields first-appearance numbering directly.
+    """
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(v, len(index)) for v in values),
+        dtype=np.int64,
+        count=len(values),
+    )
+    labels = np.empty(len(index), dtype=object)
+    labels[:] = list(index)
+    return codes, labels
+
+
+def _distinct_per(key_codes, other_codes, n_keys: int, n_other: int):
+    """Number of distinct `other` codes per key code, via unique code pairs."""
+    pairs = np.sort(key_codes.astype(np.int64) * max(n_other, 1) + other_codes)
+    if len(pairs):
+        # sort + adjacent-difference dedup (cheaper than np.unique's hash path)
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+    return np.bincount(pairs // max(n_other, 1), minlength=n_keys)
+
+
+# ── Columns ───────────────────────────────────────────────────────────────────
+
+def build_columns(records: list) -> dict:
+    """
+    One pass over the line dicts into NumPy columns.
+
+    Lines without a customer account only count towards grand_total,
+    total_orders and total_lines (same as the Python engine), so the keyed
+    columns hold the customer-bearing lines only.
+    """
+    amounts = [r["line_amount"] for r in records]
+    orders  = [r["sales_order_num"] for r in records]
+    keep    = [i for i, r in enumerate(records) if r["customer_account"]]
+    kept    = [records[i] for i in keep]
+
+    customer, customer_labels = factorize([r["customer_account"] for r in kept])
+    item,     item_labels     = factorize([r["item_number"] for r in kept])
+    category, category_labels = factorize([r["category"] or "Other" for r in kept])
+    order_all, order_labels   = factorize(orders)
+
+    # Product name is the first name seen for each item
+    product_names = {}
+    for r in kept:
+        product_names.setdefault(r["item_number"], r["product_name"])
+
+    return {
+        "customer":        customer,
+        "customer_labels": customer_labels,
+        "item":            item,
+        "item_labels":     item_labels,
+        "product_names":   list(product_names.values()),
+        "category":        category,
+        "category_labels": category_labels,
+        "order":           order_all[np.asarray(keep, dtype=np.int64)],
+        "order_all":       order_all,
+        "order_labels":    order_labels,
+        "n_orders":        len(order_labels),
+        "amount":          np.asarray([amounts[i] for i in keep], dtype=np.float64),
+        "quantity":        np.asarray([r["quantity"] for r in kept], dtype=np.float64),
+        # builtin sum() in input order — matches the Python engine exactly
+        "grand_total":     sum(amounts),
+        "total_lines":     len(records),
+    }
+
+
+# ── Aggregate ─────────────────────────────────────────────────────────────────
+
+def summarise_columns(cols: dict) -> dict:
+    """Vectorised aggregation of build_columns() output into the summary dict."""
+    n_cust  = len(cols["customer_labels"])
+    n_item  = len(cols["item_labels"])
+    n_cat   = len(cols["category_labels"])
+    n_order = cols["n_orders"]
+
+    cust, item, cat, order = cols["customer"], cols["item"], cols["category"], cols["order"]
+    amount, qty            = cols["amount"], cols["quantity"]
+
+    cust_rev  = np.bincount(cust, weights=amount, minlength=n_cust)
+    item_rev  = np.bincount(item, weights=amount, minlength=n_item)
+    item_qty  = np.bincount(item, weights=qty,    minlength=n_item)
+    cat_rev   = np.bincount(cat,  weights=amount, minlength=n_cat)
+    cat_qty   = np.bincount(cat,  weights=qty,    minlength=n_cat)
+
+    cust_orders   = _distinct_per(cust, order, n_cust, n_order)
+    cust_products = _distinct_per(cust, item,  n_cust, n_item)
+    cust_cats     = _distinct_per(cust, cat,   n_cust, n_cat)
+    item_custs    = _distinct_per(item, cust,  n_item, n_cust)
+    cat_orders    = _distinct_per(cat,  order, n_cat,  n_order)
+
+    return _finalise_summary(
+        customers=list(zip(
+            cols["customer_labels"].tolist(), cust_rev.tolist(), cust_orders.tolist(),
+            cust_products.tolist(), cust_cats.tolist(),
+        )),
+        products=list(zip(
+            cols["item_labels"].tolist(), cols["product_names"], item_rev.tolist(),
+            item_qty.tolist(), item_custs.tolist(),
+        )),
+        categories=list(zip(
+            cols["category_labels"].tolist(), cat_rev.tolist(), cat_qty.tolist(),
+            cat_orders.tolist(),
+        )),
+        grand_total=cols["grand_total"],
+        total_orders=n_order,
+        total_lines=cols["total_lines"],
+    )
+
+
+def summarise_sales_performance_np(records: list) -> dict:
+    """Drop-in NumPy replacement for odata._summarise_python."""
+    return summarise_columns(build_columns(records))
+
+
+# ── SummaryState ──────────────────────────────────────────────────────────────
+
+def _pair_counters(key_codes, other_codes, other_labels, n_keys: int) -> list:
+    """Per key code, a Counter of other label -> number of lines with that pair."""
+    n_other = max(len(other_labels), 1)
+    pairs, counts = np.unique(key_codes.astype(np.int64) * n_other + other_codes, return_counts=True)
+    keys   = pairs // n_other
+    others = other_labels[pairs % n_other].tolist()
+    counts = counts.tolist()
+    bounds = np.searchsorted(keys, np.arange(n_keys + 1)).tolist()
+    return [Counter(dict(zip(others[lo:hi], counts[lo:hi]))) for lo, hi in zip(bounds, bounds[1:])]
+
+
+def build_state_np(records: list):
+    """
+    summary_state.SummaryState for records, built from columns instead of a
+    per-line apply(). Keys keep first-seen order and np.bincount adds in input
+    order, so the state is identical to build_state's Python path.
+    """
+    from summary_state import SummaryState
+
+    cols = build_columns(records)
+    cust, item, cat, order = cols["customer"], cols["item"], cols["category"], cols["order"]
+    amount, qty            = cols["amount"], cols["quantity"]
+    cust_labels, item_labels, cat_labels = cols["customer_labels"], cols["item_labels"], cols["category_labels"]
+    n_cust, n_item, n_cat  = len(cust_labels), len(item_labels), len(cat_labels)
+
+    order_all, order_labels = cols["order_all"], cols["order_labels"]
+    currency, cur_labels    = factorize([r.get("currency") or "USD" for r in records])
+    amounts = np.asarray([r["line_amount"] for r in records], dtype=np.float64)
+
+    state = SummaryState()
+    state.orders      = Counter(dict(zip(order_labels.tolist(), np.bincount(order_all, minlength=len(order_labels)).tolist())))
+    state.grand_total = cols["grand_total"]
+    state.total_lines = cols["total_lines"]
+    state.currencies  = {
+        cur: [n, rev] for cur, n, rev in zip(
+            cur_labels.tolist(),
+            np.bincount(currency, minlength=len(cur_labels)).tolist(),
+            np.bincount(currency, weights=amounts, minlength=len(cur_labels)).tolist(),
+        )
+    }
+
+    cust_orders = _pair_counters(cust, order, order_labels, n_cust)
+    cust_items  = _pair_counters(cust, item, item_labels, n_cust)
+    cust_cats   = _pair_counters(cust, cat, cat_labels, n_cust)
+    state.customers = {
+        acct: [n, rev, ords, items, cats] for acct, n, rev, ords, items, cats in zip(
+            cust_labels.tolist(),
+            np.bincount(cust, minlength=n_cust).tolist(),
+            np.bincount(cust, weights=amount, minlength=n_cust).tolist(),
+            cust_orders, cust_items, cust_cats,
+        )
+    }
+    state.products = {
+        it: [n, pname, rev, q, custs] for it, n, pname, rev, q, custs in zip(
+            item_labels.tolist(),
+            np.bincount(item, minlength=n_item).tolist(),
+            cols["product_names"],
+            np.bincount(item, weights=amount, minlength=n_item).tolist(),
+            np.bincount(item, weights=qty, minlength=n_item).tolist(),
+            _pair_counters(item, cust, cust_labels, n_item),
+        )
+    }
+    state.categories = {
+        c: [n, rev, q, ords] for c, n, rev, q, ords in zip(
+            cat_labels.tolist(),
+            np.bincount(cat, minlength=n_cat).tolist(),
+            np.bincount(cat, weights=amount, minlength=n_cat).tolist(),
+            np.bincount(cat, weights=qty, minlength=n_cat).tolist(),
+            _pair_counters(cat, order, order_labels, n_cat),
+        )
+    }
+    return state
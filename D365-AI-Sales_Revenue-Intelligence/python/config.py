@@ -5,6 +5,9 @@ load_dotenv()
 
 ODATA_BASE_URL    = os.getenv("ODATA_BASE_URL")
 COMPANY           = os.getenv("COMPANY")
+# Legal entities served by the revenue pipeline (comma-separated, first = default view)
+COMPANIES         = [c.strip() for c in os.getenv("COMPANIES", COMPANY or "").split(",") if c.strip()]
+COMPANY_PARALLELISM = int(os.getenv("COMPANY_PARALLELISM", 2))
 
 AAD_TENANT_ID     = os.getenv("AAD_TENANT_ID")
 AAD_CLIENT_ID     = os.getenv("AAD_CLIENT_ID")
@@ -16,4 +19,117 @@ OLLAMA_URL        = os.getenv("OLLAMA_URL")
 OLLAMA_MODEL      = os.getenv("OLLAMA_MODEL")
 
 HOST              = os.getenv("HOST", "0.0.0.0")
-PORT              = int(os.getenv("PORT", 8000))
\ No newline at end of file
+PORT              = int(os.getenv("PORT", 8000))
+
+# ── Local line store (sales_store.py) ─────────────────────────────────────────
+
+SYNC_ENABLED          = os.getenv("SYNC_ENABLED", "true").lower() == "true"
+SYNC_DB_PATH          = os.getenv("SYNC_DB_PATH", "sales_lines.db")
+SYNC_WATERMARK_FIELD  = os.getenv("SYNC_WATERMARK_FIELD", "ModifiedDateTime")
+SYNC_RECONCILE_HOURS  = float(os.getenv("SYNC_RECONCILE_HOURS", 24))
+
+
+# ── Partitioned SalesOrderLines fetch ─────────────────────────────────────────
+
+FETCH_PARALLELISM     = int(os.getenv("FETCH_PARALLELISM", 1))
+FETCH_PARTITION_SIZE  = int(os.getenv("FETCH_PARTITION_SIZE", 5000))
+FETCH_MAX_INFLIGHT    = int(os.getenv("FETCH_MAX_INFLIGHT", 4))
+
+
+# ── Summary engine (odata.summarise_sales_performance) ────────────────────────
+
+SUMMARY_ENGINE          = os.getenv("SUMMARY_ENGINE", "auto")   # auto | python | numpy
+SUMMARY_NUMPY_MIN_LINES = int(os.getenv("SUMMARY_NUMPY_MIN_LINES", 50000))
+SUMMARY_POOL_MIN_LINES  = int(os.getenv("SUMMARY_POOL_MIN_LINES", 2_000_000))  # 0 disables
+SUMMARY_WORKERS         = int(os.getenv("SUMMARY_WORKERS", 0))                  # 0 = CPU count
+SUMMARY_CHUNK_LINES     = int(os.getenv("SUMMARY_CHUNK_LINES", 250_000))
+SUMMARY_START_METHOD    = os.getenv("SUMMARY_START_METHOD", "spawn")            # spawn | forkserver
+
+
+# ── Narrative cache (narrative_cache.py) ──────────────────────────────────────
+
+NARRATIVE_CACHE_ENABLED       = os.getenv("NARRATIVE_CACHE_ENABLED", "true").lower() == "true"
+NARRATIVE_CACHE_PATH          = os.getenv("NARRATIVE_CACHE_PATH", "narrative_cache.db")
+NARRATIVE_CACHE_MAX_ENTRIES   = int(os.getenv("NARRATIVE_CACHE_MAX_ENTRIES", 200))
+NARRATIVE_CACHE_MAX_AGE_HOURS = float(os.getenv("NARRATIVE_CACHE_MAX_AGE_HOURS", 24))
+
+
+# ── Progressive dashboard (narrative delivered after the charts) ──────────────
+
+DASHBOARD_PROGRESSIVE  = os.getenv("DASHBOARD_PROGRESSIVE", "true").lower() == "true"
+PUBLIC_BASE_URL        = os.getenv("PUBLIC_BASE_URL", f"http://localhost:{PORT}").rstrip("/")
+NARRATIVE_POLL_SECONDS = float(os.getenv("NARRATIVE_POLL_SECONDS", 25))
+
+
+# ── Static assets (static_assets.py) ──────────────────────────────────────────
+
+CHARTJS_PATH = os.getenv(
+    "CHARTJS_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "SalesRevenueIntelligence", "SalesIntelligenceChartJS.js",
+    ),
+)
+
+
+# ── Stage executor (work_pool.py) ─────────────────────────────────────────────
+
+WORK_EXECUTOR             = os.getenv("WORK_EXECUTOR", "thread").lower()   # thread | process
+WORK_WORKERS              = int(os.getenv("WORK_WORKERS", 4))
+WORK_TIMEOUT_SECONDS      = float(os.getenv("WORK_TIMEOUT_SECONDS", 120))
+WORK_SYNC_TIMEOUT_SECONDS = float(os.getenv("WORK_SYNC_TIMEOUT_SECONDS", 0))  # stages that may sync; 0 = none
+
+
+# ── Summary snapshot (summary_snapshot.py) ────────────────────────────────────
+
+SNAPSHOT_ENABLED       = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+SNAPSHOT_PATH          = os.getenv("SNAPSHOT_PATH", "summary_snapshot.bin")
+SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("SNAPSHOT_MAX_AGE_HOURS", 12))
+
+
+# ── Rankings (rankings.py) ────────────────────────────────────────────────────
+
+RANKINGS_MAX_LIMIT = int(os.getenv("RANKINGS_MAX_LIMIT", 500))   # largest page size
+
+
+# ── OData resilience (resilience.py) ──────────────────────────────────────────
+
+ODATA_TIMEOUT_MIN_SECONDS = float(os.getenv("ODATA_TIMEOUT_MIN_SECONDS", 15))
+ODATA_TIMEOUT_MAX_SECONDS = float(os.getenv("ODATA_TIMEOUT_MAX_SECONDS", 300))   # cold-AOS ceiling
+ODATA_TIMEOUT_MULTIPLIER  = float(os.getenv("ODATA_TIMEOUT_MULTIPLIER", 4))      # × p95 latency
+ODATA_LATENCY_MAX_AGE_SECONDS = float(os.getenv("ODATA_LATENCY_MAX_AGE_SECONDS", 600))   # older samples ignored
+ODATA_RETRIES             = int(os.getenv("ODATA_RETRIES", 2))
+ODATA_BACKOFF_SECONDS     = float(os.getenv("ODATA_BACKOFF_SECONDS", 1.0))
+ODATA_HEDGE               = os.getenv("ODATA_HEDGE", "false").lower() == "true"
+BREAKER_FAILURES          = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS     = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+
+# ── OData rate governor (rate_governor.py) ────────────────────────────────────
+
+ODATA_RATE_PER_SECOND           = float(os.getenv("ODATA_RATE_PER_SECOND", 10))     # sustained ceiling
+ODATA_RATE_MIN_PER_SECOND       = float(os.getenv("ODATA_RATE_MIN_PER_SECOND", 1))  # floor after 429s
+ODATA_BURST                     = int(os.getenv("ODATA_BURST", 20))
+ODATA_THROTTLE_MAX_WAIT_SECONDS = float(os.getenv("ODATA_THROTTLE_MAX_WAIT_SECONDS", 300))
+
+# ── Ollama backend pool (ollama_pool.py) ──────────────────────────────────────
+
+# Inference hosts (comma-separated); defaults to the single OLLAMA_URL
+OLLAMA_URLS                    = [u.strip() for u in os.getenv("OLLAMA_URLS", OLLAMA_URL or "").split(",") if u.strip()]
+OLLAMA_ROUTING                 = os.getenv("OLLAMA_ROUTING", "least_loaded").lower()   # or latency
+OLLAMA_EJECT_FAILURES          = int(os.getenv("OLLAMA_EJECT_FAILURES", 2))
+OLLAMA_READMIT_SECONDS         = float(os.getenv("OLLAMA_READMIT_SECONDS", 30))
+OLLAMA_HEALTH_INTERVAL_SECONDS = float(os.getenv("OLLAMA_HEALTH_INTERVAL_SECONDS", 15))   # 0 = off
+
+# ── Profiling (profiler.py) ───────────────────────────────────────────────────
+
+PROFILING_ENABLED   = os.getenv("PROFILING_ENABLED", "false").lower() == "true"   # off = zero cost
+PROFILE_DIR         = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", 60))
+
+# ── Request tracing (tracing.py) ──────────────────────────────────────────────
+
+TRACING_ENABLED   = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 200))           # recent traces kept for /debug/traces
+TRACE_FILE        = os.getenv("TRACE_FILE", "")                         # empty = ring buffer only; a path also writes JSONL
+TRACE_FILE_MAX_MB = float(os.getenv("TRACE_FILE_MAX_MB", 50))           # then rotated to <file>.1
@@ -0,0 +1,207 @@
+"""
+customer_index.py — D365 AI Sales & Revenue Intelligence
+Customer → orders / products / categories / months index for drill-downs.
+
+Built from the same revenue lines as the summary and maintained with the same
+apply / retract deltas as summary_state.SummaryState and sales_cube.SalesCube,
+so a /customers/{account} drill-down is a dict lookup plus work proportional
+to that one customer's orders and products — no OData call, no line rescan.
+
+    index.apply(lines) / index.retract(lines)
+    index.overview("US-001", top=10, recent=10)
+    index.orders("US-001", offset=0, limit=50)
+
+Lines without a customer account are not indexed (they are not in the
+customer ranking either).
+"""
+
+import heapq
+from collections import Counter
+
+from sales_cube import month_key
+
+
+def _decrement(counter: Counter, key) -> None:
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+def _day(value) -> str:
+    if not value:
+        return ""
+    return value.isoformat()[:10] if hasattr(value, "isoformat") else str(value)[:10]
+
+
+class CustomerIndex:
+    """
+    acct -> [lines, revenue, orders, products, categories, months] where
+        orders     : order -> [lines, revenue, quantity, Counter(requested day)]
+        products   : item  -> [lines, name, revenue, quantity]
+        categories : cat   -> [lines, revenue, quantity]
+        months     : month -> [lines, revenue, quantity]
+    """
+
+    def __init__(self):
+        self.customers = {}
+        self._orders   = {}   # acct -> orders sorted for orders(); dropped when the customer changes
+
+    def apply(self, lines: list) -> None:
+        for rec in lines:
+            acct = rec["customer_account"]
+            if not acct:
+                continue
+            self._orders.pop(acct, None)
+            amount = rec["line_amount"]
+            qty    = rec["quantity"]
+
+            c = self.customers.get(acct)
+            if c is None:
+                c = self.customers[acct] = [0, 0.0, {}, {}, {}, {}]
+            c[0] += 1
+            c[1] += amount
+
+            o = c[2].get(rec["sales_order_num"])
+            if o is None:
+                o = c[2][rec["sales_order_num"]] = [0, 0.0, 0.0, Counter()]
+            o[0] += 1
+            o[1] += amount
+            o[2] += qty
+            o[3][_day(rec.get("requested_date"))] += 1
+
+            p = c[3].get(rec["item_number"])
+            if p is None:
+                p = c[3][rec["item_number"]] = [0, rec["product_name"], 0.0, 0.0]
+            p[0] += 1
+            p[2] += amount
+            p[3] += qty
+
+            for bucket, key in ((c[4], rec["category"] or "Other"), (c[5], month_key(rec.get("requested_date")))):
+                b = bucket.get(key)
+                if b is None:
+                    b = bucket[key] = [0, 0.0, 0.0]
+                b[0] += 1
+                b[1] += amount
+                b[2] += qty
+
+    def retract(self, lines: list) -> None:
+        for rec in lines:
+            acct = rec["customer_account"]
+            if not acct:
+                continue
+            self._orders.pop(acct, None)
+            amount = rec["line_amount"]
+            qty    = rec["quantity"]
+
+            c = self.customers[acct]
+            c[0] -= 1
+            c[1] -= amount
+            if c[0] == 0:
+                del self.customers[acct]
+                continue
+
+            order = rec["sales_order_num"]
+            o = c[2][order]
+            o[0] -= 1
+            o[1] -= amount
+            o[2] -= qty
+            _decrement(o[3], _day(rec.get("requested_date")))
+            if o[0] == 0:
+                del c[2][order]
+
+            item = rec["item_number"]
+            p = c[3][item]
+            p[0] -= 1
+            p[2] -= amount
+            p[3] -= qty
+            if p[0] == 0:
+                del c[3][item]
+
+            for bucket, key in ((c[4], rec["category"] or "Other"), (c[5], month_key(rec.get("requested_date")))):
+                b = bucket[key]
+                b[0] -= 1
+                b[1] -= amount
+                b[2] -= qty
+                if b[0] == 0:
+                    del bucket[key]
+
+    # ── Query ─────────────────────────────────────────────────────────────────
+
+    def overview(self, acct: str, top: int = 10, recent: int = 10):
+        """Totals, top products, category mix, monthly trend and recent orders; None if unknown."""
+        c = self.customers.get(acct)
+        if c is None:
+            return None
+        lines, revenue, orders, products, categories, months = c
+
+        top_products = heapq.nlargest(top, products.items(), key=lambda kv: kv[1][2])
+        return {
+            "customer_account": acct,
+            "total_revenue":    round(revenue, 2),
+            "total_lines":      lines,
+            "total_orders":     len(orders),
+            "unique_products":  len(products),
+            "avg_order_value":  round(revenue / len(orders), 2) if orders else 0,
+            "top_products": [
+                {
+                    "item_number":    item,
+                    "product_name":   name,
+                    "total_revenue":  round(rev, 2),
+                    "total_quantity": round(qty, 2),
+                    "lines":          n,
+                }
+                for item, (n, name, rev, qty) in top_products
+            ],
+            "category_mix": [
+                {
+                    "category":    cat,
+                    "revenue":     round(rev, 2),
+                    "quantity":    round(qty, 2),
+                    "revenue_pct": round(rev / revenue * 100, 1) if revenue > 0 else 0,
+                }
+                for cat, (_, rev, qty) in sorted(categories.items(), key=lambda kv: -kv[1][1])
+            ],
+            "monthly_trend": [
+                {"month": month or "undated", "revenue": round(rev, 2), "quantity": round(qty, 2), "lines": n}
+                # undated ("") last
+                for month, (n, rev, qty) in sorted(months.items(), key=lambda kv: (not kv[0], kv[0]))
+            ],
+            "recent_orders": self.orders(acct, 0, recent)["items"],
+        }
+
+    def orders(self, acct: str, offset: int = 0, limit: int = 50):
+        """Orders newest first (by earliest requested date), one page; None if unknown."""
+        c = self.customers.get(acct)
+        if c is None:
+            return None
+        rows = self._orders.get(acct)
+        if rows is None:
+            # sorted once per change of this customer, not per page
+            rows = [
+                (min((d for d in days if d), default=""), order, n, rev, qty)
+                for order, (n, rev, qty, days) in c[2].items()
+            ]
+            rows.sort(key=lambda r: (r[0], r[1]), reverse=True)
+            self._orders[acct] = rows
+        return {
+            "customer_account": acct,
+            "offset": offset,
+            "limit":  limit,
+            "total":  len(rows),
+            "items": [
+                {
+                    "sales_order_num": order,
+                    "requested_date":  day or None,
+                    "lines":           n,
+                    "revenue":         round(rev, 2),
+                    "quantity":        round(qty, 2),
+                }
+                for day, order, n, rev, qty in rows[offset:offset + limit]
+            ],
+        }
+
+
+def build_index(lines: list) -> CustomerIndex:
+    index = CustomerIndex()
+    index.apply(lines)
+    return index
@@ -0,0 +1,104 @@
+"""
+http_cache.py — D365 AI Sales & Revenue Intelligence
+Conditional, compressed responses for the dashboard shell / data endpoints.
+
+  ETag           — strong, SHA-256 of the uncompressed body; the encoded
+                   representation gets a "-br" / "-gz" suffix inside the quotes
+  If-None-Match  — any listed tag with the same body hash answers 304
+  Encoding       — brotli when the client accepts it and the optional `brotli`
+                   package is installed, else gzip; small bodies are sent as is
+
+Compressed bodies are memoised per (ETag, encoding), so an unchanged summary
+is compressed once, not per request.
+"""
+
+import gzip
+import hashlib
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:   # optional: pip install brotli
+    brotli = None
+
+MIN_COMPRESS_BYTES = 512
+_MEMO_SIZE         = 64
+_memo              = OrderedDict()   # (hash, encoding) -> compressed bytes
+
+
+def body_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _matches(if_none_match: str, digest: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == digest or tag.rsplit("-", 1)[0] == digest:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: str):
+    """'br', 'gzip' or None for an Accept-Encoding header."""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.partition(";")
+        q = params.replace(" ", "")
+        if q.startswith("q=") and q[2:].replace(".", "").strip("0") == "":
+            continue   # q=0 — explicitly refused
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(digest: str, encoding: str, body: bytes) -> bytes:
+    key = (digest, encoding)
+    if key in _memo:
+        _memo.move_to_end(key)
+        return _memo[key]
+    data = brotli.compress(body) if encoding == "br" else gzip.compress(body, compresslevel=6)
+    _memo[key] = data
+    if len(_memo) > _MEMO_SIZE:
+        _memo.popitem(last=False)
+    return data
+
+
+def cached_response(
+    request: Request,
+    body: bytes,
+    media_type: str,
+    cache_control: str = "no-cache",
+) -> Response:
+    """
+    Response for body honouring If-None-Match (304) and Accept-Encoding.
+    no-cache lets clients keep the copy but revalidate on every load.
+    """
+    digest  = body_hash(body)
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+    encoding = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    suffix = {"br": "-br", "gzip": "-gz"}.get(encoding, "")
+    headers["ETag"] = f'"{digest}{suffix}"'
+
+    if _matches(request.headers.get("if-none-match", ""), digest):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        body = _compress(digest, encoding, body)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
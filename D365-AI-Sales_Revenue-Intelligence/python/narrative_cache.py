@@ -0,0 +1,125 @@
+"""
+narrative_cache.py — D365 AI Sales & Revenue Intelligence
+Persistent SQLite cache of Ollama sales narratives.
+
+The key is a SHA-256 of the model name plus the rendered build_sales_prompt()
+text. The prompt is a pure function of the fields it quotes (top 5 customers,
+top 5 products, totals, top customer / product) at the precision it prints
+them, so the key changes exactly when the narrative input changes — a refresh
+that only moves revenue by cents, or touches customers outside the top 5,
+still hits.
+
+Entries older than NARRATIVE_CACHE_MAX_AGE_HOURS are ignored and purged;
+beyond NARRATIVE_CACHE_MAX_ENTRIES the least recently used are evicted.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config import (
+    NARRATIVE_CACHE_PATH,
+    NARRATIVE_CACHE_MAX_ENTRIES,
+    NARRATIVE_CACHE_MAX_AGE_HOURS,
+)
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS narratives (
+    key        TEXT PRIMARY KEY,
+    model      TEXT,
+    narrative  TEXT,
+    created    REAL,
+    last_used  REAL
+);
+"""
+
+
+def fingerprint(prompt: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class NarrativeCache:
+    """Size- and age-bounded narrative store; see module docstring."""
+
+    def __init__(
+        self,
+        path: str = NARRATIVE_CACHE_PATH,
+        max_entries: int = NARRATIVE_CACHE_MAX_ENTRIES,
+        max_age_hours: float = NARRATIVE_CACHE_MAX_AGE_HOURS,
+    ):
+        self.path        = path
+        self.max_entries = max_entries
+        self.max_age_s   = max_age_hours * 3600
+        self.lock        = threading.Lock()
+        self.hits        = 0
+        self.misses      = 0
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            self.entries = db.execute("SELECT COUNT(*) FROM narratives").fetchone()[0]
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed."""
+        db = sqlite3.connect(self.path)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key: str):
+        """Cached narrative for key, or None if missing / expired."""
+        now = time.time()
+        with self.lock, self._connect() as db:
+            row = db.execute(
+                "SELECT narrative FROM narratives WHERE key = ? AND created >= ?",
+                (key, now - self.max_age_s),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE narratives SET last_used = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, model: str, narrative: str) -> None:
+        now = time.time()
+        with self.lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO narratives (key, model, narrative, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, narrative, now, now),
+            )
+            db.execute("DELETE FROM narratives WHERE created < ?", (now - self.max_age_s,))
+            db.execute(
+                "DELETE FROM narratives WHERE key NOT IN "
+                "(SELECT key FROM narratives ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            # recounted here, after the purge, so stats() never touches SQLite
+            self.entries = db.execute("SELECT COUNT(*) FROM narratives").fetchone()[0]
+
+    def stats(self) -> dict:
+        """In-memory counters; safe to call from the event loop."""
+        return {"entries": self.entries, "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+
+
+def get_cache() -> NarrativeCache:
+    """Shared NarrativeCache for the configured path (created on first use)."""
+    global _cache
+    if _cache is None:
+        _cache = NarrativeCache()
+    return _cache
+
+
+def stats():
+    """Shared cache counters, or None while it has not been opened (does not open it)."""
+    return _cache.stats() if _cache is not None else None
@@ -8,6 +8,9 @@ SQL ground truth validated: 58 customers, $110M+ revenue (USMF).
 
 import requests
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from config import (
     AAD_TENANT_ID,
@@ -17,52 +20,197 @@ from config import (
     LOGIN_URL,
     ODATA_BASE_URL,
     COMPANY,
+    FETCH_PARALLELISM,
+    FETCH_PARTITION_SIZE,
+    FETCH_MAX_INFLIGHT,
+    SUMMARY_ENGINE,
+    SUMMARY_NUMPY_MIN_LINES,
+    SUMMARY_POOL_MIN_LINES,
 )
+import resilience
+import tracing
 
 log = logging.getLogger(__name__)
 
 
 # ── Auth (exact Project 1 & 2 pattern) ───────────────────────────────────────
 
+_token      = {"value": None, "expires": 0.0}
+_token_lock = threading.Lock()
+_TOKEN_MARGIN = 120   # seconds before expiry at which a cached token is renewed
+
+
 def get_token() -> str:
-    """Acquire OAuth2 Bearer token — exact same pattern as Projects 1 & 2."""
-    token_url = f"{LOGIN_URL}{AAD_TENANT_ID}/oauth2/token"
-    data = {
-        "grant_type":    "client_credentials",
-        "client_id":     AAD_CLIENT_ID,
-        "client_secret": AAD_CLIENT_SECRET,
-        "resource":      AAD_RESOURCE,
-    }
-    try:
-        r = requests.post(token_url, data=data, timeout=30)
-        if r.status_code == 200:
-            log.info("Token acquired successfully")
-            return r.json().get("access_token")
-        log.error(f"Token error {r.status_code}: {r.text[:300]}")
-        return None
-    except Exception as e:
-        log.error(f"Token request failed: {e}")
-        return None
+    """
+    Acquire OAuth2 Bearer token — exact same pattern as Projects 1 & 2.
+    The token is reused until shortly before its expires_in; concurrent
+    callers wait for one request instead of each acquiring their own.
+    A 401 from OData drops it and retries once (_authorized_get).
+    """
+    with _token_lock:
+        if _token["value"] and time.time() < _token["expires"] - _TOKEN_MARGIN:
+            return _token["value"]
+
+        token_url = f"{LOGIN_URL}{AAD_TENANT_ID}/oauth2/token"
+        data = {
+            "grant_type":    "client_credentials",
+            "client_id":     AAD_CLIENT_ID,
+            "client_secret": AAD_CLIENT_SECRET,
+            "resource":      AAD_RESOURCE,
+        }
+        try:
+            r = requests.post(token_url, data=data, timeout=30)
+            if r.status_code == 200:
+                log.info("Token acquired successfully")
+                body = r.json()
+                _token["value"]   = body.get("access_token")
+                _token["expires"] = time.time() + float(body.get("expires_in", 3599))
+                return _token["value"]
+            log.error(f"Token error {r.status_code}: {r.text[:300]}")
+            return None
+        except Exception as e:
+            log.error(f"Token request failed: {e}")
+            return None
+
+
+def _renew_token(headers: dict) -> bool:
+    """
+    OData answered 401: drop the cached token if it is the one in headers
+    (revoked, or the AOS clock disagrees with expires_in), acquire a new one
+    and put it in headers. False if no token could be acquired.
+    """
+    used = headers.get("Authorization", "")[len("Bearer "):]
+    with _token_lock:
+        if _token["value"] == used:
+            _token["value"] = None
+    token = get_token()
+    if not token:
+        return False
+    headers["Authorization"] = f"Bearer {token}"
+    return True
 
 
 # ── Fetch ─────────────────────────────────────────────────────────────────────
 
-def fetch_sales_lines() -> list:
-    """
-    Fetch all sales order lines from SalesOrderLines for USMF.
+# Only the columns the summary, the month cube (sales_cube.py) and the currency
+# tagging of multi-company views read, plus the entity key and the two statuses
+# (kept so is_revenue_line can still verify whatever was not pushed down)
+LINE_FIELDS = (
+    "InventoryLotId,SalesOrderNumber,SalesOrderLineStatus,ItemNumber,LineDescription,"
+    "OrderedSalesQuantity,LineAmount,CurrencyCode,RequestedReceiptDate,SalesProductCategoryName"
+)
+HEADER_EXPAND = "SalesOrderHeader($select=OrderingCustomerAccountNumber,SalesOrderStatus)"
 
-    Returns list of dicts with:
-        sales_order_num  : str   — e.g. '000002'
-        customer_account : str   — e.g. 'US-007'
-        item_number      : str   — product/item ID
-        product_name     : str   — line description
-        quantity         : float — ordered quantity
-        unit_price       : float — sales price
-        line_amount      : float — total line value in USD
-        currency         : str   — currency code
-        requested_date   : date  — requested receipt date
-        line_status      : str   — Invoiced, Delivered, etc.
-        category         : str   — product category
+# Revenue predicates pushed into $filter, in the order they are given up when
+# the AOS rejects them (HTTP 400). Enums need the typed literal — a plain
+# string comparison is what returns "incompatible types".
+INVOICED = "Microsoft.Dynamics.DataEntities.SalesStatus'Invoiced'"
+# The last item of each entry lists the names a 400 body must mention for the
+# rejection to be blamed on that predicate (anything else is re-raised).
+PUSHDOWN_PREDICATES = [
+    ("header status", f"SalesOrderHeader/SalesOrderStatus eq {INVOICED}", ("SalesOrderStatus", "SalesStatus")),
+    ("line status",   f"SalesOrderLineStatus eq {INVOICED}",              ("SalesOrderLineStatus", "SalesStatus")),
+    ("line amount",   "LineAmount gt 0",                                  ("LineAmount",)),
+]
+PUSHDOWN_RETRY_SECONDS = 3600   # a reduced depth is re-tested at full depth after this
+
+# How many of PUSHDOWN_PREDICATES (from the end of the list) the AOS accepts,
+# and when that was learned. depth None until a fetch finds out; a reduced
+# depth is reused until PUSHDOWN_RETRY_SECONDS old, then full depth is tried again.
+_pushdown = {"depth": None, "at": 0.0}
+
+
+class ODataRequestError(RuntimeError):
+    """Non-200 response from OData; status_code lets callers pick a fallback."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Process-wide cap on concurrent OData page requests, shared by every caller
+# (partition workers, store syncs, /test-sales-data) so the AOS isn't flooded.
+_inflight = threading.BoundedSemaphore(max(1, FETCH_MAX_INFLIGHT))
+
+
+def _guarded_get(url: str, headers: dict, params: dict = None):
+    """send(timeout) for resilience.get: one GET under the in-flight cap."""
+    def send(timeout: float):
+        with _inflight:
+            return requests.get(url, headers=headers, params=params, verify=False, timeout=timeout)
+    return send
+
+
+def _authorized_get(kind: str, url: str, headers: dict, params: dict = None):
+    """resilience.get, retried once with a new token on a 401 (headers are updated in place)."""
+    r = resilience.get(kind, _guarded_get(url, headers, params))
+    if r.status_code == 401 and _renew_token(headers):
+        log.warning(f"OData {kind} answered 401 — retrying with a new token")
+        r = resilience.get(kind, _guarded_get(url, headers, params))
+    return r
+
+
+def _get_page(url: str, headers: dict, params: dict = None, kind: str = "SalesOrderLines") -> dict:
+    """
+    One guarded GET against OData (retries / breaker in resilience.py) —
+    raises ODataRequestError on non-200, CircuitOpenError while the AOS is down.
+    kind is the resilience latency key, one per request shape (see _fetch_records).
+    """
+    with tracing.span("odata.page", entity="SalesOrderLines", kind=kind) as span:
+        if params and "$skip" in params:
+            span.set(skip=params["$skip"])
+        r = _authorized_get(kind, url, headers, params)
+        span.set(status=r.status_code, bytes=len(r.content))
+        if r.status_code != 200:
+            raise ODataRequestError(r.status_code, f"OData failed: {r.status_code} — {r.text[:300]}")
+        page = r.json()
+        span.set(rows=len(page.get("value", [])))
+    return page
+
+
+def _follow_pages(url: str, headers: dict, params: dict, kind: str = "SalesOrderLines") -> list:
+    """GET url with params, then follow @odata.nextLink until exhausted."""
+    recs = []
+    page = _get_page(url, headers, params, kind)
+    while True:
+        recs.extend(page.get("value", []))
+        log.info(f"Fetched {len(recs)} records so far...")
+        next_link = page.get("@odata.nextLink")
+        if not next_link:
+            return recs
+        page = _get_page(next_link, headers, kind=kind)
+
+
+def fetch_sales_line_records(
+    extra_filter: str = "",
+    select: str = LINE_FIELDS,
+    parallelism: int = FETCH_PARALLELISM,
+    revenue_only: bool = True,
+    company: str = None,
+) -> list:
+    """
+    Fetch raw SalesOrderLines records (header expanded) for one company
+    (default COMPANY).
+
+    extra_filter is AND-ed onto the dataAreaId filter, e.g. a watermark
+    predicate from sales_store.py.
+
+    revenue_only pushes the Invoiced / LineAmount > 0 predicates into $filter.
+    Predicates the AOS rejects with HTTP 400 (whose body names them) are
+    dropped one at a time (header status first) and logged as client-side;
+    the reduced set is retried at full depth after PUSHDOWN_RETRY_SECONDS.
+    is_revenue_line() still applies every predicate after the fetch, so the
+    result is the same either way. The store's incremental sync
+    (sales_store.py) passes revenue_only=False, so lines that leave Invoiced
+    status reach it; its full reconcile uses the pushdown.
+
+    parallelism = 1 follows @odata.nextLink sequentially (original behaviour).
+    parallelism > 1 probes $count and the InventoryLotId at every
+    FETCH_PARTITION_SIZE-th row, then pulls the key ranges between those
+    bounds on a thread pool (keyset partitions: unlike $skip windows, a row
+    deleted or inserted during the fetch cannot shift other rows out of
+    their range). Ranges are merged in key order so the output is
+    deterministic; the shared in-flight semaphore still bounds AOS load.
     """
     token = get_token()
     if not token:
@@ -73,81 +221,216 @@ def fetch_sales_lines() -> list:
         "Accept":        "application/json",
         "OData-Version": "4.0",
     }
-    params = {
-        "$filter": f"dataAreaId eq '{COMPANY}'",
-        "$select": "SalesOrderNumber,SalesOrderLineStatus,ItemNumber,LineDescription,"
-                   "OrderedSalesQuantity,SalesPrice,LineAmount,CurrencyCode,"
-                   "RequestedReceiptDate,SalesProductCategoryName",
-        "$top":    10000,
-        "$expand": "SalesOrderHeader($select=OrderingCustomerAccountNumber,SalesOrderStatus)",
-    }
+    base_filter = f"dataAreaId eq '{company or COMPANY}'"
+    if extra_filter:
+        base_filter = f"{base_filter} and {extra_filter}"
+
+    if not revenue_only:
+        return _fetch_records(headers, base_filter, select, parallelism, bool(extra_filter))
+
+    full  = len(PUSHDOWN_PREDICATES)
+    depth = _pushdown["depth"]
+    if depth is None or (depth < full and time.time() - _pushdown["at"] > PUSHDOWN_RETRY_SECONDS):
+        depth = full
+    while True:
+        pushed      = PUSHDOWN_PREDICATES[full - depth:]
+        full_filter = " and ".join([base_filter] + [expr for _, expr, _ in pushed])
+        try:
+            recs = _fetch_records(headers, full_filter, select, parallelism, bool(extra_filter))
+        except ODataRequestError as e:
+            # step down only for a 400 that names the outermost pushed predicate;
+            # a bad extra_filter or $select, or an unrelated 400, is the caller's
+            if e.status_code != 400 or depth == 0 or not any(n in str(e) for n in pushed[0][2]):
+                raise
+            log.warning(f"AOS rejected pushed-down {pushed[0][0]} filter — keeping it client-side")
+            depth -= 1
+            continue
 
-    url        = f"{ODATA_BASE_URL}/SalesOrderLines"
-    all_recs   = []
-    first_call = True
-
-    while url:
-        r = requests.get(
-            url,
-            headers=headers,
-            params=params if first_call else None,
-            verify=False,
-            timeout=300,
-        )
-        first_call = False
+        if _pushdown["depth"] != depth:
+            client_side = [name for name, _, _ in PUSHDOWN_PREDICATES[:full - depth]]
+            log.info(
+                f"SalesOrderLines filter pushdown: server-side "
+                f"[{', '.join(name for name, _, _ in pushed) or 'none'}], "
+                f"client-side only [{', '.join(client_side) or 'none'}]"
+            )
+        _pushdown.update(depth=depth, at=time.time())
+        return recs
 
-        if r.status_code != 200:
-            raise RuntimeError(f"OData failed: {r.status_code} — {r.text[:300]}")
 
-        page = r.json()
-        all_recs.extend(page.get("value", []))
-        log.info(f"Fetched {len(all_recs)} records so far...")
-        url = page.get("@odata.nextLink")
+def _fetch_records(
+    headers: dict, full_filter: str, select: str, parallelism: int, incremental: bool = False,
+) -> list:
+    """
+    Sequential or partitioned fetch of SalesOrderLines for one $filter.
 
+    Pages are timed under separate resilience kinds — SalesOrderLines (full
+    sequential pages), SalesOrderLines/partition and SalesOrderLines/incremental
+    (small watermark reads) — so one p95 does not have to fit all three.
+    """
+    url  = f"{ODATA_BASE_URL}/SalesOrderLines"
+    kind = "SalesOrderLines/incremental" if incremental else "SalesOrderLines"
+
+    if parallelism <= 1:
+        params = {
+            "$filter": full_filter,
+            "$select": select,
+            "$top":    10000,
+            "$expand": HEADER_EXPAND,
+        }
+        all_recs = _follow_pages(url, headers, params, kind)
+        log.info(f"SalesOrderLines fetch complete: {len(all_recs)} records")
+        return all_recs
+
+    total = _count_lines(url, headers, full_filter)
+    size  = max(1, FETCH_PARTITION_SIZE)
+    bounds = _partition_bounds(url, headers, full_filter, total, size, parallelism)
+    windows = list(zip([None] + bounds, bounds + [None]))
+    log.info(
+        f"SalesOrderLines partitioned fetch: {total} records, "
+        f"{len(windows)} key ranges of ~{size}, parallelism {parallelism}"
+    )
+
+    if not incremental:
+        kind = "SalesOrderLines/partition"
+
+    def pull(window):
+        low, high = window
+        ranged = f"({full_filter})"
+        if low is not None:
+            ranged += f" and InventoryLotId ge {_quote(low)}"
+        if high is not None:
+            ranged += f" and InventoryLotId lt {_quote(high)}"
+        params = {
+            "$filter":  ranged,
+            "$select":  select,
+            "$orderby": "InventoryLotId",
+            "$top":     10000,
+            "$expand":  HEADER_EXPAND,
+        }
+        recs = _follow_pages(url, headers, params, kind)
+        log.info(f"Partition from {low or 'start'}: {len(recs)} records")
+        return recs
+
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(windows))) as pool:
+        parts = list(pool.map(tracing.bind(pull), windows))   # map() preserves partition order
+
+    # key ranges are disjoint and cover every key, so rows inserted or deleted
+    # during the fetch can neither repeat nor push other rows out of a window
+    all_recs = [rec for recs in parts for rec in recs]
     log.info(f"SalesOrderLines fetch complete: {len(all_recs)} records")
+    return all_recs
 
-    result = []
-    for rec in all_recs:
-        try:
-            date_raw = rec.get("RequestedReceiptDate", "")[:10]
-            req_date = datetime.fromisoformat(date_raw).date()
-            if req_date.year < 1990:
-                req_date = None
-        except (ValueError, TypeError):
+
+def _partition_bounds(url: str, headers: dict, full_filter: str, total: int, size: int, parallelism: int) -> list:
+    """
+    Sorted InventoryLotId keys splitting the filter's rows into ~size ranges:
+    the key at every size-th position ($skip probes of one row each). Rows
+    changing meanwhile only make a range a little larger or smaller.
+    """
+    def probe(skip):
+        params = {
+            "$filter":  full_filter,
+            "$select":  "InventoryLotId",
+            "$orderby": "InventoryLotId",
+            "$skip":    skip,
+            "$top":     1,
+        }
+        rows = _get_page(url, headers, params, kind="SalesOrderLines/bounds").get("value", [])
+        return rows[0].get("InventoryLotId") if rows else None
+
+    skips = list(range(size, total, size))
+    if not skips:
+        return []
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(skips))) as pool:
+        keys = list(pool.map(tracing.bind(probe), skips))
+    return sorted({k for k in keys if k is not None})
+
+
+def _quote(value: str) -> str:
+    """OData string literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _count_lines(url: str, headers: dict, full_filter: str) -> int:
+    """$count probe — number of lines matching the filter."""
+    with tracing.span("odata.count", entity="SalesOrderLines") as span:
+        r = _authorized_get(
+            "SalesOrderLines/$count", f"{url}/$count", {**headers, "Accept": "text/plain"}, {"$filter": full_filter},
+        )
+        span.set(status=r.status_code)
+        if r.status_code != 200:
+            raise ODataRequestError(r.status_code, f"OData $count failed: {r.status_code} — {r.text[:300]}")
+        total = int(r.text.strip().lstrip("\ufeff"))
+        span.set(rows=total)
+    return total
+
+
+def parse_line(rec: dict) -> dict:
+    """Normalise one raw SalesOrderLines record (any status) into a line dict."""
+    try:
+        date_raw = rec.get("RequestedReceiptDate", "")[:10]
+        req_date = datetime.fromisoformat(date_raw).date()
+        if req_date.year < 1990:
             req_date = None
+    except (ValueError, TypeError):
+        req_date = None
 
-       # Get customer and order status from expanded header
-        header        = rec.get("SalesOrderHeader") or {}
-        customer_acc  = header.get("OrderingCustomerAccountNumber", "")
-        header_status = header.get("SalesOrderStatus", "")
+    # Get customer and order status from expanded header
+    header = rec.get("SalesOrderHeader") or {}
 
-        # Skip non-invoiced lines
-        line_status = rec.get("SalesOrderLineStatus", "")
-        if line_status != "Invoiced":
-            continue
+    return {
+        "lot_id":           rec.get("InventoryLotId", ""),
+        "sales_order_num":  rec.get("SalesOrderNumber", ""),
+        "customer_account": header.get("OrderingCustomerAccountNumber", ""),
+        "item_number":      rec.get("ItemNumber", ""),
+        "product_name":     rec.get("LineDescription", ""),
+        "quantity":         float(rec.get("OrderedSalesQuantity", 0) or 0),
+        "line_amount":      float(rec.get("LineAmount", 0) or 0),
+        "currency":         rec.get("CurrencyCode", "USD"),
+        "requested_date":   req_date,
+        "line_status":      rec.get("SalesOrderLineStatus", ""),
+        "header_status":    header.get("SalesOrderStatus", ""),
+        "category":         rec.get("SalesProductCategoryName", ""),
+    }
 
-        # Skip lines where header is not fully invoiced (matches SQL SALESSTATUS = 3)
-        if header_status != "Invoiced":
-            continue
 
-        line_amount = float(rec.get("LineAmount", 0) or 0)
-        if line_amount <= 0:
-            continue
+def is_revenue_line(line: dict) -> bool:
+    """
+    True for lines that count as revenue (matches SQL SALESSTATUS = 3 on
+    both SALESTABLE and SALESLINE, positive amount only).
+    """
+    # Skip non-invoiced lines
+    if line["line_status"] != "Invoiced":
+        return False
+    # Skip lines where header is not fully invoiced
+    if line["header_status"] != "Invoiced":
+        return False
+    return line["line_amount"] > 0
 
-        result.append({
-            "sales_order_num":  rec.get("SalesOrderNumber", ""),
-            "customer_account": customer_acc,
-            "item_number":      rec.get("ItemNumber", ""),
-            "product_name":     rec.get("LineDescription", ""),
-            "quantity":         float(rec.get("OrderedSalesQuantity", 0) or 0),
-            "unit_price":       float(rec.get("SalesPrice", 0) or 0),
-            "line_amount":      line_amount,
-            "currency":         rec.get("CurrencyCode", "USD"),
-            "requested_date":   req_date,
-            "line_status":      rec.get("SalesOrderLineStatus", ""),
-            "category":         rec.get("SalesProductCategoryName", ""),
-        })
 
+def fetch_sales_lines(company: str = None) -> list:
+    """
+    Fetch all invoiced sales order lines from SalesOrderLines for one company
+    (default COMPANY, i.e. USMF).
+
+    Returns list of dicts with:
+        sales_order_num  : str   — e.g. '000002'
+        customer_account : str   — e.g. 'US-007'
+        item_number      : str   — product/item ID
+        product_name     : str   — line description
+        quantity         : float — ordered quantity
+        line_amount      : float — total line value in the order currency
+        currency         : str   — CurrencyCode of the line
+        requested_date   : date  — requested receipt date (cube month)
+        line_status      : str   — Invoiced, Delivered, etc.
+        category         : str   — product category
+    plus lot_id / header_status (used by the local store in sales_store.py).
+    """
+    result = []
+    for rec in fetch_sales_line_records(company=company):
+        line = parse_line(rec)
+        if is_revenue_line(line):
+            result.append(line)
     return result
 
 
@@ -170,11 +453,32 @@ def summarise_sales_performance(records: list) -> dict:
         total_lines       : int
         top_customer      : str
         top_product       : str
+
+    SUMMARY_ENGINE picks the implementation: "python" (dict/set loop),
+    "numpy" (columnar.py) or "auto" — numpy from SUMMARY_NUMPY_MIN_LINES
+    lines when numpy is installed. From SUMMARY_POOL_MIN_LINES lines the
+    work is map-reduced across worker processes instead (summary_pool.py).
+    All produce the same dict.
     """
+    if SUMMARY_POOL_MIN_LINES and len(records) >= SUMMARY_POOL_MIN_LINES:
+        import summary_pool
+        if summary_pool.worker_count() > 1:
+            return summary_pool.summarise_parallel(records)
+    if SUMMARY_ENGINE != "python":
+        import columnar
+        if columnar.available() and (
+            SUMMARY_ENGINE == "numpy" or len(records) >= SUMMARY_NUMPY_MIN_LINES
+        ):
+            return columnar.summarise_sales_performance_np(records)
+    return _summarise_python(records)
+
+
+def _summarise_python(records: list) -> dict:
+    """Single-pass dict/set aggregation — the reference implementation."""
     customer_map  = {}
     product_map   = {}
     category_map  = {}
-    order_map     = {}  # track unique orders per customer
+    all_orders    = set()
 
     for rec in records:
         acct     = rec["customer_account"]
@@ -185,17 +489,18 @@ def summarise_sales_performance(records: list) -> dict:
         qty      = rec["quantity"]
         pname    = rec["product_name"]
 
+        all_orders.add(order)
+
         if not acct:
             continue
 
         # ── Customer aggregation ──
         if acct not in customer_map:
             customer_map[acct] = {
-                "customer_account": acct,
-                "total_revenue":    0.0,
-                "unique_products":  set(),
+                "total_revenue":     0.0,
+                "unique_products":   set(),
                 "unique_categories": set(),
-                "orders":           set(),
+                "orders":            set(),
             }
         customer_map[acct]["total_revenue"]      += amount
         customer_map[acct]["unique_products"].add(item)
@@ -205,7 +510,6 @@ def summarise_sales_performance(records: list) -> dict:
         # ── Product aggregation ──
         if item not in product_map:
             product_map[item] = {
-                "item_number":    item,
                 "product_name":   pname,
                 "total_revenue":  0.0,
                 "total_quantity": 0.0,
@@ -222,13 +526,48 @@ def summarise_sales_performance(records: list) -> dict:
         category_map[cat]["quantity"] += qty
         category_map[cat]["orders"].add(order)
 
+    return _finalise_summary(
+        customers=[
+            (acct, d["total_revenue"], len(d["orders"]),
+             len(d["unique_products"]), len(d["unique_categories"]))
+            for acct, d in customer_map.items()
+        ],
+        products=[
+            (item, d["product_name"], d["total_revenue"],
+             d["total_quantity"], len(d["customers"]))
+            for item, d in product_map.items()
+        ],
+        categories=[
+            (cat, v["revenue"], v["quantity"], len(v["orders"]))
+            for cat, v in category_map.items()
+        ],
+        # builtin sum() kept (not +=) — it is compensated on Python 3.12+
+        grand_total=sum(r["line_amount"] for r in records),
+        total_orders=len(all_orders),
+        total_lines=len(records),
+    )
+
+
+def _finalise_summary(
+    customers: list,
+    products: list,
+    categories: list,
+    grand_total: float,
+    total_orders: int,
+    total_lines: int,
+) -> dict:
+    """
+    Build the summary dict from engine-neutral aggregates (first-seen order):
+        customers  : [ (account, revenue, orders, products, categories) ]
+        products   : [ (item, name, revenue, quantity, customers) ]
+        categories : [ (category, revenue, quantity, orders) ]
+    Tiering, percentages, rounding and sorting all happen here so every
+    summary engine returns exactly the same structure.
+    """
     # ── Build customer stats ──
-    grand_total   = sum(r["line_amount"] for r in records)
     customer_stats = []
 
-    for acct, data in customer_map.items():
-        total_rev  = data["total_revenue"]
-        num_orders = len(data["orders"])
+    for acct, total_rev, num_orders, num_products, num_cats in customers:
         avg_order  = total_rev / num_orders if num_orders > 0 else 0
         rev_pct    = (total_rev / grand_total * 100) if grand_total > 0 else 0
 
@@ -236,8 +575,8 @@ def summarise_sales_performance(records: list) -> dict:
             "customer_account":   acct,
             "total_revenue":      round(total_rev, 2),
             "total_orders":       num_orders,
-            "unique_products":    len(data["unique_products"]),
-            "unique_categories":  len(data["unique_categories"]),
+            "unique_products":    num_products,
+            "unique_categories":  num_cats,
             "avg_order_value":    round(avg_order, 2),
             "revenue_pct":        round(rev_pct, 1),
             "revenue_tier":       _revenue_tier(total_rev),
@@ -247,28 +586,26 @@ def summarise_sales_performance(records: list) -> dict:
 
     # ── Build product stats ──
     product_stats = []
-    for item, data in product_map.items():
+    for item, pname, revenue, quantity, num_customers in products:
         product_stats.append({
             "item_number":    item,
-            "product_name":   data["product_name"],
-            "total_revenue":  round(data["total_revenue"], 2),
-            "total_quantity": round(data["total_quantity"], 2),
-            "customer_count": len(data["customers"]),
+            "product_name":   pname,
+            "total_revenue":  round(revenue, 2),
+            "total_quantity": round(quantity, 2),
+            "customer_count": num_customers,
         })
     product_stats.sort(key=lambda x: x["total_revenue"], reverse=True)
 
     # ── Clean category stats ──
     clean_cats = {
         cat: {
-            "revenue":  round(v["revenue"], 2),
-            "quantity": round(v["quantity"], 2),
-            "orders":   len(v["orders"]),
+            "revenue":  round(revenue, 2),
+            "quantity": round(quantity, 2),
+            "orders":   num_orders,
         }
-        for cat, v in category_map.items()
+        for cat, revenue, quantity, num_orders in categories
     }
 
-    total_orders = len(set(r["sales_order_num"] for r in records))
-
     return {
         "customer_stats":  customer_stats,
         "product_stats":   product_stats,
@@ -276,7 +613,7 @@ def summarise_sales_performance(records: list) -> dict:
         "grand_total":     round(grand_total, 2),
         "total_customers": len(customer_stats),
         "total_orders":    total_orders,
-        "total_lines":     len(records),
+        "total_lines":     total_lines,
         "top_customer":    customer_stats[0]["customer_account"] if customer_stats else "N/A",
         "top_product":     product_stats[0]["product_name"] if product_stats else "N/A",
     }
@@ -0,0 +1,201 @@
+"""
+ollama_pool.py — D365 AI Sales & Revenue Intelligence
+Spreads Ollama calls over several inference hosts (OLLAMA_URLS).
+
+  r = await pool.post("/api/chat", payload, timeout=300.0)   # fails over between hosts
+  pool.start_health_checks()                                 # once, on the event loop
+  pool.stats()                                               # per-backend view for /health
+
+Routing picks the healthy backend with the lowest score:
+  least_loaded — in-flight requests, ties broken by latency
+  latency      — (in-flight + 1) × EWMA latency, i.e. the expected wait
+
+OLLAMA_EJECT_FAILURES consecutive failures (connection errors, timeouts, 5xx)
+eject a backend for OLLAMA_READMIT_SECONDS. At startup and then every
+OLLAMA_HEALTH_INTERVAL_SECONDS a GET /api/tags probes each host: a failed
+probe ejects it, a successful one re-admits it early. An ejected backend
+whose time is up also gets the next request as its trial. With every backend ejected, the one due back soonest is
+still tried, so a lone host behaves as before.
+
+Everything runs on the server's event loop, so the counters need no lock.
+"""
+
+import asyncio
+import logging
+import time
+
+import httpx
+
+import tracing
+
+from config import (
+    OLLAMA_URLS,
+    OLLAMA_ROUTING,
+    OLLAMA_EJECT_FAILURES,
+    OLLAMA_READMIT_SECONDS,
+    OLLAMA_HEALTH_INTERVAL_SECONDS,
+)
+
+log = logging.getLogger(__name__)
+
+EWMA_ALPHA    = 0.3
+PROBE_TIMEOUT = 5.0
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url       = url.rstrip("/")
+        self.inflight  = 0
+        self.failures  = 0          # consecutive
+        self.ejected_until = 0.0    # monotonic; 0 = in rotation
+        self.latency   = None       # EWMA seconds of successful calls
+        self.requests  = 0
+        self.errors    = 0
+        self.ejections = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def score(self) -> tuple:
+        latency = self.latency if self.latency is not None else 0.0
+        if OLLAMA_ROUTING == "latency":
+            return ((self.inflight + 1) * latency, self.inflight)
+        return (self.inflight, latency)
+
+    def succeeded(self, seconds: float = None) -> None:
+        if self.ejected_until:
+            log.info(f"Ollama backend {self.url} re-admitted")
+        self.failures = 0
+        self.ejected_until = 0.0
+        if seconds is not None:
+            self.latency = seconds if self.latency is None else (
+                EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+            )
+
+    def failed(self, reason: str) -> None:
+        self.errors   += 1
+        self.failures += 1
+        now = time.monotonic()
+        if now < self.ejected_until:
+            return   # a straggler sent before the ejection
+        if self.failures >= OLLAMA_EJECT_FAILURES or self.ejected_until:   # threshold, or a failed trial
+            self.ejected_until = now + OLLAMA_READMIT_SECONDS
+            self.ejections += 1
+            log.warning(
+                f"Ollama backend {self.url} ejected for {OLLAMA_READMIT_SECONDS:g}s "
+                f"after {self.failures} failures ({reason})"
+            )
+
+
+class OllamaPool:
+    def __init__(self, urls: list):
+        self.backends = [Backend(u) for u in urls]
+        self._health_task = None
+
+    def _order(self) -> list:
+        """Backends to try, best first: available by score, then ejected by return time."""
+        now   = time.monotonic()
+        ready = sorted((b for b in self.backends if b.available(now)), key=Backend.score)
+        out   = sorted((b for b in self.backends if not b.available(now)), key=lambda b: b.ejected_until)
+        return ready + out
+
+    async def post(self, path: str, payload: dict, timeout: float = 300.0) -> httpx.Response:
+        """
+        POST to the best backend, failing over to the next on connection
+        errors, timeouts and 5xx. Returns the first non-5xx response, else the
+        last 5xx; raises the last exception if no backend answered at all.
+        """
+        last_exc, last_r = None, None
+        for b in self._order():
+            b.inflight += 1
+            b.requests += 1
+            started = time.perf_counter()
+            try:
+                with tracing.span("ollama.backend", backend=b.url, inflight=b.inflight) as span:
+                    async with httpx.AsyncClient(timeout=timeout) as client:
+                        r = await client.post(f"{b.url}{path}", json=payload)
+                    span.set(status=r.status_code, bytes=len(r.content))
+            except Exception as e:
+                b.failed(str(e) or type(e).__name__)
+                log.warning(f"Ollama backend {b.url} failed: {e}")
+                last_exc = e
+                continue
+            finally:
+                b.inflight -= 1
+            if r.status_code >= 500:
+                b.failed(f"HTTP {r.status_code}")
+                last_r = r
+                continue
+            b.succeeded(time.perf_counter() - started if r.status_code == 200 else None)
+            return r
+        if last_r is not None:
+            return last_r
+        raise last_exc or RuntimeError("No Ollama backends configured (OLLAMA_URLS)")
+
+    async def each(self, path: str, payload: dict, timeout: float = 300.0) -> list:
+        """POST the same payload to every backend concurrently (warm-up); True per backend that answered 200."""
+        async def one(b):
+            try:
+                async with httpx.AsyncClient(timeout=timeout) as client:
+                    r = await client.post(f"{b.url}{path}", json=payload)
+            except Exception as e:
+                b.failed(str(e) or type(e).__name__)
+                log.warning(f"Ollama backend {b.url} warm-up failed: {e}")
+                return False
+            if r.status_code == 200:
+                b.succeeded()
+                return True
+            if r.status_code >= 500:
+                b.failed(f"HTTP {r.status_code}")
+            log.warning(f"Ollama backend {b.url} warm-up status: {r.status_code}")
+            return False
+        return list(await asyncio.gather(*(one(b) for b in self.backends)))
+
+    # ── Health checks ─────────────────────────────────────────────────────────
+
+    async def probe(self, b: Backend) -> bool:
+        try:
+            async with httpx.AsyncClient(timeout=PROBE_TIMEOUT) as client:
+                r = await client.get(f"{b.url}/api/tags")
+            ok = r.status_code == 200
+        except Exception:
+            ok = False
+        if ok:
+            b.succeeded()
+        elif b.available(time.monotonic()):
+            b.failures = max(b.failures, OLLAMA_EJECT_FAILURES - 1)   # a dead host goes out now
+            b.failed("health check")
+        return ok
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self.probe(b) for b in self.backends))
+            await asyncio.sleep(OLLAMA_HEALTH_INTERVAL_SECONDS)
+
+    def start_health_checks(self) -> None:
+        """Start the periodic probe task on the running loop (no-op if running or disabled)."""
+        if OLLAMA_HEALTH_INTERVAL_SECONDS <= 0 or (self._health_task and not self._health_task.done()):
+            return
+        self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "routing": OLLAMA_ROUTING,
+            "backends": [
+                {
+                    "url":        b.url,
+                    "healthy":    b.available(now) and not b.ejected_until,
+                    "in_flight":  b.inflight,
+                    "requests":   b.requests,
+                    "errors":     b.errors,
+                    "ejections":  b.ejections,
+                    "readmit_in_seconds": round(max(0.0, b.ejected_until - now), 1),
+                    "latency_ms": round(b.latency * 1000) if b.latency is not None else None,
+                }
+                for b in self.backends
+            ],
+        }
+
+
+pool = OllamaPool(OLLAMA_URLS)
@@ -0,0 +1,127 @@
+"""
+rankings.py — D365 AI Sales & Revenue Intelligence
+Paginated customer / product rankings over a summary dict.
+
+  query(summary, "products", sort="quantity", offset=20, limit=20)
+  query(summary, "customers", sort="revenue", tier="Gold")
+
+customer_stats / product_stats already arrive sorted by revenue, so revenue
+rankings are plain slices. Other sort keys use heap top-K selection
+(heapq.nsmallest over offset + limit rows) for the first pages; once a page
+reaches past HEAP_MAX_ROWS, a full sorted index for that (list, sort key) is
+built and kept with the summary, so deeper paging is a slice as well.
+Indexes live as long as the summary object: the pipelines hand out the same
+cached dict until the data changes, so each index is built once per summary.
+Ties keep the summary's own (revenue) order.
+"""
+
+import heapq
+import threading
+from collections import OrderedDict
+
+SORT_KEYS = {
+    "customers": {
+        "revenue":         "total_revenue",
+        "orders":          "total_orders",
+        "products":        "unique_products",
+        "avg_order_value": "avg_order_value",
+    },
+    "products": {
+        "revenue":        "total_revenue",
+        "quantity":       "total_quantity",
+        "customer_count": "customer_count",
+    },
+}
+TIERS = ("Platinum", "Gold", "Silver", "Bronze")
+
+HEAP_MAX_ROWS = 200   # offset + limit above which the sorted index is built
+_MAX_SUMMARIES = 8    # summaries whose indexes are kept
+
+_indexes = OrderedDict()   # id(summary) -> (summary, {(kind, sort, tier): rows})
+_lock    = threading.Lock()
+
+
+def _rows(summary: dict, kind: str, tier: str) -> list:
+    rows = summary["customer_stats" if kind == "customers" else "product_stats"]
+    if tier:
+        rows = [r for r in rows if r["revenue_tier"] == tier]
+    return rows
+
+
+def _index_for(summary: dict) -> dict:
+    """Per-summary index dict; the summary is held so its id stays unique."""
+    with _lock:
+        key = id(summary)
+        if key in _indexes and _indexes[key][0] is summary:
+            _indexes.move_to_end(key)
+            return _indexes[key][1]
+        _indexes[key] = (summary, {})
+        if len(_indexes) > _MAX_SUMMARIES:
+            _indexes.popitem(last=False)
+        return _indexes[key][1]
+
+
+def _check(kind: str, sort: str, tier: str) -> tuple:
+    """(stat field, canonical tier) or ValueError for unknown parameters."""
+    if kind not in SORT_KEYS:
+        raise ValueError(f"Unknown ranking '{kind}' — use customers or products")
+    field = SORT_KEYS[kind].get(sort)
+    if field is None:
+        raise ValueError(f"Unknown sort '{sort}' for {kind} — use {', '.join(SORT_KEYS[kind])}")
+    if not tier:
+        return field, None
+    if kind != "customers":
+        raise ValueError("Tier filters apply to customer rankings only")
+    match = [t for t in TIERS if t.lower() == tier.lower()]
+    if not match:
+        raise ValueError(f"Unknown tier '{tier}' — use {', '.join(TIERS)}")
+    return field, match[0]
+
+
+def query(
+    summary: dict,
+    kind: str,
+    sort: str = "revenue",
+    offset: int = 0,
+    limit: int = 25,
+    tier: str = None,
+) -> dict:
+    """One page of a ranking, with 1-based ranks and the total row count."""
+    field, tier = _check(kind, sort, tier)
+    end = offset + limit
+
+    if sort == "revenue":
+        if tier:
+            index  = _index_for(summary)
+            ranked = index.get((kind, sort, tier))
+            if ranked is None:
+                ranked = index[(kind, sort, tier)] = _rows(summary, kind, tier)
+        else:
+            ranked = _rows(summary, kind, None)   # already revenue-ordered
+        total = len(ranked)
+        page  = ranked[offset:end]
+    else:
+        index = _index_for(summary)
+        ranked = index.get((kind, sort, tier))
+        if ranked is None and end > HEAP_MAX_ROWS:
+            rows   = _rows(summary, kind, tier)
+            ranked = sorted(rows, key=lambda r: -r[field])   # stable: ties keep revenue order
+            index[(kind, sort, tier)] = ranked
+        if ranked is not None:
+            total = len(ranked)
+            page  = ranked[offset:end]
+        else:
+            rows  = _rows(summary, kind, tier)
+            total = len(rows)
+            top   = heapq.nsmallest(end, range(total), key=lambda i: (-rows[i][field], i))
+            page  = [rows[i] for i in top[offset:]]
+
+    return {
+        "ranking": kind,
+        "sort":    sort,
+        "tier":    tier,
+        "offset":  offset,
+        "limit":   limit,
+        "total":   total,
+        "items":   [dict(row, rank=offset + i + 1) for i, row in enumerate(page)],
+    }
@@ -0,0 +1,322 @@
+"""
+resilience.py — D365 AI Sales & Revenue Intelligence
+Resilient OData GETs: adaptive timeouts, jittered retries, hedging, breaker.
+
+  r = resilience.get("SalesOrderLines", lambda timeout: requests.get(..., timeout=timeout))
+
+  Adaptive timeout — per request kind, ODATA_TIMEOUT_MULTIPLIER × p95 of the
+                     last successful latencies, clamped to
+                     [ODATA_TIMEOUT_MIN_SECONDS, ODATA_TIMEOUT_MAX_SECONDS] and
+                     doubled on each retry. Samples expire after
+                     ODATA_LATENCY_MAX_AGE_SECONDS; until a kind has a few
+                     fresh samples the max is used, so a cold AOS (first call,
+                     or after an idle spell) still gets its wake-up time.
+  Retries          — idempotent GETs are retried ODATA_RETRIES times on
+                     timeouts, connection errors and 5xx, with full-jitter
+                     exponential backoff (ODATA_BACKOFF_SECONDS base).
+  Throttling       — every attempt first takes a token from the shared
+                     rate_governor. A 429 pauses the governor for its
+                     Retry-After and the request is re-queued without using
+                     a retry, up to ODATA_THROTTLE_MAX_WAIT_SECONDS in total.
+  Hedging          — ODATA_HEDGE=true sends a second identical GET when the
+                     first has not answered after the kind's p95 latency and
+                     uses whichever response arrives first.
+  Circuit breaker  — BREAKER_FAILURES consecutive transport failures / 5xx open
+                     the circuit: calls fail fast with CircuitOpenError for
+                     BREAKER_RESET_SECONDS, then one trial call (half-open)
+                     closes it again or re-opens it. A 429 on the trial
+                     hands the trial to the next attempt.
+
+Retries, Retry-After waits, governor waits and hedging are noted as
+attributes on the caller's trace span (tracing.py).
+
+Callers can treat AOSUnavailableError (and its CircuitOpenError subclass) as
+"AOS down", distinct from an empty result. 4xx responses mean the AOS is up:
+they close the breaker and are returned to the caller unchanged (e.g. the 400
+that drives filter-pushdown fallback).
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from rate_governor import governor, retry_after_seconds
+import tracing
+from config import (
+    ODATA_TIMEOUT_MIN_SECONDS,
+    ODATA_TIMEOUT_MAX_SECONDS,
+    ODATA_TIMEOUT_MULTIPLIER,
+    ODATA_LATENCY_MAX_AGE_SECONDS,
+    ODATA_RETRIES,
+    ODATA_BACKOFF_SECONDS,
+    ODATA_HEDGE,
+    ODATA_THROTTLE_MAX_WAIT_SECONDS,
+    BREAKER_FAILURES,
+    BREAKER_RESET_SECONDS,
+)
+
+log = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 50   # successful latencies kept per kind
+MIN_SAMPLES    = 5    # before this many, timeouts stay at the max
+BACKOFF_MAX    = 30.0
+HEDGE_MIN_SECONDS = 1.0
+
+
+class AOSUnavailableError(RuntimeError):
+    """The AOS could not be reached: retries exhausted, or the circuit is open."""
+
+    def __init__(self, message: str, retry_in: float = 0.0):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+class CircuitOpenError(AOSUnavailableError):
+    """The AOS circuit is open; the call was not attempted."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"D365 AOS unavailable — circuit open, retry in {retry_in:.0f}s", retry_in)
+
+
+# ── Latency tracking ──────────────────────────────────────────────────────────
+
+_latencies = {}   # kind -> deque of (recorded at, seconds)
+_counters  = {"calls": 0, "retries": 0, "timeouts": 0, "hedged": 0, "hedge_wins": 0}
+_lock      = threading.Lock()
+
+
+def _record_latency(kind: str, seconds: float) -> None:
+    with _lock:
+        _latencies.setdefault(kind, deque(maxlen=LATENCY_WINDOW)).append((time.time(), seconds))
+
+
+def _quantile(kind: str, q: float):
+    # samples older than ODATA_LATENCY_MAX_AGE_SECONDS are ignored: after an
+    # idle spell the AOS may be asleep again, so the timeout goes back to the max
+    cutoff = time.time() - ODATA_LATENCY_MAX_AGE_SECONDS
+    with _lock:
+        samples = sorted(sec for at, sec in _latencies.get(kind, ()) if at >= cutoff)
+    if len(samples) < MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def adaptive_timeout(kind: str, attempt: int = 0) -> float:
+    p95 = _quantile(kind, 0.95)
+    if p95 is None:
+        return ODATA_TIMEOUT_MAX_SECONDS
+    base = max(ODATA_TIMEOUT_MIN_SECONDS, p95 * ODATA_TIMEOUT_MULTIPLIER)
+    return min(ODATA_TIMEOUT_MAX_SECONDS, base * 2 ** attempt)
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+
+
+# ── Circuit breaker ───────────────────────────────────────────────────────────
+
+class CircuitBreaker:
+    """closed → open after N consecutive failures → half-open trial → closed / open."""
+
+    def __init__(self, failures: int, reset_seconds: float):
+        self.threshold     = max(1, failures)
+        self.reset_seconds = reset_seconds
+        self.state     = "closed"
+        self.failures  = 0
+        self.opened_at = 0.0
+        self.trial_at  = 0.0
+        self.opens     = 0
+        self._lock     = threading.Lock()
+
+    def before(self) -> None:
+        """Raise CircuitOpenError unless a call may go out now."""
+        with self._lock:
+            now = time.time()
+            if self.state == "open":
+                retry_in = self.opened_at + self.reset_seconds - now
+                if retry_in > 0:
+                    raise CircuitOpenError(retry_in)
+                self.state    = "half_open"
+                self.trial_at = now
+                log.info("AOS circuit half-open — sending a trial request")
+            elif self.state == "half_open":
+                # one trial at a time; a trial that never reported back expires
+                if now - self.trial_at < ODATA_TIMEOUT_MAX_SECONDS:
+                    raise CircuitOpenError(self.reset_seconds)
+                self.trial_at = now
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                log.info("AOS circuit closed — AOS is answering again")
+            self.state    = "closed"
+            self.failures = 0
+
+    def release(self) -> None:
+        """A trial answered 429: the AOS is up but busy — the next attempt is the new trial."""
+        with self._lock:
+            if self.state == "half_open":
+                self.trial_at = 0.0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                self.state     = "open"
+                self.opened_at = time.time()
+                self.opens    += 1
+                log.warning(
+                    f"AOS circuit open after {self.failures} consecutive failures — "
+                    f"failing fast for {self.reset_seconds:g}s"
+                )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = max(0.0, self.opened_at + self.reset_seconds - time.time())
+            return {
+                "state":                self.state,
+                "consecutive_failures": self.failures,
+                "opens":                self.opens,
+                "retry_in_seconds":     round(retry_in, 1) if self.state == "open" else 0,
+            }
+
+
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+
+_hedge_pool = None
+_hedge_lock = threading.Lock()
+
+
+def _hedged(kind: str, send, timeout: float):
+    """send(timeout), plus a second copy if the first is slower than p95; returns send's result."""
+    global _hedge_pool
+    delay = _quantile(kind, 0.95)
+    if delay is None or max(delay, HEDGE_MIN_SECONDS) >= timeout:
+        return send(timeout)
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+    first = _hedge_pool.submit(tracing.bind(send), timeout)
+    done, _ = wait([first], timeout=max(delay, HEDGE_MIN_SECONDS))
+    if done:
+        return first.result()
+
+    _count("hedged")
+    tracing.annotate(hedged=True)
+    second = _hedge_pool.submit(tracing.bind(send), timeout)
+    done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+    winner = next(iter(done))
+    other  = second if winner is first else first
+    try:
+        result = winner.result()
+    except requests.RequestException:
+        winner, result = other, other.result()   # the slower copy may still succeed
+    if winner is second:
+        _count("hedge_wins")
+    return result
+
+
+# ── Public API ────────────────────────────────────────────────────────────────
+
+def get(kind: str, send, idempotent: bool = True) -> requests.Response:
+    """
+    Run send(timeout) -> requests.Response under the resilience policy.
+    Returns the final response (the caller checks its status — a 429 is only
+    returned once ODATA_THROTTLE_MAX_WAIT_SECONDS of Retry-After waits are
+    spent); raises CircuitOpenError, or AOSUnavailableError once retries are
+    spent on timeouts / connection errors.
+    """
+    attempts = 1 + (max(0, ODATA_RETRIES) if idempotent else 0)
+    paced    = _paced(send)
+    last     = None
+    attempt  = 0
+    throttled_for = 0.0
+    _count("calls")
+    while attempt < attempts:
+        breaker.before()
+        timeout = adaptive_timeout(kind, attempt)
+        try:
+            r, elapsed = _hedged(kind, paced, timeout) if (ODATA_HEDGE and idempotent) else paced(timeout)
+        except requests.Timeout as e:
+            _count("timeouts")
+            breaker.failure()
+            last = e
+            log.warning(f"OData {kind} timed out after {timeout:.0f}s (attempt {attempt + 1}/{attempts})")
+        except requests.RequestException as e:
+            breaker.failure()
+            last = e
+            log.warning(f"OData {kind} failed: {e} (attempt {attempt + 1}/{attempts})")
+        else:
+            if r.status_code == 429:
+                # service protection: wait as told and try again without using
+                # up a retry, until ODATA_THROTTLE_MAX_WAIT_SECONDS in total
+                pause = retry_after_seconds(r.headers.get("Retry-After"), ODATA_BACKOFF_SECONDS * 2 ** attempt)
+                if throttled_for + pause > ODATA_THROTTLE_MAX_WAIT_SECONDS:
+                    log.warning(f"OData {kind} still throttled after {throttled_for:.0f}s of Retry-After waits")
+                    return r
+                throttled_for += pause
+                breaker.release()
+                governor.throttled(pause)
+                tracing.annotate(throttled_s=round(throttled_for, 1))
+                continue
+            if r.status_code < 500:
+                breaker.success()
+                governor.success()
+                if r.status_code == 200:
+                    _record_latency(kind, elapsed)
+                return r
+            breaker.failure()
+            last = r
+            log.warning(f"OData {kind} returned {r.status_code} (attempt {attempt + 1}/{attempts})")
+
+        attempt += 1
+        if attempt < attempts:
+            _count("retries")
+            tracing.annotate(attempts=attempt + 1)
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, ODATA_BACKOFF_SECONDS * 2 ** (attempt - 1))))
+
+    if isinstance(last, requests.Response):
+        return last
+    raise AOSUnavailableError(f"D365 AOS unavailable — {kind} failed after {attempts} attempts: {last}") from last
+
+
+def _paced(send):
+    """send, after taking a token from the process-wide rate governor; returns (response, seconds sending)."""
+    def paced(timeout: float):
+        started = time.perf_counter()
+        governor.acquire()
+        waited = time.perf_counter() - started
+        if waited > 0.001:
+            tracing.annotate(governor_wait_ms=round(waited * 1000, 1))
+        sent = time.perf_counter()   # latency samples exclude the pacing wait
+        r = send(timeout)
+        return r, time.perf_counter() - sent
+    return paced
+
+
+def stats() -> dict:
+    """Breaker state, counters and current adaptive timeout per kind for /health."""
+    with _lock:
+        counters = dict(_counters)
+        kinds    = list(_latencies)
+    return {
+        "breaker": breaker.snapshot(),
+        "governor": governor.stats(),
+        **counters,
+        "hedging": ODATA_HEDGE,
+        "timeouts_by_kind": {
+            kind: {
+                "p50_ms":      round((_quantile(kind, 0.5) or 0) * 1000),
+                "p95_ms":      round((_quantile(kind, 0.95) or 0) * 1000),
+                "timeout_s":   round(adaptive_timeout(kind), 1),
+            }
+            for kind in kinds
+        },
+    }
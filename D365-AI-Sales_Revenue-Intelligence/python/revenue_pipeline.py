@@ -0,0 +1,414 @@
+"""
+revenue_pipeline.py — D365 AI Sales & Revenue Intelligence
+Keeps the revenue summary current between requests.
+
+With the local store enabled (SYNC_ENABLED) the pipeline holds a
+SummaryState built once from the store, then each refresh applies only the
+sync delta: retract the old versions of changed lines, apply the new ones.
+A full reconcile rebuilds the state. Without the store every refresh falls
+back to a full OData fetch + summarise_sales_performance (original flow).
+
+A month × customer × item × category SalesCube is maintained from the same
+deltas; filtered (date range / customer / category) views are rolled up from
+its cells instead of rescanning lines. Once a pipeline is warm they use the
+cube as it stands and leave the sync to a background refresh, so a filtered
+view costs the rollup, not an OData round trip. A CustomerIndex (customer_index.py),
+also fed by the deltas, answers per-customer drill-downs.
+
+Every legal entity in COMPANIES has its own CompanyPipeline (store, state,
+cube, cached summary). Companies refresh concurrently, at most
+COMPANY_PARALLELISM at a time. company="ALL" merges the company states —
+customers and orders namespaced "COMPANY/…" — into a consolidated summary
+tagged with each company's totals and revenue by currency. Amounts are not
+FX-converted: the consolidated grand total adds raw line amounts.
+
+After a restart the server loads the on-disk summary snapshot and runs
+warm_up() as background startup tasks; until a pipeline is warm, unfiltered
+views are answered from a fresh-enough snapshot (summary_snapshot.py).
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SYNC_ENABLED, COMPANY, COMPANIES, COMPANY_PARALLELISM
+from odata import fetch_sales_lines, summarise_sales_performance
+from sales_cube import build_cube, parse_month
+from customer_index import build_index
+from sales_store import get_store, sync_with_delta
+from summary_state import SummaryState, build_state
+from resilience import AOSUnavailableError
+import summary_snapshot
+import tracing
+
+log = logging.getLogger(__name__)
+
+ALL = "ALL"   # company value selecting the consolidated view
+BACKGROUND_REFRESH_SECONDS = 30   # filtered views refresh in the background at most this often
+
+
+class InvalidViewError(ValueError):
+    """A view argument the caller got wrong (unknown company, malformed month) — HTTP 400."""
+
+
+# ── Per-company pipeline ──────────────────────────────────────────────────────
+
+class CompanyPipeline:
+    """Summary state + cube for one legal entity, fed by its own store."""
+
+    def __init__(self, company: str):
+        self.company = company
+        self.state   = None
+        self.cube    = None
+        self.index   = None                # customer drill-down index (customer_index.py)
+        self.version = 0                   # bumped whenever the state changes
+        self.changed_at = 0.0              # time.time() of the last version bump (summary "as_of")
+        self.refreshed_at = 0.0            # time.time() of the last finished refresh
+        self.lock      = threading.Lock()  # guards state / cube / index; held only while they change
+        self.sync_lock = threading.Lock()  # one refresh at a time; the OData sync runs under this only
+        self._summary         = None
+        self._summary_version = -1
+
+    def refresh(self, full: bool = False) -> dict:
+        """
+        Sync the store and fold the delta into the state; returns sync stats.
+        Readers only wait for the in-memory update, not for the OData sync.
+        An incremental refresh that finds one already running does not queue
+        behind it: a warm pipeline is served as is, and a cold one waits and
+        then uses the refresh that finished meanwhile. A sync keeps running
+        after its stage times out (work_pool.py), so queued refreshes would
+        otherwise hold every stage worker.
+        """
+        if not full and self.state is not None and self.sync_lock.locked():
+            return {"mode": "skipped", "reason": "refresh already running"}
+        seen = self.refreshed_at
+        with self.sync_lock:
+            if not full and self.state is not None and self.refreshed_at != seen:
+                return {"mode": "skipped", "reason": "refreshed while waiting"}
+            stats = self._refresh_synced(full)
+            self.refreshed_at = time.time()
+            return stats
+
+    def _refresh_synced(self, full: bool) -> dict:
+        started = time.perf_counter()
+        store   = get_store(self.company)
+        stats, delta = sync_with_delta(store, full)
+
+        if self.state is None or delta is None:
+            lines = store.revenue_lines()
+            state, cube, index = build_state(lines), build_cube(lines), build_index(lines)
+            with self.lock:
+                self.state, self.cube, self.index = state, cube, index
+                self.version += 1
+                self.changed_at = time.time()
+            how = f"rebuilt from {state.total_lines} lines ({cube.cell_count()} cube cells)"
+        elif _by_lot(delta["removed"]) == _by_lot(delta["added"]):
+            # the watermark boundary rows are re-fetched every time; unchanged
+            # re-reads must not invalidate the cached summaries
+            how = "no changes"
+        else:
+            with self.lock:
+                self.state.retract(delta["removed"])
+                self.state.apply(delta["added"])
+                self.cube.retract(delta["removed"])
+                self.cube.apply(delta["added"])
+                self.index.retract(delta["removed"])
+                self.index.apply(delta["added"])
+                self.version += 1
+                self.changed_at = time.time()
+            how = f"-{len(delta['removed'])} / +{len(delta['added'])} lines"
+
+        log.info(
+            f"Summary state refresh {self.company} ({stats['mode']} sync): {how} "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return stats
+
+    def summary(self) -> dict:
+        """Unfiltered summary, re-rendered only when the state changed. Caller holds lock."""
+        if self._summary_version != self.version:
+            self._summary = self.state.to_summary()
+            self._summary["company"] = self.company
+            self._summary["as_of"]   = self.changed_at
+            self._summary_version = self.version
+        return self._summary
+
+
+def _by_lot(lines: list) -> list:
+    return sorted(lines, key=lambda l: l["lot_id"])
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+_consolidated = {"versions": None, "summary": None}
+_warming = threading.Lock()   # held while a background warm-up runs
+_direct_indexes = {}           # SYNC_ENABLED=false: company -> index from the last fetch
+
+
+def _pipeline(company: str) -> CompanyPipeline:
+    with _pipelines_lock:
+        if company not in _pipelines:
+            _pipelines[company] = CompanyPipeline(company)
+        return _pipelines[company]
+
+
+def _companies(company: str = None) -> list:
+    """Companies behind a view: one entity, or all of COMPANIES for "ALL"."""
+    if not company:
+        return [COMPANIES[0] if COMPANIES else COMPANY]
+    if company.upper() == ALL:
+        return list(COMPANIES) or [COMPANY]
+    match = [c for c in COMPANIES if c.lower() == company.lower()]
+    if not match:
+        raise InvalidViewError(
+            f"Unknown company '{company}' — configured: {', '.join(COMPANIES)} (or {ALL})"
+        )
+    return match
+
+
+def _view(companies: list) -> str:
+    """summary_snapshot view key for an unfiltered view of companies."""
+    if len(companies) == 1:
+        return str(companies[0])
+    return "ALL:" + ",".join(companies)
+
+
+def _for_each_company(fn, companies: list) -> list:
+    """fn(company) for every company, COMPANY_PARALLELISM at a time, in order."""
+    if len(companies) == 1:
+        return [fn(companies[0])]
+    with ThreadPoolExecutor(max_workers=max(1, min(COMPANY_PARALLELISM, len(companies)))) as pool:
+        return list(pool.map(tracing.bind(fn), companies))
+
+
+# ── Public API ────────────────────────────────────────────────────────────────
+
+def get_summary(
+    date_from: str = None,
+    date_to: str = None,
+    customer: str = None,
+    category: str = None,
+    company: str = None,
+) -> dict:
+    """
+    Refresh from OData (incrementally where possible) and return the summary
+    for one company (default: first of COMPANIES) or "ALL" consolidated.
+    Any filter answers from the cube (month-granular dates) instead, without
+    waiting for a sync once the pipelines are warm. Raises InvalidViewError
+    for an unknown company or a from / to that is not YYYY-MM[-DD].
+    """
+    companies = _companies(company)
+    date_from = _month_bound("from", date_from)
+    date_to   = _month_bound("to", date_to)
+    if date_from and date_to and date_from > date_to:
+        raise InvalidViewError(f"'from' ({date_from}) is after 'to' ({date_to})")
+    filters   = (date_from, date_to, customer, category)
+    filtered  = any(filters)
+
+    if not SYNC_ENABLED:
+        summary = _direct_summary(companies, filters)
+        summary["as_of"] = time.time()
+        return summary
+
+    pipelines = [_pipeline(c) for c in companies]
+    if not filtered and any(p.state is None for p in pipelines):
+        entry = summary_snapshot.get(_view(companies))
+        if entry is not None:
+            warm_in_background(companies)
+            log.info(f"Serving {_view(companies)} from snapshot while pipelines warm up")
+            return entry["summary"]
+
+    if filtered and all(p.state is not None for p in pipelines):
+        # roll up from the cube as it stands; the sync runs off the request path
+        if any(time.time() - p.refreshed_at > BACKGROUND_REFRESH_SECONDS for p in pipelines):
+            warm_in_background(companies)
+    else:
+        _refresh_for_view(companies, pipelines)
+
+    if len(pipelines) == 1:
+        p = pipelines[0]
+        with p.lock:
+            if not filtered:
+                return p.summary()
+            summary = p.cube.rollup(*filters)
+        summary["company"] = p.company
+        return summary
+
+    if not filtered:
+        versions = tuple((p.company, p.version) for p in pipelines)
+        if _consolidated["versions"] == versions:
+            return _consolidated["summary"]
+
+    parts = []
+    for p in pipelines:
+        with p.lock:
+            state = p.cube.rollup_state(*filters) if filtered else p.state
+            parts.append((p.company, state.namespaced(p.company)))
+    summary = _consolidate(parts)
+
+    if not filtered:
+        summary["as_of"] = max(p.changed_at for p in pipelines)
+        _consolidated.update(versions=versions, summary=summary)
+    return summary
+
+
+def _refresh_for_view(companies: list, pipelines: list) -> None:
+    try:
+        _for_each_company(lambda c: _pipeline(c).refresh(full=False), companies)
+    except AOSUnavailableError:
+        # AOS down: answer from the last good in-memory state rather than fail
+        if any(p.state is None for p in pipelines):
+            raise
+        log.warning(f"AOS unavailable — serving {_view(companies)} from the last refresh")
+
+
+def _month_bound(name: str, value):
+    """from / to as 'YYYY-MM' (None stays None); InvalidViewError if malformed."""
+    if not value:
+        return None
+    try:
+        return parse_month(value)
+    except ValueError as e:
+        raise InvalidViewError(f"'{name}': {e}") from None
+
+
+def refresh(full: bool = False, company: str = None) -> dict:
+    """
+    Sync store(s) and fold the deltas into the states. Returns the sync stats
+    of the single company, or {"companies": {company: stats}} for several.
+    """
+    companies = _companies(company or (ALL if len(COMPANIES) > 1 else None))
+    results   = _for_each_company(lambda c: _pipeline(c).refresh(full), companies)
+    if len(companies) == 1:
+        return results[0]
+    return {"companies": dict(zip(companies, results))}
+
+
+def warm_up(companies: list = None) -> str:
+    """
+    Refresh companies (default: all) so their pipelines are warm. Blocking;
+    returns at once if another warm-up is already running.
+    """
+    if not SYNC_ENABLED:
+        return "sync disabled"
+    if not _warming.acquire(blocking=False):
+        return "already warming"
+    companies = companies or list(COMPANIES) or [COMPANY]
+    started   = time.perf_counter()
+    try:
+        _for_each_company(lambda c: _pipeline(c).refresh(full=False), companies)
+    finally:
+        _warming.release()
+    log.info(f"Pipelines warm ({', '.join(map(str, companies))}) in {time.perf_counter() - started:.1f}s")
+    return ", ".join(map(str, companies))
+
+
+def warm_in_background(companies: list) -> None:
+    """warm_up(companies) on a daemon thread; no-op while a warm-up is running."""
+    if _warming.locked():
+        return
+
+    def run():
+        try:
+            warm_up(companies)
+        except Exception as e:
+            log.warning(f"Background pipeline warm-up failed: {e}")
+
+    threading.Thread(target=run, name="pipeline-warm", daemon=True).start()
+
+
+def customer_drilldown(account: str, company: str = None, offset: int = None, limit: int = 50):
+    """
+    Drill-down for one customer from the company's CustomerIndex: the
+    overview, or with offset set the page of its order list. None if the
+    customer has no revenue lines. "COMPANY/ACCOUNT" (the consolidated
+    view's namespaced form) selects the company; company="ALL" returns the
+    first company that knows the account. Uses the index as last refreshed —
+    no OData call unless the company has never been loaded.
+    """
+    prefix, _, rest = account.partition("/")
+    if rest and any(c.lower() == prefix.lower() for c in COMPANIES):
+        company, account = prefix, rest
+
+    for c in _companies(company):
+        if SYNC_ENABLED:
+            p = _pipeline(c)
+            if p.index is None:
+                p.refresh(full=False)
+            with p.lock:
+                result = _drill(p.index, account, offset, limit)
+        else:
+            index = _direct_indexes.get(c)
+            if index is None:
+                index = _direct_indexes[c] = build_index(fetch_sales_lines(c))
+            result = _drill(index, account, offset, limit)
+        if result is not None:
+            result["company"] = c
+            return result
+    return None
+
+
+def _drill(index, account: str, offset, limit: int):
+    if offset is None:
+        return index.overview(account)
+    return index.orders(account, offset, limit)
+
+
+def reset() -> None:
+    """Drop the in-memory states and cubes; the next get_summary() rebuilds them."""
+    with _pipelines_lock:
+        _pipelines.clear()
+        _direct_indexes.clear()
+        _consolidated.update(versions=None, summary=None)
+
+
+# ── Consolidation ─────────────────────────────────────────────────────────────
+
+def _consolidate(parts: list) -> dict:
+    """Merge (company, namespaced state) parts into one tagged summary."""
+    merged = SummaryState()
+    for _, state in parts:
+        merged.merge(state)
+
+    summary = merged.to_summary()
+    summary["company"]   = ALL
+    summary["companies"] = {
+        company: {
+            "grand_total":         round(state.grand_total, 2),
+            "total_lines":         state.total_lines,
+            "revenue_by_currency": {
+                cur: round(rev, 2) for cur, (_, rev) in sorted(state.currencies.items())
+            },
+        }
+        for company, state in parts
+    }
+    return summary
+
+
+def _direct_summary(companies: list, filters: tuple) -> dict:
+    """SYNC_ENABLED=false: fetch every company from OData on each request."""
+    line_sets = _for_each_company(fetch_sales_lines, companies)
+    if not any(filters):
+        for company, lines in zip(companies, line_sets):
+            _direct_indexes[company] = build_index(lines)   # drill-downs reuse this fetch
+
+    if len(companies) == 1 and not any(filters):
+        summary = summarise_sales_performance(line_sets[0])
+        totals  = {}
+        for line in line_sets[0]:
+            cur = line.get("currency") or "USD"
+            totals[cur] = totals.get(cur, 0.0) + line["line_amount"]
+        summary["revenue_by_currency"] = {cur: round(v, 2) for cur, v in sorted(totals.items())}
+        summary["company"] = companies[0]
+        return summary
+
+    states = [
+        build_cube(lines).rollup_state(*filters) if any(filters) else build_state(lines)
+        for lines in line_sets
+    ]
+    if len(companies) == 1:
+        summary = states[0].to_summary()
+        summary["company"] = companies[0]
+        return summary
+    return _consolidate([(c, s.namespaced(c)) for c, s in zip(companies, states)])
@@ -0,0 +1,211 @@
+"""
+sales_cube.py — D365 AI Sales & Revenue Intelligence
+Pre-aggregated month × customer × item × category cube for period views
+(cells also keyed by currency, for multi-company tagging).
+
+Cells are bucketed by requested-receipt month ("YYYY-MM", "" when the line
+has no date) and hold scalar line count, revenue and quantity. Distinct
+orders are kept one level coarser, per month × customer × category, as a
+reference-counted Counter of order numbers — the finest grain any filter
+needs — so the cube supports the same apply / retract maintenance as
+summary_state.SummaryState while a rollup only adds scalars per cell and
+unions one order Counter per customer × category touched.
+
+rollup(date_from, date_to, customer, category) answers a filtered dashboard
+by visiting only the months in range and returns a dict in exactly the
+summarise_sales_performance shape, so chart_engine renders it unchanged.
+rollup_state() returns the same selection as a mergeable SummaryState.
+Date filters are month-granular: "2025-03-17" selects all of March 2025.
+parse_month() validates a from / to bound before it reaches the cube.
+"""
+
+import re
+from collections import Counter
+from datetime import date
+
+from summary_state import SummaryState
+
+
+def month_key(value) -> str:
+    """'YYYY-MM' for a date / ISO string, '' for None."""
+    if not value:
+        return ""
+    return value.isoformat()[:7] if hasattr(value, "isoformat") else str(value)[:7]
+
+
+def parse_month(value: str) -> str:
+    """'YYYY-MM' or 'YYYY-MM-DD' -> 'YYYY-MM'; ValueError for anything else."""
+    text = str(value).strip()
+    if re.fullmatch(r"\d{4}-\d{2}", text):
+        text += "-01"
+    try:
+        if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", text):
+            raise ValueError
+        return date.fromisoformat(text).isoformat()[:7]
+    except ValueError:
+        raise ValueError(f"'{value}' is not a YYYY-MM or YYYY-MM-DD date") from None
+
+
+def _decrement(counter: Counter, key) -> None:
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+def _cell_key(rec: dict) -> tuple:
+    return (
+        rec["customer_account"],
+        rec["item_number"],
+        rec["category"] or "Other",
+        rec.get("currency") or "USD",
+    )
+
+
+class SalesCube:
+    """
+    months -> {(account, item, category, currency): [lines, revenue, quantity]}
+    orders -> {month: {(account, category): Counter(order)}}
+    """
+
+    def __init__(self):
+        self.months = {}
+        self.orders = {}
+        self.names  = {}   # item -> first product name seen on a customer line
+
+    def apply(self, lines: list) -> None:
+        for rec in lines:
+            month = month_key(rec.get("requested_date"))
+            cells = self.months.setdefault(month, {})
+            key   = _cell_key(rec)
+            cell  = cells.get(key)
+            if cell is None:
+                cell = cells[key] = [0, 0.0, 0.0]
+            cell[0] += 1
+            cell[1] += rec["line_amount"]
+            cell[2] += rec["quantity"]
+
+            groups = self.orders.setdefault(month, {})
+            gkey   = (key[0], key[2])   # (account, category)
+            group  = groups.get(gkey)
+            if group is None:
+                group = groups[gkey] = Counter()
+            group[rec["sales_order_num"]] += 1
+            if rec["customer_account"]:   # same first-seen rule as the summary
+                self.names.setdefault(rec["item_number"], rec["product_name"])
+
+    def retract(self, lines: list) -> None:
+        for rec in lines:
+            month = month_key(rec.get("requested_date"))
+            cells = self.months[month]
+            key   = _cell_key(rec)
+            cell  = cells[key]
+            cell[0] -= 1
+            cell[1] -= rec["line_amount"]
+            cell[2] -= rec["quantity"]
+            if cell[0] == 0:
+                del cells[key]
+                if not cells:
+                    del self.months[month]
+
+            groups = self.orders[month]
+            gkey   = (key[0], key[2])
+            group  = groups[gkey]
+            _decrement(group, rec["sales_order_num"])
+            if not group:
+                del groups[gkey]
+                if not groups:
+                    del self.orders[month]
+
+    def cell_count(self) -> int:
+        return sum(len(cells) for cells in self.months.values())
+
+    # ── Query ─────────────────────────────────────────────────────────────────
+
+    def rollup(
+        self,
+        date_from: str = None,
+        date_to: str = None,
+        customer: str = None,
+        category: str = None,
+    ) -> dict:
+        """Roll matching cells up into a summarise_sales_performance dict."""
+        return self.rollup_state(date_from, date_to, customer, category).to_summary()
+
+    def rollup_state(
+        self,
+        date_from: str = None,
+        date_to: str = None,
+        customer: str = None,
+        category: str = None,
+    ) -> SummaryState:
+        """
+        Matching cells as a SummaryState, so filtered views of several
+        companies can be namespaced and merged like the full states.
+        """
+        lo = month_key(date_from)
+        hi = month_key(date_to)
+        state = SummaryState()
+
+        for month in sorted(self.months):
+            if (lo or hi) and not month:
+                continue   # undated lines can't satisfy a date filter
+            if lo and month < lo:
+                continue
+            if hi and month > hi:
+                continue
+
+            for (acct, item, cat, cur), (n, rev, qty) in self.months[month].items():
+                if customer and acct != customer:
+                    continue
+                if category and cat != category:
+                    continue
+
+                state.total_lines += n
+                state.grand_total += rev
+                m = state.currencies.setdefault(cur, [0, 0.0])
+                m[0] += n
+                m[1] += rev
+                if not acct:
+                    continue
+
+                c = state.customers.get(acct)
+                if c is None:
+                    c = state.customers[acct] = [0, 0.0, Counter(), Counter(), Counter()]
+                c[0] += n
+                c[1] += rev
+                c[3][item] += n
+                c[4][cat]  += n
+
+                p = state.products.get(item)
+                if p is None:
+                    p = state.products[item] = [0, self.names.get(item, ""), 0.0, 0.0, Counter()]
+                p[0] += n
+                p[2] += rev
+                p[3] += qty
+                p[4][acct] += n
+
+                g = state.categories.get(cat)
+                if g is None:
+                    g = state.categories[cat] = [0, 0.0, 0.0, Counter()]
+                g[0] += n
+                g[1] += rev
+                g[2] += qty
+
+            # every customer / category here already has its entry from a cell above
+            for (acct, cat), orders in self.orders[month].items():
+                if customer and acct != customer:
+                    continue
+                if category and cat != category:
+                    continue
+                state.orders.update(orders)
+                if acct:
+                    state.customers[acct][2].update(orders)
+                    state.categories[cat][3].update(orders)
+
+        return state
+
+
+def build_cube(lines: list) -> SalesCube:
+    cube = SalesCube()
+    cube.apply(lines)
+    return cube
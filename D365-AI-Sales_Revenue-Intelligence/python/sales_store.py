@@ -0,0 +1,306 @@
+"""
+sales_store.py — D365 AI Sales & Revenue Intelligence
+Local SQLite copy of SalesOrderLines, kept fresh with a modified-datetime watermark.
+
+A refresh only asks OData for rows whose watermark field is >= the highest value
+already stored, whatever their status (with the expanded header status), so a
+line that becomes Invoiced — or stops being Invoiced — is updated in place. A
+periodic full reconcile replaces the table with the revenue lines only (filter
+pushed down to the AOS) to pick up deletes and header-only status changes.
+revenue_pipeline.py summarises from the store.
+
+The watermark field (SYNC_WATERMARK_FIELD) must be exposed by the SalesOrderLines
+entity. If OData rejects it, every refresh falls back to a full reconcile.
+
+Each legal entity gets its own store file (store_path): SYNC_DB_PATH for
+COMPANY, sales_lines_<company>.db for the others in COMPANIES.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from config import (
+    COMPANY,
+    SYNC_DB_PATH,
+    SYNC_WATERMARK_FIELD,
+    SYNC_RECONCILE_HOURS,
+)
+from odata import (
+    LINE_FIELDS,
+    ODataRequestError,
+    fetch_sales_line_records,
+    is_revenue_line,
+    parse_line,
+)
+
+log = logging.getLogger(__name__)
+
+# Column order for the lines table (lot_id is the SalesOrderLines entity key)
+COLUMNS = (
+    "lot_id", "sales_order_num", "customer_account", "item_number", "product_name",
+    "quantity", "line_amount", "currency", "requested_date",
+    "line_status", "header_status", "category", "modified",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales_lines (
+    lot_id           TEXT PRIMARY KEY,
+    sales_order_num  TEXT,
+    customer_account TEXT,
+    item_number      TEXT,
+    product_name     TEXT,
+    quantity         REAL,
+    line_amount      REAL,
+    currency         TEXT,
+    requested_date   TEXT,
+    line_status      TEXT,
+    header_status    TEXT,
+    category         TEXT,
+    modified         TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Same predicate as odata.is_revenue_line, evaluated by SQLite
+REVENUE_WHERE = (
+    "line_status = 'Invoiced' AND header_status = 'Invoiced' AND line_amount > 0"
+)
+
+
+# ── Store ─────────────────────────────────────────────────────────────────────
+
+class SalesLineStore:
+    """SQLite-backed line table plus watermark / last-reconcile metadata."""
+
+    def __init__(self, path: str = SYNC_DB_PATH, company: str = None):
+        self.path    = path
+        self.company = company or COMPANY
+        self.lock = threading.Lock()   # one sync at a time per store
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed."""
+        db = sqlite3.connect(self.path)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # ── metadata ──
+
+    def get_meta(self, key: str, default=None):
+        with self._connect() as db:
+            row = db.execute("SELECT value FROM sync_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, db: sqlite3.Connection, key: str, value) -> None:
+        db.execute(
+            "INSERT OR REPLACE INTO sync_meta (key, value) VALUES (?, ?)",
+            (key, None if value is None else str(value)),
+        )
+
+    def watermark(self):
+        return self.get_meta("watermark")
+
+    def last_full_sync(self) -> float:
+        return float(self.get_meta("last_full_sync", 0) or 0)
+
+    def count(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM sales_lines").fetchone()[0]
+
+    # ── writes ──
+
+    def upsert(self, lines: list) -> int:
+        """Insert or replace lines by lot_id; advance the watermark."""
+        with self._connect() as db:
+            db.executemany(
+                f"INSERT OR REPLACE INTO sales_lines ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                [_to_row(l) for l in lines],
+            )
+            self._advance_watermark(db, lines)
+        return len(lines)
+
+    def replace_all(self, lines: list, watermark_ok: bool = True) -> int:
+        """Full reconcile — the table becomes exactly `lines` (drops deleted rows)."""
+        with self._connect() as db:
+            db.execute("DELETE FROM sales_lines")
+            db.executemany(
+                f"INSERT OR REPLACE INTO sales_lines ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                [_to_row(l) for l in lines],
+            )
+            self.set_meta(db, "watermark", None)
+            self._advance_watermark(db, lines)
+            self.set_meta(db, "last_full_sync", time.time())
+            self.set_meta(db, "watermark_ok", int(watermark_ok))
+        return len(lines)
+
+    def _advance_watermark(self, db: sqlite3.Connection, lines: list) -> None:
+        stamps = [l["modified"] for l in lines if l.get("modified")]
+        if not stamps:
+            return
+        row     = db.execute("SELECT value FROM sync_meta WHERE key = 'watermark'").fetchone()
+        current = row[0] if row and row[0] else ""
+        # ISO-8601 UTC strings from OData compare correctly as text
+        self.set_meta(db, "watermark", max([current] + stamps))
+
+    # ── reads ──
+
+    def revenue_lines(self) -> list:
+        """Invoiced revenue lines in the same shape as odata.fetch_sales_lines()."""
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM sales_lines "
+                f"WHERE {REVENUE_WHERE} ORDER BY lot_id"
+            ).fetchall()
+        return [_from_row(r) for r in rows]
+
+    def revenue_lines_for(self, lot_ids: list) -> list:
+        """Stored revenue lines among lot_ids (their versions before an upsert)."""
+        found = []
+        with self._connect() as db:
+            for i in range(0, len(lot_ids), 500):
+                batch = lot_ids[i:i + 500]
+                found.extend(db.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM sales_lines "
+                    f"WHERE {REVENUE_WHERE} AND lot_id IN ({', '.join('?' for _ in batch)})",
+                    batch,
+                ).fetchall())
+        return [_from_row(r) for r in found]
+
+
+def _to_row(line: dict) -> tuple:
+    row = dict(line)
+    if isinstance(row.get("requested_date"), date):
+        row["requested_date"] = row["requested_date"].isoformat()
+    return tuple(row.get(c) for c in COLUMNS)
+
+
+def _from_row(row: tuple) -> dict:
+    line = dict(zip(COLUMNS, row))
+    line["requested_date"] = (
+        date.fromisoformat(line["requested_date"]) if line["requested_date"] else None
+    )
+    return line
+
+
+# ── Sync ──────────────────────────────────────────────────────────────────────
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_path(company: str) -> str:
+    """SYNC_DB_PATH for the default company, sales_lines_<company>.db style otherwise."""
+    if not company or company == COMPANY:
+        return SYNC_DB_PATH
+    root, ext = os.path.splitext(SYNC_DB_PATH)
+    return f"{root}_{company.lower()}{ext or '.db'}"
+
+
+def get_store(company: str = None) -> SalesLineStore:
+    """Process-wide store per company (created on first use)."""
+    company = company or COMPANY
+    with _stores_lock:
+        if company not in _stores:
+            _stores[company] = SalesLineStore(store_path(company), company)
+        return _stores[company]
+
+
+def _fetch_lines(extra_filter: str = "", company: str = None) -> tuple:
+    """
+    Fetch + parse lines with the watermark column. Returns (lines, watermark_ok).
+
+    The full reconcile (no extra_filter) replaces the table, so it only needs
+    revenue lines and pushes the revenue filter down. The incremental fetch
+    passes revenue_only=False: a changed line must come back whatever its new
+    status, so one that stopped being revenue is retracted. The pushdown only
+    steps down for 400s naming its predicates, so a 400 that reaches this
+    function is the watermark field.
+    """
+    try:
+        recs = fetch_sales_line_records(
+            extra_filter, select=f"{LINE_FIELDS},{SYNC_WATERMARK_FIELD}",
+            revenue_only=not extra_filter, company=company,
+        )
+        watermark_ok = True
+    except ODataRequestError as e:
+        if extra_filter or e.status_code != 400:
+            raise
+        log.warning(
+            f"SalesOrderLines rejected watermark field '{SYNC_WATERMARK_FIELD}' — "
+            f"falling back to full reconcile on every sync"
+        )
+        recs = fetch_sales_line_records(company=company)
+        watermark_ok = False
+
+    lines = []
+    for rec in recs:
+        line = parse_line(rec)
+        line["modified"] = rec.get(SYNC_WATERMARK_FIELD) if watermark_ok else None
+        lines.append(line)
+    return lines, watermark_ok
+
+
+def sync_sales_lines(store: SalesLineStore = None, full: bool = False) -> dict:
+    """
+    Bring the local store up to date with OData.
+
+    Incremental when a watermark exists and the last full reconcile is younger
+    than SYNC_RECONCILE_HOURS; otherwise (or when full=True) a full reconcile.
+    Returns sync stats for logging / the /sync endpoint.
+    """
+    stats, _ = sync_with_delta(store, full)
+    return stats
+
+
+def sync_with_delta(store: SalesLineStore = None, full: bool = False) -> tuple:
+    """
+    sync_sales_lines() that also reports what changed for incremental consumers
+    (summary_state.SummaryState). Returns (stats, delta) where delta is
+    {"removed": [...], "added": [...]} revenue lines for an incremental sync,
+    or None after a full reconcile (consumers rebuild from store.revenue_lines()).
+    """
+    store = store or get_store()
+    with store.lock:
+        started   = time.perf_counter()
+        watermark = store.watermark()
+        stale     = time.time() - store.last_full_sync() > SYNC_RECONCILE_HOURS * 3600
+
+        if full or stale or not watermark or store.get_meta("watermark_ok") == "0":
+            lines, watermark_ok = _fetch_lines(company=store.company)
+            written = store.replace_all(lines, watermark_ok)
+            delta   = None
+            mode    = "full"
+        else:
+            # ge, not gt: rows sharing the boundary timestamp are re-fetched (upsert is idempotent)
+            lines, _ = _fetch_lines(f"{SYNC_WATERMARK_FIELD} ge {watermark}", store.company)
+            delta = {
+                "removed": store.revenue_lines_for([l["lot_id"] for l in lines]),
+                "added":   [l for l in lines if is_revenue_line(l)],
+            }
+            written = store.upsert(lines)
+            mode    = "incremental"
+
+        stats = {
+            "mode":       mode,
+            "fetched":    written,
+            "stored":     store.count(),
+            "watermark":  store.watermark(),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    log.info(f"Sales line sync {store.company} ({mode}): {stats}")
+    return stats, delta
@@ -1,35 +1,97 @@
 """
 server.py — D365 AI Sales & Revenue Intelligence
 ==================================================
-Four endpoints.
+Thirteen endpoints, plus two /debug/profile endpoints when PROFILING_ENABLED=true
+and two /debug/traces endpoints when TRACING_ENABLED=true.
 
   GET  /health           — confirm server is running
   GET  /test-sales-data  — validate OData data vs SQL ground truth
   POST /ask-chart        — return sales dashboard HTML (original)
   GET  /dashboard        — return sales dashboard HTML for D365 iframe embedding
+  GET  /dashboard/narrative/{key} — AI narrative for a progressive dashboard
+  GET  /dashboard/app    — static dashboard shell (renders from /dashboard/data)
+  GET  /dashboard/data   — chart series, stats and narrative as JSON (ETag / 304)
+  GET  /rankings/customers — paginated customer ranking (sort / tier / offset / limit)
+  GET  /rankings/products  — paginated product ranking (sort / offset / limit)
+  GET  /customers/{account}        — one customer's drill-down (products, categories, trend)
+  GET  /customers/{account}/orders — one customer's order list, paginated
+  GET  /static/{name}    — bundled Chart.js, content-hashed and immutable
+  POST /sync             — refresh the local line store (?full=true to reconcile)
+  GET  /debug/profile    — sample the whole process for ?seconds=N, return the profile
+  GET  /debug/profiles/{name} — a saved per-request profile
+  GET  /debug/traces     — slowest (or latest) recent request traces
+  GET  /debug/traces/{request_id} — one trace's span tree (JSON, or ?format=text)
+
+Any request with a ?profile= query flag (value speedscope or collapsed)
+runs under the sampling profiler when PROFILING_ENABLED=true; the
+response's X-Profile header links the profile.
+
+With TRACING_ENABLED=true every request (except /debug/*) is traced: its
+X-Request-ID header (or a generated id) is returned on the response, tagged
+on every log line and used to look the trace up under /debug/traces.
 
 Run:
   uvicorn server:app --host 0.0.0.0 --port 8000 --reload
 """
 
+import asyncio
 import logging
+from urllib.parse import urlencode
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-
-from config import OLLAMA_MODEL, COMPANY
-from odata import fetch_sales_lines, summarise_sales_performance
-from chart_engine import build_sales_dashboard_html
-from ai_engine import generate_sales_narrative, warm_up_ollama
+from fastapi.responses import FileResponse, HTMLResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
+
+from config import (
+    OLLAMA_MODEL,
+    COMPANY,
+    COMPANIES,
+    NARRATIVE_CACHE_ENABLED,
+    DASHBOARD_PROGRESSIVE,
+    PUBLIC_BASE_URL,
+    NARRATIVE_POLL_SECONDS,
+    RANKINGS_MAX_LIMIT,
+    PROFILING_ENABLED,
+    PROFILE_MAX_SECONDS,
+    TRACING_ENABLED,
+)
+from odata import fetch_sales_lines, get_token, summarise_sales_performance
+from revenue_pipeline import get_summary, refresh, warm_up, customer_drilldown, InvalidViewError
+import summary_snapshot
+import summary_pool
+from chart_engine import (
+    build_sales_dashboard_html,
+    build_narrative_html,
+    build_dashboard_shell,
+    encode_dashboard_data,
+)
+from ai_engine import (
+    generate_sales_narrative,
+    start_sales_narrative,
+    await_narrative,
+    seed_narrative,
+    narrative_ok,
+    warm_up_ollama,
+)
+from narrative_cache import get_cache, stats as narrative_cache_stats
+from ollama_pool import pool as ollama_pool
+from http_cache import cached_response
+from static_assets import chartjs_src, static_response
+import rankings
+from resilience import AOSUnavailableError, stats as odata_stats
+from work_pool import StageTimeout, run_stage, stats as stage_stats
+from startup_tasks import launch, progress as startup_progress
+import profiler
+import tracing
 
 # ── Logging ───────────────────────────────────────────────────────────────────
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
+    format="%(asctime)s [%(levelname)s] [%(request_id)s] %(message)s"
 )
+tracing.install_log_filter()
 log = logging.getLogger(__name__)
 
 
@@ -46,41 +108,121 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile", "X-Request-ID"],
 )
 
+
+if PROFILING_ENABLED:
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        """Run a request flagged with ?profile= under the sampler (the same flag as the assistant)."""
+        fmt = request.query_params.get("profile")
+        if not fmt:
+            return await call_next(request)
+        fmt = fmt if fmt in profiler.FORMATS else "speedscope"
+        sampler = profiler.Sampler().start()
+        try:
+            response = await call_next(request)
+        finally:
+            sampler.stop()
+        name = await asyncio.to_thread(profiler.save, sampler, request.url.path, fmt)
+        response.headers["X-Profile"] = f"/debug/profiles/{name}"
+        return response
+
+
+if TRACING_ENABLED:
+    @app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        """Run the request as a trace; X-Request-ID in, X-Request-ID out."""
+        if request.url.path.startswith("/debug/"):
+            return await call_next(request)
+        with tracing.trace(f"{request.method} {request.url.path}", request.headers.get("X-Request-ID")) as t:
+            response = await call_next(request)
+            t.attrs["status"] = response.status_code
+        response.headers["X-Request-ID"] = t.id
+        return response
+
 # ── Startup ───────────────────────────────────────────────────────────────────
 
 @app.on_event("startup")
 async def startup_event():
     """
-    Warm up Ollama on server start — exact same pattern as Projects 1 & 2.
+    Launch warm-up work in the background and return, so the server listens
+    (and /health answers) at once. Progress is reported under /health → startup.
 
     REMINDER: Wake AOS before calling /test-sales-data or /ask-chart.
     Navigate to: Accounts Receivable -> Inquiries -> Open transactions
     or any D365 page that triggers AOS activity.
     """
-    log.info("Server starting — warming up Ollama...")
+    log.info("Server starting — warm-up runs in the background (see /health)")
     log.info("REMINDER: Wake AOS — open any D365 page before calling OData endpoints")
-    await warm_up_ollama()
-    log.info("Server ready.")
+    launch("snapshot", _load_snapshot)
+    launch("ollama", warm_up_ollama)
+    ollama_pool.start_health_checks()
+    launch("token", _acquire_token)
+    launch("pipelines", warm_up)
+    launch("narrative_cache", _open_narrative_cache)
+    launch("static", chartjs_src)   # read + precompress the bundled Chart.js once
+    launch("summary_pool", summary_pool.start_pool)
+
+
+async def _load_snapshot() -> int:
+    """Load the summary snapshot and seed its narratives as finished jobs."""
+    loaded = await asyncio.to_thread(summary_snapshot.load)
+    for entry in summary_snapshot.entries().values():
+        if entry["narrative"]:
+            seed_narrative(entry["summary"], entry["narrative"])
+    return loaded
+
+
+def _acquire_token() -> str:
+    if not get_token():
+        raise RuntimeError("Could not acquire Azure AD token — check .env credentials")
+    return "cached"
+
+
+def _open_narrative_cache() -> str:
+    if not NARRATIVE_CACHE_ENABLED:
+        return "disabled"
+    return f"{get_cache().stats()['entries']} entries"
 
 
 # ── Models ────────────────────────────────────────────────────────────────────
 
 class ChartRequest(BaseModel):
-    question: str = "Show me the sales revenue dashboard"
+    model_config = ConfigDict(populate_by_name=True)
+
+    question:  str = "Show me the sales revenue dashboard"
+    date_from: str | None = Field(None, alias="from")   # YYYY-MM or YYYY-MM-DD
+    date_to:   str | None = Field(None, alias="to")
+    customer:  str | None = None
+    category:  str | None = None
+    company:   str | None = None   # legal entity, or ALL for the consolidated view
+    regenerate: bool = False   # bypass the narrative cache
 
 
 # ── Endpoints ─────────────────────────────────────────────────────────────────
 
 @app.get("/health")
 async def health():
-    """Confirm server is running. Check this first."""
+    """
+    Confirm server is running. Check this first. Answers as soon as the
+    process listens; "ready" turns true once the startup tasks have finished.
+    """
+    startup = startup_progress()
     return {
         "status":  "ok",
+        "ready":   startup["ready"],
         "model":   OLLAMA_MODEL,
+        "ollama":  ollama_pool.stats(),
         "company": COMPANY,
+        "companies": COMPANIES,
         "project": "D365 AI Sales & Revenue Intelligence v1.0",
+        "narrative_cache": (narrative_cache_stats() or "not opened") if NARRATIVE_CACHE_ENABLED else "disabled",
+        "stages":  stage_stats(),
+        "startup": startup,
+        "odata":   odata_stats(),
+        "tracing": tracing.stats() if TRACING_ENABLED else "disabled",
     }
 
 
@@ -91,8 +233,8 @@ async def test_sales_data():
     match_customers must be true before building X++ components.
     """
     try:
-        records = fetch_sales_lines()
-        summary = summarise_sales_performance(records)
+        records = await run_stage("fetch", fetch_sales_lines)
+        summary = await run_stage("summarise", summarise_sales_performance, records, cpu=True)
 
         return {
             "status":          "ok",
@@ -133,6 +275,10 @@ async def test_sales_data():
             }
         }
 
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except AOSUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -145,44 +291,403 @@ async def ask_chart(req: ChartRequest):
     """
     try:
         log.info("[/ask-chart] Request received")
-        records = fetch_sales_lines()
-        log.info(f"[/ask-chart] Fetched {len(records)} lines")
-        if not records:
-            return HTMLResponse(content=_error_html("No sales order lines found in USMF."))
-        summary   = summarise_sales_performance(records)
-        narrative = await generate_sales_narrative(summary)
-        html      = build_sales_dashboard_html(summary, narrative)
+        summary = await run_stage(
+            "summary", get_summary, req.date_from, req.date_to, req.customer, req.category, req.company
+        )
+        log.info(f"[/ask-chart] Summary covers {summary['total_lines']} lines")
+        if not summary["total_lines"]:
+            return HTMLResponse(content=_error_html(f"No sales order lines found in {summary['company']}."))
+        narrative, narrative_url = await _narrative_for(
+            summary, req.regenerate, not any((req.date_from, req.date_to, req.customer, req.category))
+        )
+        html = await run_stage(
+            "render",
+            build_sales_dashboard_html,
+            summary,
+            narrative,
+            _scope_label(req.date_from, req.date_to, req.customer, req.category),
+            narrative_url,
+            cpu=True,
+        )
         log.info("[/ask-chart] Dashboard built — returning HTML")
         return HTMLResponse(content=html)
+    except InvalidViewError as e:
+        return HTMLResponse(content=_error_html(str(e)), status_code=400)
+    except StageTimeout as e:
+        return HTMLResponse(content=_error_html(str(e)), status_code=504)
+    except AOSUnavailableError as e:
+        return HTMLResponse(content=_error_html(str(e)), status_code=503, headers=_retry_after(e))
     except Exception as e:
         log.error(f"[/ask-chart] Error: {e}", exc_info=True)
         return HTMLResponse(content=_error_html(str(e)), status_code=500)
 
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard():
+async def dashboard(
+    date_from: str | None = Query(None, alias="from"),
+    date_to:   str | None = Query(None, alias="to"),
+    customer:  str | None = None,
+    category:  str | None = None,
+    company:   str | None = None,
+    regenerate: bool = False,
+):
     """
     GET version of dashboard — used by D365 Extensible Control iframe.
     iframe src="http://localhost:8000/dashboard"
     Same logic as /ask-chart but accessible via GET so iframe can load it directly.
     This is the endpoint called by the D365 FO form.
+
+    Optional from / to (YYYY-MM or YYYY-MM-DD, month-granular), customer and
+    category narrow the view; filtered views are rolled up from the sales cube.
+    company selects a legal entity from COMPANIES, or ALL for the consolidated view.
+    regenerate=true bypasses the narrative cache.
     """
     try:
         log.info("[/dashboard] Request received")
-        records = fetch_sales_lines()
-        log.info(f"[/dashboard] Fetched {len(records)} lines")
-        if not records:
-            return HTMLResponse(content=_error_html("No sales order lines found in USMF."))
-        summary   = summarise_sales_performance(records)
-        narrative = await generate_sales_narrative(summary)
-        html      = build_sales_dashboard_html(summary, narrative)
+        summary = await run_stage("summary", get_summary, date_from, date_to, customer, category, company)
+        log.info(f"[/dashboard] Summary covers {summary['total_lines']} lines")
+        if not summary["total_lines"]:
+            return HTMLResponse(content=_error_html(f"No sales order lines found in {summary['company']}."))
+        narrative, narrative_url = await _narrative_for(
+            summary, regenerate, not any((date_from, date_to, customer, category))
+        )
+        html = await run_stage(
+            "render",
+            build_sales_dashboard_html,
+            summary,
+            narrative,
+            _scope_label(date_from, date_to, customer, category),
+            narrative_url,
+            cpu=True,
+        )
         log.info("[/dashboard] Dashboard built — returning HTML")
         return HTMLResponse(content=html)
+    except InvalidViewError as e:
+        return HTMLResponse(content=_error_html(str(e)), status_code=400)
+    except StageTimeout as e:
+        return HTMLResponse(content=_error_html(str(e)), status_code=504)
+    except AOSUnavailableError as e:
+        return HTMLResponse(content=_error_html(str(e)), status_code=503, headers=_retry_after(e))
     except Exception as e:
         log.error(f"[/dashboard] Error: {e}", exc_info=True)
         return HTMLResponse(content=_error_html(str(e)), status_code=500)
 
 
+@app.get("/dashboard/app")
+async def dashboard_app(
+    request:   Request,
+    date_from: str | None = Query(None, alias="from"),
+    date_to:   str | None = Query(None, alias="to"),
+    customer:  str | None = None,
+    category:  str | None = None,
+    company:   str | None = None,
+):
+    """
+    Static dashboard shell. Same layout as /dashboard with empty cards; its
+    script loads /dashboard/data (same filters) and draws the charts, so a
+    repeat load revalidates two small cached responses instead of a full page.
+    """
+    params = {
+        k: v for k, v in
+        (("from", date_from), ("to", date_to), ("customer", customer),
+         ("category", category), ("company", company))
+        if v
+    }
+    data_url = f"{PUBLIC_BASE_URL}/dashboard/data"
+    if params:
+        data_url += "?" + urlencode(params)
+    shell = build_dashboard_shell(data_url)
+    return cached_response(request, shell.encode("utf-8"), "text/html; charset=utf-8")
+
+
+@app.get("/dashboard/data")
+async def dashboard_data(
+    request:   Request,
+    date_from: str | None = Query(None, alias="from"),
+    date_to:   str | None = Query(None, alias="to"),
+    customer:  str | None = None,
+    category:  str | None = None,
+    company:   str | None = None,
+    regenerate: bool = False,
+):
+    """
+    Chart series, stats and narrative for the shell as compact JSON.
+    Strong ETag from the payload hash: If-None-Match answers 304.
+    """
+    try:
+        summary = await run_stage("summary", get_summary, date_from, date_to, customer, category, company)
+    except ValueError as e:   # unknown company
+        raise HTTPException(status_code=400, detail=str(e))
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except AOSUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after(e))
+    except Exception as e:
+        log.error(f"[/dashboard/data] Error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if not summary["total_lines"]:
+        raise HTTPException(status_code=404, detail=f"No sales order lines found in {summary['company']}.")
+
+    narrative, narrative_url = await _narrative_for(
+        summary, regenerate, not any((date_from, date_to, customer, category))
+    )
+    body = await run_stage(
+        "render",
+        encode_dashboard_data,
+        summary,
+        narrative,
+        _scope_label(date_from, date_to, customer, category),
+        narrative_url,
+        cpu=True,
+    )
+    return cached_response(request, body, "application/json")
+
+
+@app.get("/rankings/customers")
+async def rankings_customers(
+    date_from: str | None = Query(None, alias="from"),
+    date_to:   str | None = Query(None, alias="to"),
+    customer:  str | None = None,
+    category:  str | None = None,
+    company:   str | None = None,
+    sort:   str = "revenue",
+    tier:   str | None = None,
+    offset: int = Query(0, ge=0),
+    limit:  int = Query(25, ge=1, le=RANKINGS_MAX_LIMIT),
+):
+    """
+    Customers ranked by revenue, orders, products or avg_order_value, one
+    page at a time. tier=Platinum|Gold|Silver|Bronze filters the ranking.
+    """
+    return await _ranking(
+        "customers", (date_from, date_to, customer, category, company), sort, tier, offset, limit
+    )
+
+
+@app.get("/rankings/products")
+async def rankings_products(
+    date_from: str | None = Query(None, alias="from"),
+    date_to:   str | None = Query(None, alias="to"),
+    customer:  str | None = None,
+    category:  str | None = None,
+    company:   str | None = None,
+    sort:   str = "revenue",
+    offset: int = Query(0, ge=0),
+    limit:  int = Query(25, ge=1, le=RANKINGS_MAX_LIMIT),
+):
+    """Products ranked by revenue, quantity or customer_count, one page at a time."""
+    return await _ranking(
+        "products", (date_from, date_to, customer, category, company), sort, None, offset, limit
+    )
+
+
+@app.get("/customers/{account:path}/orders")
+async def customer_orders(
+    account: str,
+    company: str | None = None,
+    offset:  int = Query(0, ge=0),
+    limit:   int = Query(50, ge=1, le=RANKINGS_MAX_LIMIT),
+):
+    """One customer's orders, newest first, one page at a time."""
+    return await _drilldown(account, company, offset, limit)
+
+
+@app.get("/customers/{account:path}")
+async def customer_overview(account: str, company: str | None = None):
+    """
+    One customer's totals, top products, category mix, monthly trend and
+    recent orders, from the in-memory customer index (no OData call).
+    """
+    return await _drilldown(account, company, None, 0)
+
+
+@app.get("/dashboard/narrative/{key}")
+async def dashboard_narrative(key: str):
+    """
+    Narrative for a progressive dashboard, polled by the page's loader script.
+    Waits up to NARRATIVE_POLL_SECONDS; {"status": "pending"} means poll again,
+    "failed" carries the error block to show (reloading the page retries).
+    """
+    try:
+        status, narrative = await await_narrative(key, NARRATIVE_POLL_SECONDS)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown or expired narrative key")
+    if status == "pending":
+        return {"status": "pending"}
+    return {"status": status, "html": build_narrative_html(narrative)}
+
+
+@app.get("/static/{name}")
+async def static_asset(name: str, request: Request):
+    """Content-hashed static asset (Chart.js); URLs come from chart_engine."""
+    response = static_response(request, name)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Unknown asset")
+    return response
+
+
+@app.post("/sync")
+async def sync(full: bool = False, company: str | None = None):
+    """
+    Refresh the local SalesOrderLines store now (every company in COMPANIES,
+    or just company=...).
+    Incremental by default; full=true forces a reconcile (catches deleted lines).
+    """
+    try:
+        return await run_stage("sync", refresh, full=full, company=company)
+    except InvalidViewError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except AOSUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/debug/profile")
+async def debug_profile(
+    seconds: float = Query(5, gt=0, le=PROFILE_MAX_SECONDS),
+    format:  str = "speedscope",
+    idle:    bool = False,
+):
+    """
+    Sample every thread in the process for N seconds and return the profile
+    (speedscope JSON or collapsed stacks). idle=true keeps parked threads.
+    404 unless PROFILING_ENABLED=true.
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if format not in profiler.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}' — use {', '.join(profiler.FORMATS)}")
+    sampler = profiler.Sampler(include_idle=idle).start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    body = sampler.render(format, f"process {seconds:g}s")
+    ext  = "speedscope.json" if format == "speedscope" else "collapsed.txt"
+    return Response(
+        body,
+        media_type="application/json" if format == "speedscope" else "text/plain",
+        headers={"Content-Disposition": f'attachment; filename="process.{ext}"'},
+    )
+
+
+@app.get("/debug/profiles/{name}")
+async def debug_saved_profile(name: str):
+    """A per-request profile saved under PROFILE_DIR (linked from the X-Profile header)."""
+    path = profiler.path_for(name) if PROFILING_ENABLED else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path, filename=name)
+
+
+@app.get("/debug/traces")
+async def debug_traces(
+    limit:  int = Query(20, ge=1, le=500),
+    sort:   str = "slowest",
+    min_ms: float = Query(0, ge=0),
+):
+    """
+    Recent request traces from the in-process buffer, slowest first
+    (sort=recent for newest first). 404 unless TRACING_ENABLED=true.
+    """
+    if not TRACING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if sort not in ("slowest", "recent"):
+        raise HTTPException(status_code=400, detail=f"Unknown sort '{sort}' — use slowest, recent")
+    return {"tracing": tracing.stats(), "traces": tracing.recent(limit, sort, min_ms)}
+
+
+@app.get("/debug/traces/{request_id}")
+async def debug_trace(request_id: str, format: str = "json"):
+    """One buffered trace: spans as JSON, or an indented span tree with format=text."""
+    data = tracing.get(request_id) if TRACING_ENABLED else None
+    if data is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if format == "text":
+        return Response(tracing.tree(data), media_type="text/plain")
+    return data
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+async def _narrative_for(summary: dict, regenerate: bool, snapshot: bool = False) -> tuple:
+    """
+    (narrative, narrative_url) for the dashboard. Progressive mode returns the
+    narrative only when already cached; otherwise the URL the page polls.
+    snapshot=True (unfiltered views) records summary + narrative on disk.
+    """
+    if not DASHBOARD_PROGRESSIVE:
+        narrative = await generate_sales_narrative(summary, regenerate)
+        if snapshot:
+            saved = narrative if narrative_ok(narrative) else None
+            await run_stage("snapshot", summary_snapshot.save, summary, saved)
+        return narrative, ""
+
+    on_ready = (lambda text: summary_snapshot.save(summary, text)) if snapshot else None
+    key, narrative = await start_sales_narrative(summary, regenerate, on_ready)
+    if snapshot:
+        await run_stage("snapshot", summary_snapshot.save, summary, narrative)
+    if narrative is not None:
+        return narrative, ""
+    return "", f"{PUBLIC_BASE_URL}/dashboard/narrative/{key}"
+
+
+async def _ranking(kind: str, view: tuple, sort: str, tier, offset: int, limit: int) -> dict:
+    """Shared body of the /rankings endpoints; view = get_summary() arguments."""
+    try:
+        summary = await run_stage("summary", get_summary, *view)
+        page    = await run_stage("rankings", rankings.query, summary, kind, sort, offset, limit, tier)
+    except ValueError as e:   # unknown company, sort key or tier
+        raise HTTPException(status_code=400, detail=str(e))
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except AOSUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after(e))
+    except Exception as e:
+        log.error(f"[/rankings/{kind}] Error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    page["company"] = summary["company"]
+    page["scope"]   = _scope_label(*view[:4])
+    return page
+
+
+async def _drilldown(account: str, company, offset, limit: int) -> dict:
+    """Shared body of the /customers endpoints."""
+    try:
+        result = await run_stage("drilldown", customer_drilldown, account, company, offset, limit)
+    except ValueError as e:   # unknown company
+        raise HTTPException(status_code=400, detail=str(e))
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except AOSUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after(e))
+    except Exception as e:
+        log.error(f"[/customers] Error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No revenue lines for customer '{account}'.")
+    return result
+
+
+def _retry_after(e: AOSUnavailableError) -> dict:
+    return {"Retry-After": str(max(1, int(e.retry_in + 0.5)))} if e.retry_in else {}
+
+
+def _scope_label(date_from, date_to, customer, category) -> str:
+    """Human-readable filter description for the dashboard subtitle."""
+    parts = []
+    if date_from or date_to:
+        parts.append(f"{date_from or 'start'} to {date_to or 'today'}")
+    if customer:
+        parts.append(f"Customer {customer}")
+    if category:
+        parts.append(f"Category {category}")
+    return " | ".join(parts)
+
+
 # ── Error page ────────────────────────────────────────────────────────────────
 
 def _error_html(message: str) -> str:
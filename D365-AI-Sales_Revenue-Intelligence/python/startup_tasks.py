@@ -0,0 +1,67 @@
+"""
+startup_tasks.py — D365 AI Sales & Revenue Intelligence
+Background startup work with progress reporting.
+
+The FastAPI startup hook only launches tasks and returns, so uvicorn starts
+listening straight away and /health answers while Ollama loads, the first
+token is acquired and caches / snapshots are read. Each task is an async
+function (run on the event loop) or a plain function (run in a worker
+thread). Failures are logged and reported, never fatal — the code paths
+that need the resource initialise it lazily on first use anyway.
+
+  launch("ollama", warm_up_ollama)
+  progress()  ->  {"ready": False, "tasks": {"ollama": {"status": "running", ...}}}
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+_started = time.time()   # module import ≈ process start
+_tasks   = {}            # name -> progress dict, see launch()
+_handles = set()         # keeps the asyncio tasks referenced until they finish
+
+
+def launch(name: str, fn, *args) -> None:
+    """Start fn(*args) in the background as startup task name. Event loop only."""
+    entry = {"status": "pending", "started_ms": None, "elapsed_ms": None, "detail": None}
+    _tasks[name] = entry
+
+    async def run():
+        entry["status"]     = "running"
+        entry["started_ms"] = round((time.time() - _started) * 1000)
+        t0 = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(fn):
+                result = await fn(*args)
+            else:
+                result = await asyncio.to_thread(fn, *args)
+            entry["status"] = "done"
+            entry["detail"] = result if isinstance(result, (str, int, float, bool)) else None
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["detail"] = str(e)[:200]
+            log.warning(f"Startup task '{name}' failed (non-fatal): {e}")
+        entry["elapsed_ms"] = round((time.perf_counter() - t0) * 1000)
+        log.info(f"Startup task '{name}' {entry['status']} in {entry['elapsed_ms']} ms")
+
+    task = asyncio.get_running_loop().create_task(run(), name=f"startup-{name}")
+    _handles.add(task)
+    task.add_done_callback(_handles.discard)
+
+
+def ready() -> bool:
+    """True once every launched task has finished (done or failed)."""
+    return all(t["status"] in ("done", "failed") for t in _tasks.values())
+
+
+def progress() -> dict:
+    """Startup state for /health."""
+    return {
+        "ready":     ready(),
+        "uptime_ms": round((time.time() - _started) * 1000),
+        "tasks":     {name: dict(t) for name, t in _tasks.items()},
+    }
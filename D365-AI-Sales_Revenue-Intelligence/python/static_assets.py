@@ -0,0 +1,92 @@
+"""
+static_assets.py — D365 AI Sales & Revenue Intelligence
+Serves the bundled Chart.js (SalesIntelligenceChartJS.js, the same file
+deployed as the AOT resource) from the revenue server instead of jsDelivr.
+
+The file is read once; its URL carries a content hash
+(/static/chart.<hash>.js), so it is served with
+`Cache-Control: public, max-age=31536000, immutable` — browsers never
+revalidate, and a new Chart.js build gets a new URL. gzip and (if the
+optional `brotli` package is installed) brotli variants are precompressed at
+load time. If the file is missing the dashboard falls back to the CDN tag.
+"""
+
+import gzip
+import hashlib
+import logging
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from config import CHARTJS_PATH, PUBLIC_BASE_URL
+from http_cache import brotli, choose_encoding
+
+log = logging.getLogger(__name__)
+
+CHARTJS_CDN   = "https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"
+IMMUTABLE     = "public, max-age=31536000, immutable"
+
+_assets = None   # filename -> {"etag", "media_type", "identity", "gzip", "br"}
+_chartjs_name = None
+
+
+def _load_asset(path: str, stem: str, media_type: str):
+    """Read and precompress path; returns (hashed filename, variants) or None."""
+    try:
+        with open(path, "rb") as f:
+            body = f.read()
+    except OSError as e:
+        log.warning(f"Static asset {path} unavailable ({e}) — using CDN")
+        return None
+
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    name   = f"{stem}.{digest}.js"
+    variants = {
+        "etag":       f'"{digest}"',
+        "media_type": media_type,
+        "identity":   body,
+        "gzip":       gzip.compress(body, compresslevel=9),
+        "br":         brotli.compress(body) if brotli is not None else None,
+    }
+    log.info(
+        f"Static asset /static/{name}: {len(body)} B, gzip {len(variants['gzip'])} B"
+        + (f", br {len(variants['br'])} B" if variants["br"] else "")
+    )
+    return name, variants
+
+
+def _ensure_loaded() -> None:
+    global _assets, _chartjs_name
+    if _assets is not None:
+        return
+    _assets = {}
+    loaded  = _load_asset(CHARTJS_PATH, "chart", "application/javascript")
+    if loaded:
+        _chartjs_name, _assets[loaded[0]] = loaded
+
+
+def chartjs_src() -> str:
+    """Absolute content-hashed Chart.js URL, or the CDN URL if not bundled."""
+    _ensure_loaded()
+    if _chartjs_name is None:
+        return CHARTJS_CDN
+    return f"{PUBLIC_BASE_URL}/static/{_chartjs_name}"
+
+
+def static_response(request: Request, filename: str):
+    """Immutable response for a hashed asset, or None if unknown."""
+    _ensure_loaded()
+    asset = _assets.get(filename)
+    if asset is None:
+        return None
+
+    headers = {"Cache-Control": IMMUTABLE, "Vary": "Accept-Encoding", "ETag": asset["etag"]}
+    if request.headers.get("if-none-match", "") == asset["etag"]:
+        return Response(status_code=304, headers=headers)
+
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    body     = asset["identity"]
+    if encoding and asset.get(encoding):
+        body = asset[encoding]
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=asset["media_type"], headers=headers)
@@ -0,0 +1,194 @@
+"""
+summary_pool.py — D365 AI Sales & Revenue Intelligence
+Multiprocess map-reduce mode for summarise_sales_performance.
+
+  map     — lines are cut into SUMMARY_CHUNK_LINES chunks of compact tuples and
+            each chunk is reduced in a worker process to partial aggregates
+            (revenue / quantity sums plus order, product and customer key sets)
+  reduce  — partials are merged serially in the parent, in chunk order (sums
+            added, sets unioned), so first-seen order — and therefore sort
+            tie-breaking — is preserved. The merge stays serial on purpose:
+            shipping a partial to a worker and back costs several times more
+            than unioning it (400k lines in 58 chunks: ~3.5 s of pickling vs
+            ~0.7 s of merging), so a pairwise merge tree in the pool is slower.
+            Larger SUMMARY_CHUNK_LINES means fewer partials to merge
+  final   — distinct counts are taken from the merged sets and handed to
+            odata._finalise_summary, which does tiering and sorting once
+
+odata.summarise_sales_performance only routes here from SUMMARY_POOL_MIN_LINES
+lines, below that the in-process engines are faster than pickling the chunks.
+Workers are started with SUMMARY_START_METHOD (spawn or forkserver): forking
+the threaded server could copy a lock some other thread holds and deadlock
+the child. The server starts the pool at startup (start_pool), so the spawn
+cost is not paid by the first large summary.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from config import SUMMARY_WORKERS, SUMMARY_CHUNK_LINES, SUMMARY_POOL_MIN_LINES, SUMMARY_START_METHOD
+from odata import _finalise_summary
+
+log = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_count() -> int:
+    """SUMMARY_WORKERS, or the CPU count when it is 0."""
+    return SUMMARY_WORKERS or os.cpu_count() or 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Shared worker pool of worker_count() processes, never forked."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = worker_count()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(SUMMARY_START_METHOD),
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+            log.info(f"Summary worker pool started: {workers} {SUMMARY_START_METHOD} processes")
+        return _pool
+
+
+def start_pool() -> str:
+    """Create the pool and start every worker, when map-reduce mode can be used. Startup task."""
+    workers = worker_count()
+    if not SUMMARY_POOL_MIN_LINES or workers <= 1:
+        return "disabled"
+    pool = get_pool()
+    list(pool.map(_worker_pid, range(workers)))   # workers start on demand: spawn them all now
+    return f"{workers} processes"
+
+
+def _worker_pid(_) -> int:
+    return os.getpid()
+
+
+# ── Map ───────────────────────────────────────────────────────────────────────
+
+def reduce_chunk(rows: list) -> dict:
+    """
+    Reduce one chunk of (account, item, category, order, amount, qty, name)
+    tuples to partial aggregates. Runs in a worker process.
+    """
+    customers  = {}   # acct -> [revenue, orders, items, categories]
+    products   = {}   # item -> [name, revenue, quantity, customers]
+    categories = {}   # cat  -> [revenue, quantity, orders]
+    orders     = set()
+
+    for acct, item, cat, order, amount, qty, pname in rows:
+        orders.add(order)
+        if not acct:
+            continue
+
+        c = customers.get(acct)
+        if c is None:
+            c = customers[acct] = [0.0, set(), set(), set()]
+        c[0] += amount
+        c[1].add(order)
+        c[2].add(item)
+        c[3].add(cat)
+
+        p = products.get(item)
+        if p is None:
+            p = products[item] = [pname, 0.0, 0.0, set()]
+        p[1] += amount
+        p[2] += qty
+        p[3].add(acct)
+
+        g = categories.get(cat)
+        if g is None:
+            g = categories[cat] = [0.0, 0.0, set()]
+        g[0] += amount
+        g[1] += qty
+        g[2].add(order)
+
+    return {"customers": customers, "products": products, "categories": categories, "orders": orders}
+
+
+# ── Reduce ────────────────────────────────────────────────────────────────────
+
+def merge_partials(partials) -> dict:
+    """Merge partial aggregates serially, in order; earlier chunks keep first-seen position."""
+    merged = {"customers": {}, "products": {}, "categories": {}, "orders": set()}
+
+    for part in partials:
+        merged["orders"] |= part["orders"]
+
+        for acct, (rev, ords, items, cats) in part["customers"].items():
+            c = merged["customers"].get(acct)
+            if c is None:
+                merged["customers"][acct] = [rev, ords, items, cats]
+                continue
+            c[0] += rev
+            c[1] |= ords
+            c[2] |= items
+            c[3] |= cats
+
+        for item, (pname, rev, qty, custs) in part["products"].items():
+            p = merged["products"].get(item)
+            if p is None:
+                merged["products"][item] = [pname, rev, qty, custs]
+                continue
+            p[1] += rev
+            p[2] += qty
+            p[3] |= custs
+
+        for cat, (rev, qty, ords) in part["categories"].items():
+            g = merged["categories"].get(cat)
+            if g is None:
+                merged["categories"][cat] = [rev, qty, ords]
+                continue
+            g[0] += rev
+            g[1] += qty
+            g[2] |= ords
+
+    return merged
+
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+def summarise_parallel(records: list, chunk_lines: int = SUMMARY_CHUNK_LINES) -> dict:
+    """
+    Map-reduce summarise_sales_performance across the worker pool.
+    Same output structure as the in-process engines; per-key float sums are
+    added chunk by chunk, so they can differ from a single pass in the last
+    binary digit before rounding.
+    """
+    rows = [
+        (r["customer_account"], r["item_number"], r["category"] or "Other",
+         r["sales_order_num"], r["line_amount"], r["quantity"], r["product_name"])
+        for r in records
+    ]
+    chunk_lines = max(1, chunk_lines)
+    chunks = [rows[i:i + chunk_lines] for i in range(0, len(rows), chunk_lines)]
+    log.info(f"Map-reduce summary: {len(records)} lines in {len(chunks)} chunks")
+
+    merged = merge_partials(get_pool().map(reduce_chunk, chunks))
+
+    return _finalise_summary(
+        customers=[
+            (acct, rev, len(ords), len(items), len(cats))
+            for acct, (rev, ords, items, cats) in merged["customers"].items()
+        ],
+        products=[
+            (item, pname, rev, qty, len(custs))
+            for item, (pname, rev, qty, custs) in merged["products"].items()
+        ],
+        categories=[
+            (cat, rev, qty, len(ords))
+            for cat, (rev, qty, ords) in merged["categories"].items()
+        ],
+        grand_total=sum(r[4] for r in rows),
+        total_orders=len(merged["orders"]),
+        total_lines=len(records),
+    )
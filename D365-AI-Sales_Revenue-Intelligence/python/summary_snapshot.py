@@ -0,0 +1,168 @@
+"""
+summary_snapshot.py — D365 AI Sales & Revenue Intelligence
+On-disk snapshot of the last unfiltered summary + narrative per view, so a
+restarted server can answer /dashboard before its pipelines have warmed up.
+
+File layout (SNAPSHOT_PATH):
+
+    b"D365SNAP" | schema version (2 bytes, big-endian) | zlib(pickle(payload))
+    payload = {view: {"summary": dict, "narrative": str | None, "saved_at": epoch}}
+
+A view is a company code ("USMF") or the consolidated "ALL:USMF,DEMF". The
+file is rewritten atomically (temp file + fsync + os.replace), so a crash
+mid-write leaves the previous snapshot intact. On load the whole file is
+dropped if the schema version differs; views not matching the configured
+COMPANIES are ignored, and get() refuses entries older than
+SNAPSHOT_MAX_AGE_HOURS. Bump SNAPSHOT_SCHEMA whenever the summary dict shape
+changes.
+
+Unfiltered summaries carry "as_of" (revenue_pipeline.py: when the data last
+changed). save() uses it as the generation: the same as_of only attaches a
+new narrative (no rewrite otherwise), an older one is refused, so a late
+narrative cannot put a stale summary back over a newer snapshot.
+"""
+
+import logging
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from config import (
+    COMPANY,
+    COMPANIES,
+    SNAPSHOT_ENABLED,
+    SNAPSHOT_PATH,
+    SNAPSHOT_MAX_AGE_HOURS,
+)
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC  = b"D365SNAP"
+SNAPSHOT_SCHEMA = 1
+
+_entries = {}
+_lock    = threading.Lock()
+
+
+def view_key(summary: dict) -> str:
+    """Snapshot key for an unfiltered summary from revenue_pipeline.get_summary()."""
+    if summary.get("companies"):
+        return "ALL:" + ",".join(summary["companies"])
+    return str(summary.get("company") or COMPANY)
+
+
+def _valid_views() -> set:
+    companies = [str(c) for c in (COMPANIES or [COMPANY])]
+    return set(companies) | {"ALL:" + ",".join(companies)}
+
+
+# ── Load ──────────────────────────────────────────────────────────────────────
+
+def load(path: str = SNAPSHOT_PATH) -> int:
+    """Read the snapshot file into memory; returns the number of usable views."""
+    if not SNAPSHOT_ENABLED:
+        return 0
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        log.warning(f"Summary snapshot unreadable ({e}) — starting cold")
+        return 0
+
+    header = len(SNAPSHOT_MAGIC) + 2
+    if len(raw) < header or not raw.startswith(SNAPSHOT_MAGIC):
+        log.warning(f"Summary snapshot {path} is not a snapshot file — ignored")
+        return 0
+    (schema,) = struct.unpack(">H", raw[len(SNAPSHOT_MAGIC):header])
+    if schema != SNAPSHOT_SCHEMA:
+        log.info(f"Summary snapshot schema {schema} != {SNAPSHOT_SCHEMA} — ignored")
+        return 0
+
+    try:
+        payload = pickle.loads(zlib.decompress(raw[header:]))
+    except Exception as e:
+        log.warning(f"Summary snapshot corrupt ({e}) — ignored")
+        return 0
+
+    valid = _valid_views()
+    with _lock:
+        _entries.clear()
+        _entries.update({view: entry for view, entry in payload.items() if view in valid})
+    log.info(f"Summary snapshot loaded: {', '.join(_entries) or 'no matching views'}")
+    return len(_entries)
+
+
+def get(view: str):
+    """Snapshot entry for view if it exists and is younger than the max age."""
+    with _lock:
+        entry = _entries.get(view)
+    if entry is None:
+        return None
+    if time.time() - entry["saved_at"] > SNAPSHOT_MAX_AGE_HOURS * 3600:
+        return None
+    return entry
+
+
+def entries() -> dict:
+    with _lock:
+        return dict(_entries)
+
+
+# ── Save ──────────────────────────────────────────────────────────────────────
+
+def save(summary: dict, narrative: str = None, path: str = SNAPSHOT_PATH) -> bool:
+    """
+    Record summary (+ narrative) for its view and rewrite the file atomically.
+    False if nothing was written: unchanged, or older than the saved summary.
+    """
+    if not SNAPSHOT_ENABLED:
+        return False
+    view = view_key(summary)
+    with _lock:
+        current = _entries.get(view)
+        same    = False
+        if current is not None:
+            saved_as_of, as_of = current["summary"].get("as_of"), summary.get("as_of")
+            if saved_as_of is not None and as_of is not None:
+                if as_of < saved_as_of:
+                    log.info(f"Summary snapshot {view}: not replacing a newer summary with an older one")
+                    return False
+                same = as_of == saved_as_of
+            else:
+                same = current["summary"] is summary
+        if same and (not narrative or narrative == current["narrative"]):
+            return False   # nothing new
+        _entries[view] = {
+            "summary":   summary,
+            "narrative": narrative or (current["narrative"] if same else None),
+            # age is the age of the data, so attaching a narrative keeps it
+            "saved_at":  current["saved_at"] if same else time.time(),
+        }
+        data = SNAPSHOT_MAGIC + struct.pack(">H", SNAPSHOT_SCHEMA) + zlib.compress(
+            pickle.dumps(_entries, protocol=pickle.HIGHEST_PROTOCOL), 6
+        )
+        _write_atomic(path, data)
+    return True
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".snapshot-", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning(f"Summary snapshot write failed: {e}")
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
@@ -0,0 +1,256 @@
+"""
+summary_state.py — D365 AI Sales & Revenue Intelligence
+Mergeable, incrementally maintained aggregate state behind the summary.
+
+Per customer / product / category the state keeps revenue and quantity sums
+plus reference-counted distinct-key structures (Counter of order, item,
+category or customer → number of lines contributing it). That makes every
+aggregate reversible:
+
+    state.apply(new_lines)      — add lines
+    state.retract(old_lines)    — remove lines previously applied
+    state.merge(other_state)    — fold another state in (e.g. another company)
+    state.namespaced("DEMF")    — copy with customer and order keys prefixed by
+                                  the company, so merged entities stay distinct
+    state.to_summary()          — customer_stats / product_stats / category_stats
+                                  dict, same shape as summarise_sales_performance,
+                                  plus revenue_by_currency
+
+so a refresh costs O(changed lines) instead of O(history). The initial build
+(build_state) uses the NumPy engine for large histories. Retracting a line
+that was never applied is a caller error and leaves the state inconsistent.
+"""
+
+from collections import Counter
+
+from config import SUMMARY_ENGINE, SUMMARY_NUMPY_MIN_LINES
+from odata import _finalise_summary
+
+
+def _decrement(counter: Counter, key) -> None:
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+class SummaryState:
+    """Reversible sales aggregates; see module docstring."""
+
+    def __init__(self):
+        # acct -> [lines, revenue, Counter(order), Counter(item), Counter(category)]
+        self.customers  = {}
+        # item -> [lines, name, revenue, quantity, Counter(account)]
+        self.products   = {}
+        # category -> [lines, revenue, quantity, Counter(order)]
+        self.categories = {}
+        self.orders      = Counter()   # every line, with or without customer
+        # currency -> [lines, revenue]
+        self.currencies  = {}
+        self.grand_total = 0.0
+        self.total_lines = 0
+
+    # ── apply / retract ──
+
+    def apply(self, lines: list) -> None:
+        """Add lines (odata.fetch_sales_lines() shape) to the aggregates."""
+        for rec in lines:
+            acct   = rec["customer_account"]
+            item   = rec["item_number"]
+            cat    = rec["category"] or "Other"
+            order  = rec["sales_order_num"]
+            amount = rec["line_amount"]
+            qty    = rec["quantity"]
+            cur    = rec.get("currency") or "USD"
+
+            self.orders[order] += 1
+            self.grand_total   += amount
+            self.total_lines   += 1
+            m = self.currencies.get(cur)
+            if m is None:
+                m = self.currencies[cur] = [0, 0.0]
+            m[0] += 1
+            m[1] += amount
+            if not acct:
+                continue
+
+            c = self.customers.get(acct)
+            if c is None:
+                c = self.customers[acct] = [0, 0.0, Counter(), Counter(), Counter()]
+            c[0] += 1
+            c[1] += amount
+            c[2][order] += 1
+            c[3][item]  += 1
+            c[4][cat]   += 1
+
+            p = self.products.get(item)
+            if p is None:
+                p = self.products[item] = [0, rec["product_name"], 0.0, 0.0, Counter()]
+            p[0] += 1
+            p[2] += amount
+            p[3] += qty
+            p[4][acct] += 1
+
+            g = self.categories.get(cat)
+            if g is None:
+                g = self.categories[cat] = [0, 0.0, 0.0, Counter()]
+            g[0] += 1
+            g[1] += amount
+            g[2] += qty
+            g[3][order] += 1
+
+    def retract(self, lines: list) -> None:
+        """Remove lines that were previously applied."""
+        for rec in lines:
+            acct   = rec["customer_account"]
+            item   = rec["item_number"]
+            cat    = rec["category"] or "Other"
+            order  = rec["sales_order_num"]
+            amount = rec["line_amount"]
+            qty    = rec["quantity"]
+            cur    = rec.get("currency") or "USD"
+
+            _decrement(self.orders, order)
+            self.grand_total -= amount
+            self.total_lines -= 1
+            m = self.currencies[cur]
+            m[0] -= 1
+            m[1] -= amount
+            if m[0] == 0:
+                del self.currencies[cur]
+            if not acct:
+                continue
+
+            c = self.customers[acct]
+            c[0] -= 1
+            c[1] -= amount
+            _decrement(c[2], order)
+            _decrement(c[3], item)
+            _decrement(c[4], cat)
+            if c[0] == 0:
+                del self.customers[acct]
+
+            p = self.products[item]
+            p[0] -= 1
+            p[2] -= amount
+            p[3] -= qty
+            _decrement(p[4], acct)
+            if p[0] == 0:
+                del self.products[item]
+
+            g = self.categories[cat]
+            g[0] -= 1
+            g[1] -= amount
+            g[2] -= qty
+            _decrement(g[3], order)
+            if g[0] == 0:
+                del self.categories[cat]
+
+        if self.total_lines == 0:
+            self.grand_total = 0.0   # drop float residue once empty
+
+    # ── merge ──
+
+    def merge(self, other: "SummaryState") -> "SummaryState":
+        """Fold another state into this one (keys first seen here keep their position)."""
+        self.orders.update(other.orders)
+        self.grand_total += other.grand_total
+        self.total_lines += other.total_lines
+
+        for cur, (n, rev) in other.currencies.items():
+            m = self.currencies.setdefault(cur, [0, 0.0])
+            m[0] += n
+            m[1] += rev
+
+        for acct, (n, rev, ords, items, cats) in other.customers.items():
+            c = self.customers.setdefault(acct, [0, 0.0, Counter(), Counter(), Counter()])
+            c[0] += n
+            c[1] += rev
+            c[2].update(ords)
+            c[3].update(items)
+            c[4].update(cats)
+
+        for item, (n, pname, rev, qty, custs) in other.products.items():
+            p = self.products.setdefault(item, [0, pname, 0.0, 0.0, Counter()])
+            p[0] += n
+            p[2] += rev
+            p[3] += qty
+            p[4].update(custs)
+
+        for cat, (n, rev, qty, ords) in other.categories.items():
+            g = self.categories.setdefault(cat, [0, 0.0, 0.0, Counter()])
+            g[0] += n
+            g[1] += rev
+            g[2] += qty
+            g[3].update(ords)
+
+        return self
+
+    def namespaced(self, company: str) -> "SummaryState":
+        """
+        Copy with customer accounts and order numbers prefixed "COMPANY/" —
+        both are only unique within a legal entity. Items and categories are
+        shared master data and keep their keys.
+        """
+        tag = lambda key: f"{company}/{key}"
+        out = SummaryState()
+        out.orders      = Counter({tag(o): n for o, n in self.orders.items()})
+        out.currencies  = {cur: list(m) for cur, m in self.currencies.items()}
+        out.grand_total = self.grand_total
+        out.total_lines = self.total_lines
+        out.customers = {
+            tag(acct): [n, rev, Counter({tag(o): k for o, k in ords.items()}), Counter(items), Counter(cats)]
+            for acct, (n, rev, ords, items, cats) in self.customers.items()
+        }
+        out.products = {
+            item: [n, pname, rev, qty, Counter({tag(a): k for a, k in custs.items()})]
+            for item, (n, pname, rev, qty, custs) in self.products.items()
+        }
+        out.categories = {
+            cat: [n, rev, qty, Counter({tag(o): k for o, k in ords.items()})]
+            for cat, (n, rev, qty, ords) in self.categories.items()
+        }
+        return out
+
+    # ── output ──
+
+    def to_summary(self) -> dict:
+        """Render the current aggregates as a summarise_sales_performance dict."""
+        summary = _finalise_summary(
+            customers=[
+                (acct, rev, len(ords), len(items), len(cats))
+                for acct, (_, rev, ords, items, cats) in self.customers.items()
+            ],
+            products=[
+                (item, pname, rev, qty, len(custs))
+                for item, (_, pname, rev, qty, custs) in self.products.items()
+            ],
+            categories=[
+                (cat, rev, qty, len(ords))
+                for cat, (_, rev, qty, ords) in self.categories.items()
+            ],
+            grand_total=self.grand_total,
+            total_orders=len(self.orders),
+            total_lines=self.total_lines,
+        )
+        summary["revenue_by_currency"] = {
+            cur: round(rev, 2) for cur, (_, rev) in sorted(self.currencies.items())
+        }
+        return summary
+
+
+def build_state(lines: list) -> SummaryState:
+    """
+    SummaryState for lines. SUMMARY_ENGINE picks the build the same way it
+    picks the summarise_sales_performance engine: with numpy, "numpy" or
+    "auto" from SUMMARY_NUMPY_MIN_LINES lines builds from columns
+    (columnar.build_state_np); otherwise lines are apply()'d one by one.
+    """
+    if SUMMARY_ENGINE != "python":
+        import columnar
+        if columnar.available() and (
+            SUMMARY_ENGINE == "numpy" or len(lines) >= SUMMARY_NUMPY_MIN_LINES
+        ):
+            return columnar.build_state_np(lines)
+    state = SummaryState()
+    state.apply(lines)
+    return state
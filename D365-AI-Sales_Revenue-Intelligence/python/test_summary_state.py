@@ -0,0 +1,93 @@
+"""
+test_summary_state.py — D365 AI Sales & Revenue Intelligence
+Property test for summary_state.SummaryState: after random apply / retract
+rounds the incrementally maintained state equals a state rebuilt from the
+surviving lines, and to_summary() equals summarise_sales_performance();
+the NumPy build (columnar.build_state_np) equals a per-line apply().
+
+  python -m pytest -q test_summary_state.py
+
+Amounts and quantities are multiples of 0.5, so float sums are exact and
+the comparison does not depend on the order lines were added or removed.
+"""
+
+import random
+
+import pytest
+
+from odata import summarise_sales_performance
+from summary_state import SummaryState, build_state
+
+CUSTOMERS  = ["US-001", "US-002", "US-003", "DE-001", ""]
+CATEGORIES = ["Televisions", "Speakers", "Cables", ""]
+ITEMS      = 12
+ROUNDS     = 8
+
+
+def random_line(rnd: random.Random, lot: int) -> dict:
+    """Line dict shaped like odata.fetch_sales_lines() output."""
+    item = rnd.randrange(ITEMS)
+    return {
+        "lot_id":           f"LOT{lot:05d}",
+        "sales_order_num":  f"{rnd.randrange(30):06d}",
+        "customer_account": rnd.choice(CUSTOMERS),
+        "item_number":      f"T{item:04d}",
+        "product_name":     f"Product {item}",
+        "quantity":         rnd.randint(1, 40) / 2,
+        "line_amount":      rnd.randint(1, 50_000) / 2,
+        "currency":         rnd.choice(["USD", "USD", "EUR"]),
+        "category":         CATEGORIES[item % len(CATEGORIES)],
+    }
+
+
+def _normalised(summary: dict) -> dict:
+    """Order-insensitive view: ties in the revenue sort may come out either way."""
+    out = dict(summary)
+    out["customer_stats"] = sorted(summary["customer_stats"], key=lambda c: c["customer_account"])
+    out["product_stats"]  = sorted(summary["product_stats"], key=lambda p: p["item_number"])
+    return out
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_incremental_state_matches_rebuild(seed):
+    rnd   = random.Random(seed)
+    lot   = 0
+    lines = []
+    for _ in range(rnd.randint(0, 60)):
+        lines.append(random_line(rnd, lot))
+        lot += 1
+    state = build_state(lines)
+
+    for _ in range(ROUNDS):
+        removed = rnd.sample(lines, rnd.randint(0, len(lines)))
+        added   = [random_line(rnd, lot + i) for i in range(rnd.randint(0, 20))]
+        lot    += len(added)
+        gone    = {l["lot_id"] for l in removed}
+        lines   = [l for l in lines if l["lot_id"] not in gone] + added
+
+        state.retract(removed)
+        state.apply(added)
+
+        rebuilt = build_state(lines)
+        assert state.total_lines == rebuilt.total_lines == len(lines)
+        assert state.to_summary() == rebuilt.to_summary()
+
+    summary = state.to_summary()
+    summary.pop("revenue_by_currency")
+    assert _normalised(summary) == _normalised(summarise_sales_performance(lines))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_columnar_build_matches_apply(seed):
+    columnar = pytest.importorskip("columnar")
+    if not columnar.available():
+        pytest.skip("numpy not installed")
+    rnd   = random.Random(seed)
+    lines = [random_line(rnd, lot) for lot in range(rnd.randint(0, 200))]
+
+    applied = SummaryState()
+    applied.apply(lines)
+    built = columnar.build_state_np(lines)
+    assert vars(built) == vars(applied)
+    assert list(built.customers) == list(applied.customers)   # first-seen order drives sort ties
+    assert built.to_summary() == applied.to_summary()
@@ -0,0 +1,340 @@
+"""
+tracing.py — D365 AI Sales & Revenue Intelligence
+Distributed-trace style spans for one request, end to end (TRACING_ENABLED=true).
+
+  with tracing.trace("GET /dashboard", request_id) as t:   # server.py middleware
+      with tracing.span("odata.page", entity="SalesOrderLines") as s:
+          ...; s.set(rows=len(recs), bytes=len(r.content))
+  tracing.annotate(attempts=2)          # attributes on the innermost open span
+  pool.submit(tracing.bind(fn), ...)    # carry the trace into a worker thread
+  tracing.recent(20, "slowest")         # /debug/traces
+  tracing.get(request_id)               # one trace, spans flattened; tree() indents them
+
+The current trace and span live in a contextvar. asyncio tasks and
+asyncio.to_thread inherit it; ThreadPoolExecutor.submit / map do not, so
+work_pool, the partitioned OData fetch, the multi-company pipeline and the
+hedged OData requests wrap their callables with bind(). Work sent to a
+process pool is not traced inside — its stage span still has the timing.
+
+Outside a trace span() and annotate() do nothing, so startup / sync work in
+background threads pays one contextvar lookup. Background jobs a request
+starts but does not wait for (the dashboard narrative) run under their own
+trace whose parent is the request id.
+
+Finished traces go to a ring buffer of TRACE_BUFFER_SIZE and, only if
+TRACE_FILE is set, one JSON object per line to that file (rotated to
+TRACE_FILE.1 at TRACE_FILE_MAX_MB) from a writer thread. A caller's
+X-Request-ID that is already buffered or running gets a -2, -3... suffix, so
+it never overwrites another trace. Log records carry the request id via
+RequestIdFilter.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from config import TRACING_ENABLED, TRACE_BUFFER_SIZE, TRACE_FILE, TRACE_FILE_MAX_MB
+
+log = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("trace", default=None)   # (Trace, Span | None)
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+
+class Span:
+    """One timed operation inside a trace; set() adds attributes."""
+
+    __slots__ = ("trace", "id", "parent", "name", "attrs", "start_ms", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent, attrs: dict):
+        self.trace    = trace
+        self.id       = trace.next_id()
+        self.parent   = parent.id if parent is not None else None
+        self.name     = name
+        self.attrs    = attrs
+        self.start_ms = trace.elapsed_ms()
+        self.error    = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def end(self) -> None:
+        self.trace.add({
+            "id":          self.id,
+            "parent":      self.parent,
+            "name":        self.name,
+            "start_ms":    round(self.start_ms, 2),
+            "duration_ms": round(self.trace.elapsed_ms() - self.start_ms, 2),
+            "thread":      threading.current_thread().name,
+            "attrs":       self.attrs,
+            **({"error": self.error} if self.error else {}),
+        })
+
+
+class _NoSpan:
+    """What span() yields outside a trace."""
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    """All spans of one request (or background job)."""
+
+    def __init__(self, name: str, request_id: str = None, parent: str = None):
+        self.id       = request_id if request_id and _REQUEST_ID.match(request_id) else uuid.uuid4().hex[:16]
+        self.name     = name
+        self.parent   = parent
+        self.started  = time.time()
+        self.attrs    = {}
+        self.spans    = []
+        self.error    = None
+        self.duration_ms = None
+        self._t0      = time.perf_counter()
+        self._next    = 0
+        self._lock    = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            self._next += 1
+            return self._next
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    def add(self, span: dict) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "request_id":  self.id,
+            "name":        self.name,
+            "parent":      self.parent,
+            "started":     time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_ms": self.duration_ms,
+            "attrs":       self.attrs,
+            **({"error": self.error} if self.error else {}),
+            "spans":       spans,
+        }
+
+    def summary(self) -> dict:
+        with self._lock:
+            slowest = sorted(self.spans, key=lambda s: -s["duration_ms"])[:3]
+            count   = len(self.spans)
+        return {
+            "request_id":  self.id,
+            "name":        self.name,
+            "parent":      self.parent,
+            "started":     time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_ms": self.duration_ms,
+            "status":      self.attrs.get("status", "error" if self.error else None),
+            "spans":       count,
+            "slowest":     [f"{s['name']} {s['duration_ms']:.0f} ms" for s in slowest],
+        }
+
+
+# ── Recording ─────────────────────────────────────────────────────────────────
+
+@contextmanager
+def trace(name: str, request_id: str = None, **attrs):
+    """Run the block as a new trace; the enclosing trace, if any, becomes its parent."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    request_id = _claim(request_id)
+    outer = _current.get()
+    t = Trace(name, request_id, parent=outer[0].id if outer else None)
+    t.attrs.update(attrs)
+    token = _current.set((t, None))
+    try:
+        yield t
+    except BaseException as e:
+        t.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _finish(t)
+        with _lock:
+            _active.discard(t.id)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as a child of the current span; a no-op outside a trace."""
+    cur = _current.get()
+    if cur is None:
+        yield _NO_SPAN
+        return
+    s = Span(cur[0], name, cur[1], attrs)
+    token = _current.set((cur[0], s))
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def annotate(**attrs) -> None:
+    """Add attributes to the innermost open span (or the trace itself)."""
+    cur = _current.get()
+    if cur is not None:
+        (cur[1] or cur[0]).attrs.update(attrs)
+
+
+def bind(fn):
+    """fn, running in a copy of the caller's context — for thread pool submit / map."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+class RequestIdFilter(logging.Filter):
+    """Sets record.request_id ("-" outside a trace) for the log format."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        cur = _current.get()
+        record.request_id = cur[0].id if cur else "-"
+        return True
+
+
+def install_log_filter() -> None:
+    """Attach RequestIdFilter to every root handler (after logging.basicConfig)."""
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(RequestIdFilter())
+
+
+# ── Buffer and file ───────────────────────────────────────────────────────────
+
+_recent  = deque(maxlen=max(1, TRACE_BUFFER_SIZE))
+_by_id   = {}
+_lock    = threading.Lock()
+_queue   = queue.Queue(maxsize=1000)
+_writer  = None
+_counts  = {"traces": 0, "written": 0, "dropped": 0}
+_active  = set()   # ids of traces still running
+
+
+def _claim(request_id):
+    """A unique id: a caller's X-Request-ID already buffered or running gets a -2, -3... suffix."""
+    if not request_id or not _REQUEST_ID.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    with _lock:
+        rid, n = request_id, 1
+        while rid in _by_id or rid in _active:
+            n  += 1
+            rid = f"{request_id[:56]}-{n}"
+        _active.add(rid)
+    return rid
+
+
+def _finish(t: Trace) -> None:
+    t.duration_ms = round(t.elapsed_ms(), 2)
+    with _lock:
+        if len(_recent) == _recent.maxlen:
+            _by_id.pop(_recent[0].id, None)
+        _recent.append(t)
+        _by_id[t.id] = t
+        _counts["traces"] += 1
+    if TRACE_FILE:
+        _start_writer()
+        try:
+            _queue.put_nowait(t)
+        except queue.Full:
+            _counts["dropped"] += 1
+
+
+def _start_writer() -> None:
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="trace-writer", daemon=True)
+            _writer.start()
+
+
+def _write_loop() -> None:
+    while True:
+        t = _queue.get()
+        try:
+            _append(json.dumps(t.to_dict(), default=str))
+            _counts["written"] += 1
+        except Exception as e:
+            _counts["dropped"] += 1
+            log.warning(f"Trace write failed: {e}")
+
+
+def _append(line: str) -> None:
+    folder = os.path.dirname(TRACE_FILE)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > TRACE_FILE_MAX_MB * 1024 * 1024:
+        os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+# ── Viewing ───────────────────────────────────────────────────────────────────
+
+def recent(limit: int = 20, sort: str = "slowest", min_ms: float = 0.0) -> list:
+    """Summaries of buffered traces, slowest or most recent first."""
+    with _lock:
+        traces = [t for t in _recent if (t.duration_ms or 0) >= min_ms]
+    if sort == "slowest":
+        traces.sort(key=lambda t: -(t.duration_ms or 0))
+    else:
+        traces.reverse()
+    return [t.summary() for t in traces[:limit]]
+
+
+def get(request_id: str):
+    """One buffered trace as a dict, or None."""
+    with _lock:
+        t = _by_id.get(request_id)
+    return t.to_dict() if t else None
+
+
+def tree(data: dict) -> str:
+    """Indented text view of get(): one line per span with offset, duration and attributes."""
+    children = {}
+    for s in data["spans"]:
+        children.setdefault(s["parent"], []).append(s)
+
+    lines = [f"{data['name']}  {data['duration_ms']:.1f} ms  request_id={data['request_id']}"
+             + (f"  parent={data['parent']}" if data.get("parent") else "")
+             + "".join(f"  {k}={v}" for k, v in data["attrs"].items())]
+
+    def walk(parent, depth):
+        for s in children.get(parent, []):
+            attrs = "".join(f"  {k}={v}" for k, v in s["attrs"].items())
+            error = f"  ERROR {s['error']}" if s.get("error") else ""
+            lines.append(
+                f"{'  ' * depth}{s['name']:<{max(1, 34 - 2 * depth)}} "
+                f"+{s['start_ms']:>9.1f} ms {s['duration_ms']:>9.1f} ms  [{s['thread']}]{attrs}{error}"
+            )
+            walk(s["id"], depth + 1)
+
+    walk(None, 1)
+    return "\n".join(lines) + "\n"
+
+
+def stats() -> dict:
+    """Counters for /health."""
+    with _lock:
+        buffered = len(_recent)
+    return {**_counts, "buffered": buffered, "file": TRACE_FILE or None}
@@ -0,0 +1,145 @@
+"""
+work_pool.py — D365 AI Sales & Revenue Intelligence
+Runs blocking / CPU-bound request stages off the asyncio event loop.
+
+  run_stage("summary", get_summary, ...)       — thread pool: the stage reads
+                                                 in-process state (pipelines,
+                                                 stores) and does OData I/O
+  run_stage("render", build_..., cpu=True)     — WORK_EXECUTOR pool: "thread"
+                                                 (default) or "process" for pure
+                                                 functions of picklable args
+
+Every stage is bounded by WORK_TIMEOUT_SECONDS, except the stages that may
+run an OData sync (SYNC_STAGES), which use WORK_SYNC_TIMEOUT_SECONDS (0, the
+default, waits as long as the sync takes: a cold full sync can run for
+minutes). On timeout, or when the awaiting request is cancelled, work still
+waiting in the queue is cancelled; a stage already running in a thread cannot
+be interrupted and finishes in the background (its result is discarded). A
+sync abandoned that way still holds its pipeline's sync_lock, so
+CompanyPipeline.refresh() does not queue further refreshes behind it. Per-stage queue wait (submit → start)
+and run time are recorded and exposed through stats() on /health, and each
+stage is a "stage:<name>" span of the request trace (tracing.py); thread
+stages run inside the trace, so their OData / prompt spans nest under it.
+"""
+
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import WORK_EXECUTOR, WORK_WORKERS, WORK_TIMEOUT_SECONDS, WORK_SYNC_TIMEOUT_SECONDS
+import tracing
+
+log = logging.getLogger(__name__)
+
+_io_pool  = None
+_cpu_pool = None
+_pools_lock = threading.Lock()
+
+# stages that may sync a store from OData (get_summary, refresh, drill-down, raw fetch)
+SYNC_STAGES = {"summary", "sync", "drilldown", "fetch"}
+
+_stats      = {}   # stage -> counters, see _record()
+_stats_lock = threading.Lock()
+
+
+class StageTimeout(RuntimeError):
+    """A stage did not finish within its timeout."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"{stage} stage timed out after {timeout:g}s")
+        self.stage = stage
+
+
+def _pools() -> tuple:
+    """(io_pool, cpu_pool), created on first use."""
+    global _io_pool, _cpu_pool
+    with _pools_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=WORK_WORKERS, thread_name_prefix="stage")
+            atexit.register(_io_pool.shutdown, wait=False, cancel_futures=True)
+            if WORK_EXECUTOR == "process":
+                _cpu_pool = ProcessPoolExecutor(max_workers=WORK_WORKERS)
+                atexit.register(_cpu_pool.shutdown, wait=False, cancel_futures=True)
+            else:
+                _cpu_pool = _io_pool
+            log.info(f"Stage executor: {WORK_WORKERS} workers, CPU stages on {WORK_EXECUTOR} pool")
+        return _io_pool, _cpu_pool
+
+
+def _timed_call(fn, submitted: float, args: tuple, kwargs: dict) -> tuple:
+    """Worker-side wrapper: (result, queue_ms, run_ms). Top-level so it pickles."""
+    started = time.time()
+    result  = fn(*args, **kwargs)
+    return result, (started - submitted) * 1000, (time.time() - started) * 1000
+
+
+async def run_stage(stage: str, fn, *args, cpu: bool = False, timeout: float = None, **kwargs):
+    """Await fn(*args, **kwargs) on the stage executor; raises StageTimeout. timeout 0 = none."""
+    io_pool, cpu_pool = _pools()
+    pool = cpu_pool if cpu else io_pool
+    if timeout is None:
+        timeout = WORK_SYNC_TIMEOUT_SECONDS if stage in SYNC_STAGES else WORK_TIMEOUT_SECONDS
+
+    with tracing.span(f"stage:{stage}", pool="cpu" if cpu else "io") as span:
+        # a process pool cannot take the contextvars context; its stage span still has the timing
+        call   = _timed_call if isinstance(pool, ProcessPoolExecutor) else tracing.bind(_timed_call)
+        future = asyncio.wrap_future(pool.submit(call, fn, time.time(), args, kwargs))
+        try:
+            # wait_for cancels the wrapped future on timeout / cancellation, which
+            # cancels the pool task if it has not started yet
+            result, queue_ms, run_ms = await asyncio.wait_for(future, timeout or None)
+        except asyncio.TimeoutError:
+            _record(stage, outcome="timeouts")
+            log.warning(f"Stage '{stage}' timed out after {timeout:g}s; it keeps running in its thread")
+            raise StageTimeout(stage, timeout) from None
+        except asyncio.CancelledError:
+            _record(stage, outcome="cancelled")
+            raise
+        except Exception:
+            _record(stage, outcome="errors")
+            raise
+        span.set(queue_ms=round(queue_ms, 1), run_ms=round(run_ms, 1))
+
+    _record(stage, queue_ms=queue_ms, run_ms=run_ms)
+    if queue_ms > 100:
+        log.info(f"Stage '{stage}' queued {queue_ms:.0f} ms, ran {run_ms:.0f} ms")
+    return result
+
+
+# ── Instrumentation ───────────────────────────────────────────────────────────
+
+def _record(stage: str, queue_ms: float = None, run_ms: float = None, outcome: str = "ok") -> None:
+    with _stats_lock:
+        s = _stats.setdefault(stage, {
+            "ok": 0, "errors": 0, "timeouts": 0, "cancelled": 0,
+            "queue_ms_total": 0.0, "queue_ms_max": 0.0,
+            "run_ms_total": 0.0, "run_ms_max": 0.0,
+        })
+        s[outcome] += 1
+        if queue_ms is not None:
+            s["queue_ms_total"] += queue_ms
+            s["queue_ms_max"]    = max(s["queue_ms_max"], queue_ms)
+            s["run_ms_total"]   += run_ms
+            s["run_ms_max"]      = max(s["run_ms_max"], run_ms)
+
+
+def stats() -> dict:
+    """Per-stage counts plus average / max queue and run time in ms."""
+    with _stats_lock:
+        out = {}
+        for stage, s in _stats.items():
+            n = s["ok"] or 1
+            out[stage] = {
+                "ok":           s["ok"],
+                "errors":       s["errors"],
+                "timeouts":     s["timeouts"],
+                "cancelled":    s["cancelled"],
+                "queue_ms_avg": round(s["queue_ms_total"] / n, 1),
+                "queue_ms_max": round(s["queue_ms_max"], 1),
+                "run_ms_avg":   round(s["run_ms_total"] / n, 1),
+                "run_ms_max":   round(s["run_ms_max"], 1),
+            }
+        return {"executor": WORK_EXECUTOR, "workers": WORK_WORKERS, "stages": out}
@@ -12,13 +12,15 @@ Responsibilities:
     and fetches it via odata.py
   - Prompt building: formats D365 data into a structured prompt that guides
     the LLM to give accurate, professional business answers
-  - Ollama integration: sends prompts to the local qwen3:8b model and
-    returns the generated answer
+  - Ollama integration: sends prompts to the qwen3:8b model on the
+    least-loaded healthy backend (ollama_pool.py) and returns the answer
 
 Dependencies:
-  - httpx: async HTTP client for Ollama API calls
+  - ollama_pool.py: Ollama backend selection, failover and health checks
+  - tracing.py: an "ollama" span per attempt with model and token counts
+  - model_router.py: model and options per intent route
   - odata.py: for fetching D365 data
-  - config.py: Ollama URL and model name
+  - config.py: Ollama model name
 
 Usage:
   from ai_engine import detect_intent, fetch_context, build_prompt, call_ollama, warm_up_ollama
@@ -36,20 +38,35 @@ Notes:
     is not supported via URL parameters
   - Customer credit data (CreditLimit, PaymentTerms) is fetched from
     CustomersV3 entity when risk or credit questions are detected
-  - Ollama model is kept warm via a keep-alive ping on startup
+  - Backorder questions read the precomputed backorder digest
+    (backorder_digest.py, built by load_backorder_digest) while it is
+    fresh, instead of scanning orders and joining credit data live
+  - Ollama model is kept warm via a keep-alive ping on startup (run as a
+    background startup task, see startup_tasks.py)
 """
 
 import re
+import time
 import logging
 import asyncio
-import httpx
+from datetime import datetime, timezone
 
-from config import OLLAMA_URL, OLLAMA_MODEL, ODATA_BASE_URL, COMPANY
-from odata import fetch_odata, fetch_odata_entity, HEADER_FIELDS
+from config import OLLAMA_MODEL, ODATA_BASE_URL, COMPANY
+from odata import fetch_odata, fetch_odata_entity, count_odata, HEADER_FIELDS
+from ollama_pool import pool
+from model_router import ROUTES, model_for, mark_missing, record as record_route
+import backorder_digest
+import tracing
 
 log = logging.getLogger(__name__)
 
 
+# ── FETCH LIMITS ──────────────────────────────────────────────────────────────
+
+CUSTOMER_ORDERS_TOP = 50     # newest orders read for a customer history question
+BACKORDER_SCAN_TOP  = 5000   # orders scanned for backorders (filtered in Python)
+
+
 # ── CUSTOMER FIELDS ───────────────────────────────────────────────────────────
 
 # Fields fetched from CustomersV3 for credit and risk analysis
@@ -66,31 +83,38 @@ CUSTOMER_FIELDS = (
 
 async def warm_up_ollama():
     """
-    Send a lightweight ping to Ollama on startup to load the model into memory.
+    Send a lightweight ping to every Ollama backend on startup to load the
+    models used by the routing table (model_router.py) into memory on each
+    of them.
 
     This prevents the first real request from timing out due to model load time.
     Called once during FastAPI startup. Failures are logged but not fatal.
 
     The keep_alive value of "10m" tells Ollama to keep the model in memory
     for 10 minutes after the last request, reducing cold-start delays.
+
+    Returns:
+        bool: True if OLLAMA_MODEL answered on at least one backend, False otherwise
     """
-    payload = {
-        "model":      OLLAMA_MODEL,
-        "messages":   [{"role": "user", "content": "hello"}],
-        "stream":     False,
-        "keep_alive": "10m",
-        "options":    {"num_predict": 5}
-    }
-    try:
-        log.info(f"Warming up Ollama model: {OLLAMA_MODEL}")
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            r = await client.post(f"{OLLAMA_URL}/api/chat", json=payload)
-            if r.status_code == 200:
-                log.info("Ollama warm-up complete — model loaded into memory")
-            else:
-                log.warning(f"Ollama warm-up returned status {r.status_code}")
-    except Exception as e:
-        log.warning(f"Ollama warm-up failed (non-fatal): {e}")
+    ok = False
+    models = [OLLAMA_MODEL] + sorted({r["model"] for r in ROUTES.values()} - {OLLAMA_MODEL})
+    for model in models:
+        payload = {
+            "model":      model,
+            "messages":   [{"role": "user", "content": "hello"}],
+            "stream":     False,
+            "keep_alive": "10m",
+            "options":    {"num_predict": 5}
+        }
+        try:
+            log.info(f"Warming up Ollama model: {model} on {len(pool.backends)} backend(s)")
+            loaded = await pool.each("/api/chat", payload, timeout=300.0)
+            if any(loaded):
+                log.info(f"Ollama warm-up complete — {model} loaded on {sum(loaded)}/{len(loaded)} backends")
+                ok = ok or model == OLLAMA_MODEL
+        except Exception as e:
+            log.warning(f"Ollama warm-up of {model} failed (non-fatal): {e}")
+    return ok
 
 
 # ── INTENT DETECTION ──────────────────────────────────────────────────────────
@@ -186,10 +210,20 @@ def fetch_context(intent):
             - backorders      (list): List of backorder records
             - recent_orders   (list): List of most recent orders
             - customers       (list): Customer master data with credit info
+            - backorder_groups (list): (account, [order numbers]) per customer,
+                                       when the backorders came from the digest
+            - backorder_source (str):  "digest" or "live"
+            - backorder_scan_capped (bool): The scan hit BACKORDER_SCAN_TOP,
+                                            so older backorders may be missing
+            - customer_order_total (int): Exact order count ($count) when the
+                                          customer has CUSTOMER_ORDERS_TOP or
+                                          more orders; None if $count failed
+            - data_as_of       (str):  UTC timestamp of the backorder data
 
     Notes:
-        - Backorders require fetching up to 5000 records and filtering in Python
-          because F&O OData does not support enum value filtering in URL
+        - Backorders are read from the backorder digest while it is fresh;
+          otherwise they require fetching up to 5000 records and filtering
+          in Python because F&O OData does not support enum value filtering in URL
         - Customer orders are sorted newest first (OrderCreationDateTime desc)
         - Credit data is fetched from CustomersV3 entity
     """
@@ -212,20 +246,48 @@ def fetch_context(intent):
             "SalesOrderHeadersV2",
             filters=f"OrderingCustomerAccountNumber eq '{intent['customer_id']}'",
             select=HEADER_FIELDS,
-            top=50,
+            top=CUSTOMER_ORDERS_TOP,
             orderby="OrderCreationDateTime desc"
         )
         context["customer_orders"] = records
         context["customer_id"]     = intent["customer_id"]
         log.info(f"Customer orders: {len(records)} orders for {intent['customer_id']}")
 
-    # Fetch all orders and filter backorders in Python
+        # Only the newest CUSTOMER_ORDERS_TOP were read — $count gives the exact total
+        if len(records) >= CUSTOMER_ORDERS_TOP:
+            context["customer_order_total"] = count_odata(
+                "SalesOrderHeadersV2",
+                filters=f"OrderingCustomerAccountNumber eq '{intent['customer_id']}'"
+            )
+
+    # Backorders come from the precomputed digest while it is fresh
+    digest = backorder_digest.current() if intent["fetch_backorders"] else None
+    if digest is not None:
+        with tracing.span("backorder_digest", built_at=digest["built_at"]) as span:
+            backorders = digest["records"]
+            groups     = digest["groups"]
+            if intent["customer_id"]:
+                backorders = [
+                    o for o in backorders
+                    if o.get("OrderingCustomerAccountNumber") == intent["customer_id"]
+                ]
+                groups = [g for g in groups if g[0] == intent["customer_id"]]
+            span.set(rows=len(backorders))
+        context["backorders"]       = backorders
+        context["backorder_groups"] = groups
+        context["backorder_source"] = "digest"
+        context["backorder_scan_capped"] = digest["scanned"] >= BACKORDER_SCAN_TOP
+        context["data_as_of"]       = digest["built_at"]
+        log.info(f"Backorders: {len(backorders)} from the digest built at {digest['built_at']}")
+
+    # Otherwise fetch all orders and filter backorders in Python
     # (OData enum filtering not supported for SalesOrderStatus)
-    if intent["fetch_backorders"]:
+    elif intent["fetch_backorders"]:
+        context["data_as_of"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
         all_orders = fetch_odata(
             "SalesOrderHeadersV2",
             select=HEADER_FIELDS,
-            top=5000
+            top=BACKORDER_SCAN_TOP
         )
         backorders = [o for o in all_orders if o.get("SalesOrderStatus") == "Backorder"]
         log.info(f"Backorders: {len(backorders)} from {len(all_orders)} total orders")
@@ -237,7 +299,9 @@ def fetch_context(intent):
                 if o.get("OrderingCustomerAccountNumber") == intent["customer_id"]
             ]
 
-        context["backorders"] = backorders
+        context["backorders"]       = backorders
+        context["backorder_source"] = "live"
+        context["backorder_scan_capped"] = len(all_orders) >= BACKORDER_SCAN_TOP
 
     # Fetch most recent orders for summary questions
     if intent["fetch_recent"] and not intent["fetch_order"] and not intent["fetch_customer"]:
@@ -250,8 +314,17 @@ def fetch_context(intent):
         context["recent_orders"] = records
         log.info(f"Recent orders: {len(records)} orders")
 
+    # Credit data of the backorder customers is part of the digest
+    digest_credit = None
+    if digest is not None and intent["fetch_credit"]:
+        accounts      = [intent["customer_id"]] if intent["customer_id"] else [g[0] for g in context["backorder_groups"]]
+        digest_credit = [digest["customers"][a] for a in accounts if a in digest["customers"]]
+    if digest_credit:
+        context["customers"] = digest_credit
+        log.info(f"Customer credit data: {len(digest_credit)} customers from the digest")
+
     # Fetch customer credit and master data for risk/credit questions
-    if intent["fetch_credit"]:
+    elif intent["fetch_credit"]:
         # If specific customer requested fetch only that customer
         if intent["customer_id"]:
             filters = f"dataAreaId eq '{COMPANY}' and CustomerAccount eq '{intent['customer_id']}'"
@@ -270,6 +343,52 @@ def fetch_context(intent):
     return context
 
 
+# ── BACKORDER DIGEST ──────────────────────────────────────────────────────────
+
+DIGEST_CREDIT_BATCH = 20   # customer accounts per CustomersV3 request
+
+
+def load_backorder_digest():
+    """
+    Scan for backorders and join their customers' credit data — the loader
+    backorder_digest.py runs on its schedule and on demand.
+
+    Returns:
+        dict: A digest from backorder_digest.build()
+
+    Raises:
+        AOSUnavailableError: D365 could not be reached
+
+    Notes:
+        - Credit data is fetched for exactly the customers with backorders,
+          DIGEST_CREDIT_BATCH accounts per request, not the first 100 customers
+        - Runs off the request path, so it uses the "background" circuit
+          breaker rather than the one user requests fail fast on
+    """
+    all_orders = fetch_odata(
+        "SalesOrderHeadersV2",
+        select=HEADER_FIELDS,
+        top=BACKORDER_SCAN_TOP,
+        circuit="background"
+    )
+    backorders = [o for o in all_orders if o.get("SalesOrderStatus") == "Backorder"]
+    accounts   = sorted({o.get("OrderingCustomerAccountNumber") for o in backorders} - {None, ""})
+
+    customers = []
+    for i in range(0, len(accounts), DIGEST_CREDIT_BATCH):
+        batch = accounts[i:i + DIGEST_CREDIT_BATCH]
+        match = " or ".join(f"CustomerAccount eq '{a}'" for a in batch)
+        customers += fetch_odata_entity(
+            "CustomersV3",
+            filters=f"dataAreaId eq '{COMPANY}' and ({match})",
+            select=CUSTOMER_FIELDS,
+            top=len(batch),
+            circuit="background"
+        )
+
+    return backorder_digest.build(backorders, customers, len(all_orders))
+
+
 # ── PROMPT BUILDER ────────────────────────────────────────────────────────────
 
 def build_prompt(question, context, intent):
@@ -344,7 +463,7 @@ ORDER DETAILS:
 
         data += f"""
 CUSTOMER {cust_id} ORDER HISTORY:
-  Total Orders    : {len(orders)}
+  Total Orders    : {context.get('customer_order_total') or len(orders)}
   Status Breakdown: {', '.join(f'{v} {k}' for k, v in counts.items())}
   Date Range      : {oldest} to {newest}
   Currency        : {orders[0].get('CurrencyCode') if orders else 'N/A'}
@@ -361,13 +480,18 @@ CUSTOMER {cust_id} ORDER HISTORY:
     if context.get("backorders") is not None:
         backorders = context["backorders"]
         data += f"\nBACKORDERS:\n  Total: {len(backorders)}\n"
+        if context.get("data_as_of"):
+            data += f"  Data as of: {context['data_as_of']}\n"
+        if context.get("backorder_scan_capped"):
+            data += f"  Note: only {BACKORDER_SCAN_TOP} orders were scanned, so this total may be incomplete\n"
 
         if backorders:
-            # Group backorders by customer account
-            by_cust = {}
-            for o in backorders:
-                c = o.get("OrderingCustomerAccountNumber", "Unknown")
-                by_cust.setdefault(c, []).append(o.get("SalesOrderNumber"))
+            # Group backorders by customer account (already grouped in the digest)
+            by_cust = dict(context.get("backorder_groups") or [])
+            if not by_cust:
+                for o in backorders:
+                    c = o.get("OrderingCustomerAccountNumber", "Unknown")
+                    by_cust.setdefault(c, []).append(o.get("SalesOrderNumber"))
 
             # Sort by number of backorders descending so worst customers appear first
             # Only include customers with more than 1 backorder to keep prompt concise
@@ -442,24 +566,33 @@ CUSTOMER {cust_id} ORDER HISTORY:
 
 # ── OLLAMA INTEGRATION ────────────────────────────────────────────────────────
 
-async def call_ollama(prompt):
+async def call_ollama(prompt, route="default"):
     """
     Send a prompt to the local Ollama LLM and return the generated answer.
 
-    Uses async httpx for non-blocking HTTP calls. Connects to the locally
-    running Ollama service on localhost:11434.
+    The model and options come from the route's entry in
+    model_router.ROUTES: plain order lookups go to the small
+    OLLAMA_FAST_MODEL, credit and backorder analysis to OLLAMA_MODEL.
+    If the route's model is not installed (Ollama 404), OLLAMA_MODEL
+    answers instead, and the model is marked missing so later requests
+    on the route go straight to OLLAMA_MODEL (model_router.model_for).
 
-    Includes automatic retry logic: if the first attempt fails, the model
-    is re-warmed and one retry is attempted before returning an error.
+    Uses async httpx for non-blocking HTTP calls via ollama_pool, which
+    picks the least-loaded healthy backend from OLLAMA_URLS and fails over
+    to the next one on connection errors, timeouts and 5xx.
+
+    Includes automatic retry logic: if no backend answers, the model is
+    re-warmed and one retry is attempted before returning an error.
 
     Args:
         prompt (str): Complete prompt string from build_prompt()
+        route  (str): Route name from model_router.route_for(intent)
 
     Returns:
         str: Generated answer text from the LLM
              Error message string if Ollama is unreachable after retry
 
-    Model settings:
+    Model settings (default route):
         - model:       qwen3:8b (configured in config.py)
         - think:       False — disables chain-of-thought for faster responses
         - temperature: 0.2 — low for consistent, factual business answers
@@ -467,37 +600,54 @@ async def call_ollama(prompt):
         - keep_alive:  10m — keeps model in memory between requests
     """
     payload = {
-        "model":      OLLAMA_MODEL,
+        "model":      model_for(route),
         "messages":   [{"role": "user", "content": prompt}],
         "stream":     False,
         "think":      False,
         "keep_alive": "10m",
-        "options":    {
-            "temperature": 0.2,
-            "num_predict": 600
-        }
+        "options":    dict(ROUTES[route]["options"])
     }
+    started  = time.perf_counter()
+    fallback = payload["model"] != ROUTES[route]["model"]
 
     for attempt in range(2):  # Try twice — second attempt after re-warm
-        try:
-            if attempt == 1:
-                log.info("Retrying Ollama after warm-up pause...")
-                await warm_up_ollama()
-                await asyncio.sleep(3)
-
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                r = await client.post(f"{OLLAMA_URL}/api/chat", json=payload)
-
+        with tracing.span("ollama", attempt=attempt + 1, route=route, model=payload["model"],
+                          fallback=fallback, prompt_chars=len(prompt)) as span:
+            try:
+                if attempt == 1:
+                    log.info("Retrying Ollama after warm-up pause...")
+                    await warm_up_ollama()
+                    await asyncio.sleep(3)
+
+                r = await pool.post("/api/chat", payload, timeout=300.0)
+
+                # Route model not pulled on this host — answer with the main model
+                if r.status_code == 404 and payload["model"] != OLLAMA_MODEL:
+                    log.warning(f"Ollama model {payload['model']} not found — falling back to {OLLAMA_MODEL}")
+                    mark_missing(payload["model"])
+                    payload["model"] = OLLAMA_MODEL
+                    fallback = True
+                    span.set(model=OLLAMA_MODEL, fallback=True)
+                    r = await pool.post("/api/chat", payload, timeout=300.0)
+
+                span.set(status=r.status_code)
                 if r.status_code == 200:
-                    answer = r.json().get("message", {}).get("content", "No response.")
-                    log.info(f"Ollama responded with {len(answer)} characters")
+                    body   = r.json()
+                    answer = body.get("message", {}).get("content", "No response.")
+                    span.set(prompt_tokens=body.get("prompt_eval_count"), output_tokens=body.get("eval_count"),
+                             chars=len(answer))
+                    log.info(f"Ollama ({route}: {payload['model']}) responded with {len(answer)} characters")
+                    record_route(route, time.perf_counter() - started, ok=True, fallback=fallback)
                     return answer
 
                 log.error(f"Ollama error {r.status_code}: {r.text[:200]}")
 
-        except Exception as e:
-            log.error(f"Ollama attempt {attempt + 1} failed: {e}")
-            if attempt == 1:
-                return f"Cannot reach Ollama after retry: {e}"
+            except Exception as e:
+                span.set(error=str(e) or type(e).__name__)
+                log.error(f"Ollama attempt {attempt + 1} failed: {e}")
+                if attempt == 1:
+                    record_route(route, time.perf_counter() - started, ok=False, fallback=fallback)
+                    return f"Cannot reach Ollama after retry: {e}"
 
+    record_route(route, time.perf_counter() - started, ok=False, fallback=fallback)
     return "Ollama did not respond after retry. Please check that Ollama is running."
@@ -0,0 +1,272 @@
+"""
+backorder_digest.py — Precomputed Backorder Digest
+==================================================
+Keeps the data behind backorder questions — the most frequent and most
+expensive ones — precomputed in memory, so a backorder question no longer
+scans BACKORDER_SCAN_TOP sales order headers, groups them by customer and
+joins CustomersV3 credit data on every request.
+
+Responsibilities:
+  - Building the digest from one backorder scan: every backorder header,
+    per-customer counts and order numbers, and each backorder customer's
+    credit limit, payment terms, on-hold status and credit status
+  - Refreshing it every BACKORDER_DIGEST_REFRESH_MINUTES in a background
+    task, and on demand (POST /backorder-digest/refresh)
+  - Serving it to fetch_context() while it is younger than
+    BACKORDER_DIGEST_MAX_AGE_MINUTES, with the time it was built
+  - Refresh statistics for /health
+
+Usage:
+  from backorder_digest import build, current, refresh, start, stats, top_customers
+
+  start(load_backorder_digest)       # startup hook; the loader fetches and calls build()
+  digest = current()                 # None -> query D365 live
+  digest["built_at"], digest["records"], digest["groups"], digest["customers"]
+  await refresh("on_demand")         # rebuild now (joins a refresh already running)
+
+Notes:
+  - The loader (ai_engine.load_backorder_digest) runs in a worker thread;
+    the new digest replaces the old one in a single assignment, so readers
+    never see a half-built digest. Its OData calls use the "background"
+    circuit breaker (resilience.py), so a failing scan does not open the
+    circuit for user requests
+  - A failed refresh keeps the previous digest and is retried after at
+    most a minute; once the digest is older than the maximum age, backorder
+    questions go back to querying D365 live
+  - Answers built from the digest carry its timestamp (see server.py)
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import tracing
+from config import (
+    BACKORDER_DIGEST_ENABLED,
+    BACKORDER_DIGEST_REFRESH_MINUTES,
+    BACKORDER_DIGEST_MAX_AGE_MINUTES,
+)
+
+log = logging.getLogger(__name__)
+
+RETRY_SECONDS = 60   # wait after a failed scheduled refresh, if shorter than the interval
+
+_digest  = None
+_loader  = None
+_running = None   # asyncio.Task of the refresh in progress
+_task    = None   # the scheduled refresh loop
+_counts  = {"refreshes": 0, "failures": 0, "on_demand": 0, "served": 0, "stale": 0}
+_last    = {"error": None, "build_ms": None}
+_lock    = threading.Lock()   # _counts is updated from request threads (current())
+
+
+def _count(name):
+    with _lock:
+        _counts[name] += 1
+
+
+# ── BUILDING ──────────────────────────────────────────────────────────────────
+
+def build(backorders, customers, scanned):
+    """
+    Build a digest from one backorder scan.
+
+    Args:
+        backorders (list): Sales order headers with SalesOrderStatus "Backorder"
+        customers  (list): CustomersV3 records of the customers with backorders
+        scanned    (int):  Number of headers scanned to find them
+
+    Returns:
+        dict: The digest —
+            - built_at  (str):   UTC ISO timestamp of the scan
+            - built_ts  (float): The same as epoch seconds
+            - scanned   (int):   Headers scanned
+            - records   (list):  Every backorder header
+            - groups    (list):  (account, [order numbers]) per customer,
+                                 most backorders first
+            - customers (dict):  account -> CustomersV3 record
+    """
+    by_cust = {}
+    for o in backorders:
+        by_cust.setdefault(o.get("OrderingCustomerAccountNumber", "Unknown"), []).append(o.get("SalesOrderNumber"))
+
+    now = time.time()
+    return {
+        "built_at":  datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "built_ts":  now,
+        "scanned":   scanned,
+        "records":   backorders,
+        "groups":    sorted(by_cust.items(), key=lambda kv: len(kv[1]), reverse=True),
+        "customers": {c.get("CustomerAccount"): c for c in customers},
+    }
+
+
+def as_of_text(built_at):
+    """'2026-10-19T14:05:12Z' -> 'October 19 2026 at 14:05 UTC', for answers."""
+    d = datetime.strptime(built_at, "%Y-%m-%dT%H:%M:%SZ")
+    return f"{d.strftime('%B')} {d.day} {d.year} at {d.strftime('%H:%M')} UTC"
+
+
+# ── SERVING ───────────────────────────────────────────────────────────────────
+
+def current():
+    """
+    The digest, if there is one younger than BACKORDER_DIGEST_MAX_AGE_MINUTES.
+
+    Returns:
+        dict: The digest (see build())
+        None: Disabled, not built yet, or too old — query D365 live
+    """
+    digest = _digest
+    if not BACKORDER_DIGEST_ENABLED or digest is None:
+        return None
+    if time.time() - digest["built_ts"] > BACKORDER_DIGEST_MAX_AGE_MINUTES * 60:
+        _count("stale")
+        return None
+    _count("served")
+    return digest
+
+
+# ── REFRESHING ────────────────────────────────────────────────────────────────
+
+async def refresh(trigger="scheduled"):
+    """
+    Rebuild the digest now. A call made while a refresh is running waits
+    for that refresh instead of starting another scan.
+
+    Args:
+        trigger (str): "scheduled" or "on_demand", for the statistics
+
+    Returns:
+        dict: The new digest
+
+    Raises:
+        RuntimeError:        No loader registered (start() not called)
+        AOSUnavailableError: D365 could not be reached; the old digest is kept
+    """
+    global _running
+    if _loader is None:
+        raise RuntimeError("Backorder digest loader not registered — call start() first")
+    if trigger == "on_demand":
+        _count("on_demand")
+    if _running is None or _running.done():
+        _running = asyncio.get_running_loop().create_task(_rebuild())
+        _running.add_done_callback(_retrieve)
+    return await asyncio.shield(_running)
+
+
+def _retrieve(task):
+    # every waiter may have been cancelled (client gone); fetch the exception
+    # so asyncio does not report it as never retrieved — _rebuild logged it
+    if not task.cancelled():
+        task.exception()
+
+
+async def _rebuild():
+    global _digest
+    started = time.perf_counter()
+    try:
+        digest = await asyncio.to_thread(_loader)
+    except Exception as e:
+        _count("failures")
+        _last["error"] = str(e)
+        log.warning(f"Backorder digest refresh failed (keeping the previous digest): {e}")
+        raise
+    _digest = digest
+    _count("refreshes")
+    _last["error"]    = None
+    _last["build_ms"] = round((time.perf_counter() - started) * 1000)
+    log.info(
+        f"Backorder digest refreshed: {len(digest['records'])} backorders, "
+        f"{len(digest['groups'])} customers, {digest['scanned']} orders scanned in {_last['build_ms']} ms"
+    )
+    return digest
+
+
+async def _refresh_loop():
+    interval = BACKORDER_DIGEST_REFRESH_MINUTES * 60
+    while True:
+        with tracing.trace("backorder digest refresh"):
+            try:
+                await refresh("scheduled")
+                wait = interval
+            except Exception:
+                wait = min(interval, RETRY_SECONDS)
+        await asyncio.sleep(wait)
+
+
+def start(loader):
+    """
+    Register the loader and start the scheduled refresh on the running loop.
+
+    The first refresh runs immediately in the background. With
+    BACKORDER_DIGEST_REFRESH_MINUTES=0 nothing is scheduled and the digest
+    is only built on demand.
+
+    Args:
+        loader (callable): Blocking function returning a digest from build()
+    """
+    global _loader, _task
+    _loader = loader
+    if not BACKORDER_DIGEST_ENABLED or BACKORDER_DIGEST_REFRESH_MINUTES <= 0:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_refresh_loop())
+
+
+def top_customers(limit=10, samples=5):
+    """
+    The customers with the most backorders, for GET /backorder-digest.
+
+    Args:
+        limit   (int): Maximum number of customers
+        samples (int): Order numbers listed per customer
+
+    Returns:
+        list: One dict per customer — account, name, backorder count, sample
+              order numbers, credit limit, on-hold and credit status
+    """
+    digest = _digest
+    if digest is None:
+        return []
+    out = []
+    for account, numbers in digest["groups"][:limit]:
+        c = digest["customers"].get(account, {})
+        out.append({
+            "customer":      account,
+            "name":          c.get("OrganizationName"),
+            "backorders":    len(numbers),
+            "sample_orders": numbers[:samples],
+            "credit_limit":  c.get("CreditLimit"),
+            "on_hold":       c.get("OnHoldStatus"),
+            "credit_status": c.get("CredManAccountStatusId"),
+        })
+    return out
+
+
+def stats():
+    """
+    Digest state for /health and GET /backorder-digest.
+
+    Returns:
+        dict: enabled, built_at, age_seconds, backorders, customers,
+              refresh counters, last build time and last error
+    """
+    digest = _digest
+    with _lock:
+        counts = dict(_counts)
+    return {
+        "enabled":         BACKORDER_DIGEST_ENABLED,
+        "refresh_minutes": BACKORDER_DIGEST_REFRESH_MINUTES,
+        "max_age_minutes": BACKORDER_DIGEST_MAX_AGE_MINUTES,
+        "built_at":        digest["built_at"] if digest else None,
+        "age_seconds":     round(time.time() - digest["built_ts"]) if digest else None,
+        "backorders":      len(digest["records"]) if digest else None,
+        "customers":       len(digest["groups"]) if digest else None,
+        "scanned":         digest["scanned"] if digest else None,
+        **counts,
+        "last_build_ms":   _last["build_ms"],
+        "last_error":      _last["error"],
+    }
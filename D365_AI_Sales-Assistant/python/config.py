@@ -15,5 +15,53 @@ LOGIN_URL         = os.getenv("LOGIN_URL")
 OLLAMA_URL        = os.getenv("OLLAMA_URL")
 OLLAMA_MODEL      = os.getenv("OLLAMA_MODEL")
 
+# Small model for plain order / recent-order lookups (see model_router.py)
+OLLAMA_FAST_MODEL           = os.getenv("OLLAMA_FAST_MODEL", "qwen3:1.7b")
+OLLAMA_FAST_NUM_CTX         = int(os.getenv("OLLAMA_FAST_NUM_CTX", 4096))
+OLLAMA_FAST_NUM_PREDICT     = int(os.getenv("OLLAMA_FAST_NUM_PREDICT", 200))
+OLLAMA_FAST_TEMPERATURE     = float(os.getenv("OLLAMA_FAST_TEMPERATURE", 0.1))
+OLLAMA_ANALYSIS_NUM_CTX     = int(os.getenv("OLLAMA_ANALYSIS_NUM_CTX", 8192))
+OLLAMA_ANALYSIS_NUM_PREDICT = int(os.getenv("OLLAMA_ANALYSIS_NUM_PREDICT", 600))
+
+# Templated answers for simple lookups, no LLM call (see fast_answers.py)
+FAST_PATH_ENABLED           = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+
 HOST              = os.getenv("HOST", "0.0.0.0")
-PORT              = int(os.getenv("PORT", 8000))
\ No newline at end of file
+PORT              = int(os.getenv("PORT", 8000))
+
+ODATA_TIMEOUT_MIN_SECONDS = float(os.getenv("ODATA_TIMEOUT_MIN_SECONDS", 10))
+ODATA_TIMEOUT_MAX_SECONDS = float(os.getenv("ODATA_TIMEOUT_MAX_SECONDS", 120))
+ODATA_TIMEOUT_MULTIPLIER  = float(os.getenv("ODATA_TIMEOUT_MULTIPLIER", 4))
+ODATA_LATENCY_MAX_AGE_SECONDS = float(os.getenv("ODATA_LATENCY_MAX_AGE_SECONDS", 600))
+ODATA_RETRIES             = int(os.getenv("ODATA_RETRIES", 2))
+ODATA_BACKOFF_SECONDS     = float(os.getenv("ODATA_BACKOFF_SECONDS", 1.0))
+ODATA_HEDGE               = os.getenv("ODATA_HEDGE", "false").lower() == "true"
+BREAKER_FAILURES          = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS     = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+
+ODATA_RATE_PER_SECOND           = float(os.getenv("ODATA_RATE_PER_SECOND", 10))
+ODATA_RATE_MIN_PER_SECOND       = float(os.getenv("ODATA_RATE_MIN_PER_SECOND", 1))
+ODATA_BURST                     = int(os.getenv("ODATA_BURST", 20))
+ODATA_THROTTLE_MAX_WAIT_SECONDS = float(os.getenv("ODATA_THROTTLE_MAX_WAIT_SECONDS", 300))
+
+OLLAMA_URLS                    = [u.strip() for u in os.getenv("OLLAMA_URLS", OLLAMA_URL or "").split(",") if u.strip()]
+OLLAMA_ROUTING                 = os.getenv("OLLAMA_ROUTING", "least_loaded").lower()
+OLLAMA_EJECT_FAILURES          = int(os.getenv("OLLAMA_EJECT_FAILURES", 2))
+OLLAMA_READMIT_SECONDS         = float(os.getenv("OLLAMA_READMIT_SECONDS", 30))
+OLLAMA_HEALTH_INTERVAL_SECONDS = float(os.getenv("OLLAMA_HEALTH_INTERVAL_SECONDS", 15))
+
+PROFILING_ENABLED              = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR                    = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS            = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_SECONDS            = int(os.getenv("PROFILE_MAX_SECONDS", 60))
+
+# Request tracing (see tracing.py) — /debug/traces, X-Request-ID
+TRACING_ENABLED                = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_BUFFER_SIZE              = int(os.getenv("TRACE_BUFFER_SIZE", 200))
+TRACE_FILE                     = os.getenv("TRACE_FILE", "")   # set a path to also write JSONL
+TRACE_FILE_MAX_MB              = float(os.getenv("TRACE_FILE_MAX_MB", 50))
+
+# Precomputed backorder digest (see backorder_digest.py) — 0 minutes = no schedule
+BACKORDER_DIGEST_ENABLED          = os.getenv("BACKORDER_DIGEST_ENABLED", "true").lower() == "true"
+BACKORDER_DIGEST_REFRESH_MINUTES  = float(os.getenv("BACKORDER_DIGEST_REFRESH_MINUTES", 10))
+BACKORDER_DIGEST_MAX_AGE_MINUTES  = float(os.getenv("BACKORDER_DIGEST_MAX_AGE_MINUTES", 30))
@@ -0,0 +1,307 @@
+"""
+fast_answers.py — Deterministic Answers for Structured Lookups
+==============================================================
+Renders the answer to simple, fully determined questions straight from
+the D365 records fetch_context() already returned, in the same business
+language the LLM is prompted to use, without calling Ollama at all.
+
+Responsibilities:
+  - Recognising high-confidence simple questions from the intent and the
+    question wording:
+      * single-order status          "What is the status of order 000697?"
+      * single-order ship dates      "When will order 000697 ship?"
+      * customer order counts        "How many orders does US-001 have?"
+      * backorder counts             "How many backorders are there?"
+  - Rendering a templated answer (readable dates, no raw field names)
+  - Tracking the fast-path hit rate and render time for /health
+
+Usage:
+  from fast_answers import classify, narrow, render, record, stats
+
+  kind = classify(question, intent)             # None -> ask the LLM
+  if kind:
+      context = fetch_context(narrow(intent, kind))
+      answer  = render(kind, intent, context)
+  record(hit=kind is not None, seconds=...)
+
+Notes:
+  - Anything that asks for judgement (why, risk, recommend, compare...) or
+    combines several data sets is left to the LLM
+  - FAST_PATH_ENABLED=false or force_llm=true on the request skips it
+  - Counts are exact or not given: a customer with CUSTOMER_ORDERS_TOP or
+    more orders is counted with OData $count; a backorder scan that hit
+    BACKORDER_SCAN_TOP cannot be (status is not filterable), so render()
+    returns None and the question goes to the LLM
+  - Rendering takes well under a millisecond, and a fast-path question
+    fetches only the one data set it needs; the answer time is that
+    OData call alone
+"""
+
+import re
+import threading
+from datetime import datetime
+
+from ai_engine import CUSTOMER_ORDERS_TOP
+
+
+# ── QUESTION CLASSIFICATION ───────────────────────────────────────────────────
+
+# Wording that needs reasoning or extra data — never answered from a template
+OPEN_ENDED = (
+    "why", "should", "risk", "recommend", "suggest", "compare", "explain",
+    "analy", "trend", "credit", "limit", "payment", "overdue", "owing",
+    "debt", "priorit", "worst", "best", "which customer", "who ",
+)
+COUNT_WORDS  = ("how many", "count", "number of")
+STATUS_WORDS = ("status", "state", "where is", "progress", "what's happening", "update on")
+SHIP_WORDS   = ("ship", "deliver", "dispatch", "when will", "when is", "arrive", "eta")
+
+# F&O returns this for an empty date
+EMPTY_DATE = "1900-01-01"
+
+STATUS_TEXT = {
+    "Backorder": "open on backorder — it has not been fully delivered yet",
+    "Delivered": "delivered",
+    "Invoiced":  "delivered and invoiced",
+    "Canceled":  "canceled",
+}
+
+
+def _has(q, words):
+    """True if any of words starts a word in q ("ship" matches "shipping", not "membership")."""
+    return any(re.search(r"\b" + re.escape(w), q) for w in words)
+
+
+def _date(value):
+    """'2016-12-07T08:52:45Z' -> 'December 7 2016'; None for empty dates."""
+    if not value or str(value).startswith(EMPTY_DATE):
+        return None
+    try:
+        d = datetime.strptime(str(value)[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return f"{d.strftime('%B')} {d.day} {d.year}"
+
+
+def _plural(n, word):
+    return f"{n:,} {word}{'' if n == 1 else 's'}"
+
+
+# ── TEMPLATES ─────────────────────────────────────────────────────────────────
+
+def _order_answer(intent, context):
+    order_id = intent["sales_order_id"]
+    o = context.get("order")
+    if o is None:
+        return (
+            f"I could not find sales order {order_id} in Dynamics 365. "
+            f"Please check the order number."
+        )
+
+    status   = o.get("SalesOrderStatus") or "Unknown"
+    customer = o.get("OrderingCustomerAccountNumber")
+    name     = o.get("SalesOrderName")
+    who      = f"{customer} ({name})" if name and name != customer else customer
+    lines    = [f"Sales order {o.get('SalesOrderNumber')} for {who} is {STATUS_TEXT.get(status, status.lower())}."]
+
+    created = _date(o.get("OrderCreationDateTime"))
+    if created:
+        lines.append(f"It was created on {created}.")
+
+    requested = _date(o.get("RequestedShippingDate"))
+    confirmed = _date(o.get("ConfirmedShippingDate"))
+    if confirmed and requested and confirmed != requested:
+        lines.append(f"Shipping was requested for {requested} and is confirmed for {confirmed}.")
+    elif confirmed:
+        lines.append(f"Shipping is confirmed for {confirmed}.")
+    elif requested:
+        lines.append(f"Shipping was requested for {requested}; no confirmed ship date is set yet.")
+    else:
+        lines.append("No requested or confirmed ship date is set on the order.")
+
+    place = ", ".join(p for p in (
+        o.get("DeliveryAddressName"), o.get("DeliveryAddressCity"), o.get("DeliveryAddressStateId")
+    ) if p)
+    mode = o.get("DeliveryModeCode")
+    if place:
+        lines.append(f"It ships to {place}" + (f" (delivery mode {mode})." if mode else "."))
+    return " ".join(lines)
+
+
+def _status_mix(orders):
+    counts = {}
+    for o in orders:
+        s = o.get("SalesOrderStatus") or "Unknown"
+        counts[s] = counts.get(s, 0) + 1
+    return ", ".join(
+        f"{n} {'on backorder' if s == 'Backorder' else s.lower()}"
+        for s, n in sorted(counts.items(), key=lambda kv: -kv[1])
+    )
+
+
+def _customer_count_answer(context):
+    orders  = context.get("customer_orders") or []
+    cust_id = context.get("customer_id", "")
+    if not orders:
+        return f"Customer {cust_id} has no sales orders in Dynamics 365."
+
+    if len(orders) < CUSTOMER_ORDERS_TOP:
+        lines = [f"Customer {cust_id} has {_plural(len(orders), 'sales order')}: {_status_mix(orders)}."]
+    elif context.get("customer_order_total") is not None:
+        lines = [
+            f"Customer {cust_id} has {_plural(context['customer_order_total'], 'sales order')}. "
+            f"The latest {len(orders)} are {_status_mix(orders)}."
+        ]
+    else:
+        return None   # no exact total — let the LLM answer
+    newest = _date(orders[0].get("OrderCreationDateTime"))
+    if newest:
+        lines.append(f"The most recent order, {orders[0].get('SalesOrderNumber')}, was created on {newest}.")
+    return " ".join(lines)
+
+
+def _backorder_count_answer(intent, context):
+    if context.get("backorder_scan_capped"):
+        return None   # status cannot be $count-ed; a capped scan is not an exact count
+    backorders = context.get("backorders") or []
+    scope = f" for customer {intent['customer_id']}" if intent.get("customer_id") else ""
+    if not backorders:
+        return f"There are no sales orders on backorder{scope}."
+
+    lines = [f"There {'is' if len(backorders) == 1 else 'are'} {_plural(len(backorders), 'sales order')} on backorder{scope}."]
+    if not scope:
+        # the backorder digest has them grouped already
+        by_cust = {c: len(nums) for c, nums in context.get("backorder_groups") or []}
+        if not by_cust:
+            for o in backorders:
+                c = o.get("OrderingCustomerAccountNumber") or "Unknown"
+                by_cust[c] = by_cust.get(c, 0) + 1
+        top = sorted(by_cust.items(), key=lambda kv: -kv[1])[:3]
+        lines.append(
+            f"They belong to {_plural(len(by_cust), 'customer')}; the most affected are "
+            + ", ".join(f"{c} ({n})" for c, n in top) + "."
+        )
+    else:
+        lines.append("Orders: " + ", ".join(o.get("SalesOrderNumber") for o in backorders[:10])
+                     + (" and more." if len(backorders) > 10 else "."))
+    return " ".join(lines)
+
+
+# ── PUBLIC API ────────────────────────────────────────────────────────────────
+
+def classify(question, intent):
+    """
+    Decide whether a question can be answered from a template.
+
+    Called before fetch_context(), so a fast-path question only fetches the
+    one data set its answer needs (see narrow()).
+
+    Args:
+        question (str):  The user's original question
+        intent   (dict): Intent dictionary from detect_intent()
+
+    Returns:
+        str:  "order", "customer_count" or "backorder_count"
+        None: The question needs the LLM
+    """
+    q = question.lower()
+    if _has(q, OPEN_ENDED):
+        return None
+
+    order, customer = intent["fetch_order"], intent["fetch_customer"]
+    backorders      = intent["fetch_backorders"]
+
+    if order and not customer and not backorders and _has(q, STATUS_WORDS + SHIP_WORDS):
+        return "order"
+    if customer and not order and not backorders and _has(q, COUNT_WORDS):
+        return "customer_count"
+    if backorders and not order and _has(q, COUNT_WORDS):
+        return "backorder_count"
+    return None
+
+
+def narrow(intent, kind):
+    """
+    Copy of intent that fetches only the data a fast-path answer needs.
+
+    detect_intent() also asks for recent orders on "how many" and for credit
+    data whenever backorders are mentioned; a templated count needs neither.
+
+    Args:
+        intent (dict): Intent dictionary from detect_intent()
+        kind   (str):  Result of classify()
+
+    Returns:
+        dict: Intent for fetch_context()
+    """
+    return dict(
+        intent,
+        fetch_order=kind == "order",
+        fetch_customer=kind == "customer_count",
+        fetch_backorders=kind == "backorder_count",
+        fetch_recent=False,
+        fetch_credit=False,
+    )
+
+
+def render(kind, intent, context):
+    """
+    Render the templated answer for a classified question.
+
+    Args:
+        kind    (str):  Result of classify()
+        intent  (dict): Intent dictionary from detect_intent()
+        context (dict): Data fetched via fetch_context(narrow(intent, kind))
+
+    Returns:
+        str:  The answer, in the same style as the LLM's
+        None: The data cannot give an exact answer (a count hit its fetch
+              cap) — answer through the LLM instead
+    """
+    if kind == "order":
+        return _order_answer(intent, context)
+    if kind == "customer_count":
+        return _customer_count_answer(context)
+    return _backorder_count_answer(intent, context)
+
+
+# ── HIT RATE ──────────────────────────────────────────────────────────────────
+
+_counts = {"questions": 0, "hits": 0, "forced_llm": 0, "render_ms_total": 0.0}
+_lock   = threading.Lock()
+
+
+def record(hit, seconds=0.0, forced=False):
+    """
+    Count one answered question for the hit-rate metric.
+
+    Args:
+        hit     (bool):  True if the fast path answered
+        seconds (float): Time spent rendering the answer
+        forced  (bool):  True if the request asked for the LLM (force_llm)
+    """
+    with _lock:
+        _counts["questions"] += 1
+        if hit:
+            _counts["hits"] += 1
+            _counts["render_ms_total"] += seconds * 1000
+        if forced:
+            _counts["forced_llm"] += 1
+
+
+def stats():
+    """
+    Fast-path counters for /health.
+
+    Returns:
+        dict: questions, hits, hit_rate, forced_llm and avg_render_ms
+    """
+    with _lock:
+        c = dict(_counts)
+    return {
+        "questions":     c["questions"],
+        "hits":          c["hits"],
+        "hit_rate":      round(c["hits"] / c["questions"], 3) if c["questions"] else 0.0,
+        "forced_llm":    c["forced_llm"],
+        "avg_render_ms": round(c["render_ms_total"] / c["hits"], 3) if c["hits"] else 0.0,
+    }
@@ -0,0 +1,199 @@
+"""
+model_router.py — Intent-Based Model Routing for Ollama Calls
+=============================================================
+Picks the Ollama model and generation options for a question from its
+detected intent, so simple lookups no longer pay for an 8B model with a
+600-token budget.
+
+Responsibilities:
+  - Routing table: one entry per route with its model and options
+    (num_ctx, num_predict, temperature)
+  - Route selection from the detect_intent() dictionary
+  - Per-route latency and error statistics for /health
+  - Remembering models Ollama reported missing, so their routes go straight
+    to OLLAMA_MODEL
+
+Routes:
+  - lookup:   a plain single-order or recent-orders question (fetch_order /
+              fetch_recent without customer, credit or backorder data) —
+              OLLAMA_FAST_MODEL with a small context and a tight num_predict
+  - analysis: credit / risk or backorder analysis — OLLAMA_MODEL
+  - default:  anything else (customer history, free-form questions) —
+              OLLAMA_MODEL with the original options
+
+Usage:
+  from model_router import route_for, ROUTES, record, stats
+
+  route = route_for(intent)            # "lookup" | "analysis" | "default"
+  model_for(route), ROUTES[route]["options"]
+  mark_missing(model)                  # after an Ollama 404 for the model
+  record(route, seconds, ok=True)      # after each Ollama call
+
+Notes:
+  - The default route keeps the previous behaviour (OLLAMA_MODEL,
+    temperature 0.2, num_predict 600)
+  - If OLLAMA_FAST_MODEL has not been pulled, call_ollama() falls back to
+    OLLAMA_MODEL (Ollama answers 404 for an unknown model) and marks it
+    missing; model_for() then skips it for MISSING_MODEL_RECHECK_SECONDS, after
+    which one request tries it again (so a model pulled later is picked up)
+"""
+
+import threading
+import time
+from collections import deque
+
+from config import (
+    OLLAMA_MODEL,
+    OLLAMA_FAST_MODEL,
+    OLLAMA_FAST_NUM_CTX,
+    OLLAMA_FAST_NUM_PREDICT,
+    OLLAMA_FAST_TEMPERATURE,
+    OLLAMA_ANALYSIS_NUM_CTX,
+    OLLAMA_ANALYSIS_NUM_PREDICT,
+)
+
+LATENCY_WINDOW = 100                  # latencies kept per route for p50 / p95
+MISSING_MODEL_RECHECK_SECONDS = 600   # how long a model Ollama reported missing is skipped
+
+
+# ── ROUTING TABLE ─────────────────────────────────────────────────────────────
+
+ROUTES = {
+    "lookup": {
+        "model":   OLLAMA_FAST_MODEL,
+        "options": {
+            "num_ctx":     OLLAMA_FAST_NUM_CTX,
+            "num_predict": OLLAMA_FAST_NUM_PREDICT,
+            "temperature": OLLAMA_FAST_TEMPERATURE,
+        },
+    },
+    "analysis": {
+        "model":   OLLAMA_MODEL,
+        "options": {
+            "num_ctx":     OLLAMA_ANALYSIS_NUM_CTX,
+            "num_predict": OLLAMA_ANALYSIS_NUM_PREDICT,
+            "temperature": 0.2,
+        },
+    },
+    "default": {
+        "model":   OLLAMA_MODEL,
+        "options": {
+            "temperature": 0.2,
+            "num_predict": 600,
+        },
+    },
+}
+
+
+def route_for(intent):
+    """
+    Choose the route for a detected intent.
+
+    Args:
+        intent (dict): Intent dictionary from detect_intent()
+
+    Returns:
+        str: Route name — a key of ROUTES
+    """
+    if intent.get("fetch_credit") or intent.get("fetch_backorders"):
+        return "analysis"
+    if (intent.get("fetch_order") or intent.get("fetch_recent")) and not intent.get("fetch_customer"):
+        return "lookup"
+    return "default"
+
+
+# ── MISSING MODELS ────────────────────────────────────────────────────────────
+
+_missing      = {}   # model -> time.time() of the 404
+_missing_lock = threading.Lock()
+
+
+def mark_missing(model):
+    """
+    Remember that Ollama answered 404 for a model.
+
+    Args:
+        model (str): Model name that is not installed
+    """
+    with _missing_lock:
+        _missing[model] = time.time()
+
+
+def model_for(route):
+    """
+    Model to call for a route: its own model, or OLLAMA_MODEL while that
+    model is marked missing.
+
+    Args:
+        route (str): Route name — a key of ROUTES
+
+    Returns:
+        str: Ollama model name
+    """
+    model = ROUTES[route]["model"]
+    with _missing_lock:
+        marked = _missing.get(model)
+        if marked is None:
+            return model
+        if time.time() - marked < MISSING_MODEL_RECHECK_SECONDS:
+            return OLLAMA_MODEL
+        del _missing[model]   # recheck: this request tries the model again
+    return model
+
+
+# ── ROUTE STATISTICS ──────────────────────────────────────────────────────────
+
+_latencies = {name: deque(maxlen=LATENCY_WINDOW) for name in ROUTES}
+_counts    = {name: {"calls": 0, "errors": 0, "fallbacks": 0} for name in ROUTES}
+_lock      = threading.Lock()
+
+
+def record(route, seconds, ok=True, fallback=False):
+    """
+    Record one Ollama call on a route.
+
+    Args:
+        route    (str):   Route name
+        seconds  (float): Wall-clock time of the call
+        ok       (bool):  False if no answer was generated
+        fallback (bool):  True if the route's model was missing and OLLAMA_MODEL answered
+    """
+    with _lock:
+        counts = _counts[route]
+        counts["calls"] += 1
+        if fallback:
+            counts["fallbacks"] += 1
+        if ok:
+            _latencies[route].append(seconds)
+        else:
+            counts["errors"] += 1
+
+
+def _percentile_ms(samples, q):
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000)
+
+
+def stats():
+    """
+    Per-route model, options, call counts and latency percentiles for /health.
+
+    Returns:
+        dict: route name -> statistics
+    """
+    out = {}
+    with _missing_lock:
+        missing = set(_missing)
+    with _lock:
+        for name, route in ROUTES.items():
+            samples = sorted(_latencies[name])
+            out[name] = {
+                "model":   route["model"],
+                "missing": route["model"] in missing,
+                "options": route["options"],
+                **_counts[name],
+                "p50_ms":  _percentile_ms(samples, 0.5),
+                "p95_ms":  _percentile_ms(samples, 0.95),
+            }
+    return out
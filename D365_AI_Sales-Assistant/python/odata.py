@@ -6,23 +6,29 @@ via the OData REST API.
 
 Responsibilities:
   - Azure AD authentication using client credentials flow
-  - Token acquisition and management
+  - Token acquisition and caching
   - OData entity fetching with filtering, sorting, and pagination
-  - Error handling and logging for all OData operations
+  - Error handling and logging for all OData operations (retries, adaptive
+    timeouts and circuit breaker via resilience.py)
+  - One "odata" trace span per call with entity, status, bytes and rows
+    (see tracing.py)
 
 Dependencies:
   - requests: HTTP client for synchronous OData calls
   - config.py: Azure AD credentials and OData base URL
 
 Usage:
-  from odata import fetch_odata, fetch_odata_entity
+  from odata import fetch_odata, fetch_odata_entity, count_odata
   records = fetch_odata('SalesOrderHeadersV2', filters="SalesOrderNumber eq '000697'")
+  total = count_odata('SalesOrderHeadersV2', filters="OrderingCustomerAccountNumber eq 'US-001'")
   customers = fetch_odata_entity('CustomersV3', filters="dataAreaId eq 'usmf'")
 
 Notes:
-  - A new token is acquired on every call (stateless design for POC simplicity)
+  - The token is cached until shortly before expiry (see get_token)
   - SSL verification is disabled for VHD local development (verify=False)
-  - OData timeout is set to 120 seconds to accommodate AOS wake-up time
+  - OData timeouts adapt to observed latency, up to ODATA_TIMEOUT_MAX_SECONDS
+    (120 s by default) to accommodate AOS wake-up time
+  - An unreachable AOS raises AOSUnavailableError instead of returning []
   - SalesOrderStatus enum cannot be filtered in OData URL — filter in Python instead
   - fetch_odata automatically adds dataAreaId company filter to all queries
   - fetch_odata_entity accepts a raw filter string for entities like CustomersV3
@@ -30,6 +36,9 @@ Notes:
 """
 
 import logging
+import threading
+import time
+
 import requests
 
 from config import (
@@ -37,6 +46,8 @@ from config import (
     AAD_TENANT_ID, AAD_CLIENT_ID,
     AAD_CLIENT_SECRET, AAD_RESOURCE, LOGIN_URL
 )
+from resilience import AOSUnavailableError, get as get_with_resilience
+import tracing
 
 log = logging.getLogger(__name__)
 
@@ -58,6 +69,12 @@ HEADER_FIELDS = (
 
 # ── AUTHENTICATION ─────────────────────────────────────────────────────────────
 
+# Cached Bearer token, reused until shortly before it expires
+_token      = {"value": None, "expires": 0.0}
+_token_lock = threading.Lock()
+TOKEN_REFRESH_MARGIN = 120   # seconds before expiry at which the token is renewed
+
+
 def get_token():
     """
     Acquire an OAuth2 Bearer token from Azure AD using client credentials.
@@ -65,42 +82,102 @@ def get_token():
     Uses the client_credentials grant type — no user interaction required.
     The token is used to authenticate all OData API calls to F&O.
 
+    The token is cached and reused until TOKEN_REFRESH_MARGIN seconds
+    before its expires_in. Concurrent callers wait for a single request
+    instead of each acquiring their own. The server pre-acquires it at
+    startup so the first question does not pay for it. A 401 from OData
+    drops the cached token and the request is retried once with a new
+    one (see _renew_token).
+
     Returns:
         str: Bearer access token if successful
         None: If token acquisition fails
     """
-    token_url = f"{LOGIN_URL}{AAD_TENANT_ID}/oauth2/token"
+    with _token_lock:
+        if _token["value"] and time.time() < _token["expires"] - TOKEN_REFRESH_MARGIN:
+            return _token["value"]
 
-    data = {
-        "grant_type":    "client_credentials",
-        "client_id":     AAD_CLIENT_ID,
-        "client_secret": AAD_CLIENT_SECRET,
-        "resource":      AAD_RESOURCE,
-    }
+        token_url = f"{LOGIN_URL}{AAD_TENANT_ID}/oauth2/token"
 
-    try:
-        r = requests.post(token_url, data=data, timeout=30)
+        data = {
+            "grant_type":    "client_credentials",
+            "client_id":     AAD_CLIENT_ID,
+            "client_secret": AAD_CLIENT_SECRET,
+            "resource":      AAD_RESOURCE,
+        }
 
-        if r.status_code == 200:
-            log.info("Token acquired successfully")
-            return r.json().get("access_token")
+        try:
+            r = requests.post(token_url, data=data, timeout=30)
 
-        log.error(f"Token error {r.status_code}: {r.text[:300]}")
-        return None
+            if r.status_code == 200:
+                log.info("Token acquired successfully")
+                body = r.json()
+                _token["value"]   = body.get("access_token")
+                _token["expires"] = time.time() + float(body.get("expires_in", 3599))
+                return _token["value"]
 
-    except Exception as e:
-        log.error(f"Token request failed: {e}")
-        return None
+            log.error(f"Token error {r.status_code}: {r.text[:300]}")
+            return None
+
+        except Exception as e:
+            log.error(f"Token request failed: {e}")
+            return None
+
+
+def _renew_token(headers):
+    """
+    Replace the token in headers after OData answered 401.
+
+    The cached token is dropped if it is the one that was refused (revoked,
+    or the AOS disagrees with its expires_in); a token another request has
+    already renewed is kept. A fresh token is then put into headers.
+
+    Args:
+        headers (dict): Request headers; "Authorization" is updated in place
+
+    Returns:
+        bool: True if a new token is in headers, False if none could be acquired
+    """
+    refused = headers.get("Authorization", "")[len("Bearer "):]
+    with _token_lock:
+        if _token["value"] == refused:
+            _token["value"] = None
+
+    token = get_token()
+    if not token:
+        return False
+    headers["Authorization"] = f"Bearer {token}"
+    return True
+
+
+def _authorized_get(kind, send, headers, circuit="user"):
+    """
+    Run a GET through the resilience layer, retried once with a new token on a 401.
+
+    Args:
+        kind    (str):      Resilience request kind
+        send    (callable): send(timeout) -> requests.Response, reading headers
+        headers (dict):     The headers send uses; renewed in place on a 401
+        circuit (str):      Circuit breaker to use (resilience.breakers)
+
+    Returns:
+        requests.Response: The final response
+    """
+    r = get_with_resilience(kind, send, circuit=circuit)
+    if r.status_code == 401 and _renew_token(headers):
+        log.warning(f"OData {kind} answered 401 — retrying with a new token")
+        r = get_with_resilience(kind, send, circuit=circuit)
+    return r
 
 
 # ── ODATA FETCH — SALES ORDERS ────────────────────────────────────────────────
 
-def fetch_odata(entity, filters="", select="", top=50, orderby=""):
+def fetch_odata(entity, filters="", select="", top=50, orderby="", circuit="user"):
     """
     Fetch records from a D365 F&O OData entity.
 
     Automatically applies company filter (dataAreaId) to all queries.
-    Acquires a fresh Bearer token before each request.
+    Uses the cached Bearer token (see get_token).
 
     Use this function for SalesOrderHeadersV2 and similar entities
     where the company filter needs to be automatically appended.
@@ -114,9 +191,14 @@ def fetch_odata(entity, filters="", select="", top=50, orderby=""):
         top     (int): Maximum number of records to return (default 50)
         orderby (str): OData orderby expression
                        e.g. "OrderCreationDateTime desc"
+        circuit (str): Circuit breaker — "background" for work off the
+                       request path (see resilience.py)
 
     Returns:
-        list: List of record dictionaries, empty list on error
+        list: List of record dictionaries, empty list on a 4xx error
+
+    Raises:
+        AOSUnavailableError: AOS down or not answering (see _get_records)
 
     Notes:
         - SalesOrderStatus enum values must be filtered in Python after fetch
@@ -146,32 +228,73 @@ def fetch_odata(entity, filters="", select="", top=50, orderby=""):
         "OData-Version": "4.0",
     }
 
-    try:
-        log.info(f"OData -> {url} | filter: {full_filter} | top: {top}")
-        r = requests.get(
-            url,
-            params=params,
-            headers=headers,
-            verify=False,   # SSL verification disabled for VHD local dev
-            timeout=120     # Long timeout to allow AOS to wake from idle
-        )
+    log.info(f"OData -> {url} | filter: {full_filter} | top: {top}")
+    return _get_records(entity, url, params, headers, circuit)
+
+
+# ── ODATA FETCH — COUNT ───────────────────────────────────────────────────────
+
+def count_odata(entity, filters=""):
+    """
+    Count the records matching a filter with OData /$count, without fetching them.
+
+    Args:
+        entity  (str): OData entity name e.g. 'SalesOrderHeadersV2'
+        filters (str): Additional OData filter (AND-ed with the company filter)
+
+    Returns:
+        int:  Exact number of matching records
+        None: No token, or the AOS answered 4xx (e.g. /$count not supported)
+
+    Raises:
+        AOSUnavailableError: AOS down or not answering (see _get_records)
+
+    Notes:
+        - Like fetch_odata(), the dataAreaId company filter is always added
+    """
+    base_filter = f"dataAreaId eq '{COMPANY}'"
+    full_filter = f"{base_filter} and {filters}" if filters else base_filter
+
+    url   = f"{ODATA_BASE_URL}/{entity}/$count"
+    token = get_token()
+
+    if not token:
+        log.error("Could not get auth token — aborting OData count")
+        return None
+
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept":        "text/plain",
+        "OData-Version": "4.0",
+    }
+
+    def send(timeout):
+        return requests.get(url, params={"$filter": full_filter}, headers=headers, verify=False, timeout=timeout)
+
+    log.info(f"OData -> {url} | filter: {full_filter}")
+    with tracing.span("odata.count", entity=entity) as span:
+        r = _authorized_get(f"{entity}/$count", send, headers)
+        span.set(status=r.status_code)
 
         if r.status_code == 200:
-            records = r.json().get("value", [])
-            log.info(f"OData returned {len(records)} records from {entity}")
-            return records
+            try:
+                total = int(r.text.strip().lstrip("\ufeff"))
+            except ValueError:
+                log.warning(f"OData $count for {entity} returned {r.text[:50]!r}")
+                return None
+            span.set(rows=total)
+            return total
 
-        log.warning(f"OData {r.status_code}: {r.text[:200]}")
-        return []
+    if r.status_code >= 500 or r.status_code == 429:
+        raise AOSUnavailableError(f"D365 AOS unavailable — {entity}/$count returned {r.status_code}")
 
-    except Exception as e:
-        log.error(f"OData error: {e}")
-        return []
+    log.warning(f"OData $count {r.status_code}: {r.text[:200]}")
+    return None
 
 
 # ── ODATA FETCH — GENERIC ENTITY ──────────────────────────────────────────────
 
-def fetch_odata_entity(entity, filters="", select="", top=50):
+def fetch_odata_entity(entity, filters="", select="", top=50, circuit="user"):
     """
     Fetch records from any D365 F&O OData entity using a raw filter string.
 
@@ -188,9 +311,14 @@ def fetch_odata_entity(entity, filters="", select="", top=50):
                        e.g. "dataAreaId eq 'usmf' and CustomerAccount eq 'US-001'"
         select  (str): Comma-separated list of fields to return
         top     (int): Maximum number of records to return (default 50)
+        circuit (str): Circuit breaker — "background" for work off the
+                       request path (see resilience.py)
 
     Returns:
-        list: List of record dictionaries, empty list on error
+        list: List of record dictionaries, empty list on a 4xx error
+
+    Raises:
+        AOSUnavailableError: AOS down or not answering (see _get_records)
 
     Example:
         customers = fetch_odata_entity(
@@ -222,24 +350,61 @@ def fetch_odata_entity(entity, filters="", select="", top=50):
         "OData-Version": "4.0",
     }
 
-    try:
-        log.info(f"OData -> {url} | filters: {filters} | top: {top}")
-        r = requests.get(
+    log.info(f"OData -> {url} | filters: {filters} | top: {top}")
+    return _get_records(entity, url, params, headers, circuit)
+
+
+# ── ODATA REQUEST ─────────────────────────────────────────────────────────────
+
+SCAN_MIN_TOP = 100   # GETs with a larger $top are timed as "<entity>/scan"
+
+
+def _get_records(entity, url, params, headers, circuit="user"):
+    """
+    Run one OData GET through the resilience layer and return its records.
+
+    Args:
+        entity  (str):  Entity name, the resilience request kind ("/scan"
+                        appended above SCAN_MIN_TOP records)
+        url     (str):  Entity URL
+        params  (dict): OData query parameters
+        headers (dict): Request headers including the Bearer token
+        circuit (str):  Circuit breaker to use (resilience.breakers)
+
+    Returns:
+        list: Records from the response "value", empty list on a 4xx response
+
+    Raises:
+        AOSUnavailableError: The AOS timed out, refused the connection or
+                             answered 5xx after all retries, or the circuit
+                             breaker is open — not the same as "no data"
+    """
+    def send(timeout):
+        return requests.get(
             url,
             params=params,
             headers=headers,
-            verify=False,   # SSL verification disabled for VHD local dev
-            timeout=120     # Long timeout to allow AOS to wake from idle
+            verify=False,     # SSL verification disabled for VHD local dev
+            timeout=timeout   # adaptive — see resilience.py
         )
 
+    # large scans (the backorder scan) get their own latency kind, so their
+    # p95 does not set the timeout of single-record lookups
+    top  = params.get("$top") or 0
+    kind = f"{entity}/scan" if top > SCAN_MIN_TOP else entity
+
+    with tracing.span("odata", entity=entity, top=params.get("$top")) as span:
+        r = _authorized_get(kind, send, headers, circuit)
+        span.set(status=r.status_code, bytes=len(r.content))
+
         if r.status_code == 200:
             records = r.json().get("value", [])
+            span.set(rows=len(records))
             log.info(f"OData returned {len(records)} records from {entity}")
             return records
 
-        log.warning(f"OData {r.status_code}: {r.text[:200]}")
-        return []
+    if r.status_code >= 500 or r.status_code == 429:
+        raise AOSUnavailableError(f"D365 AOS unavailable — {entity} returned {r.status_code}")
 
-    except Exception as e:
-        log.error(f"OData error: {e}")
-        return []
\ No newline at end of file
+    log.warning(f"OData {r.status_code}: {r.text[:200]}")
+    return []
@@ -0,0 +1,178 @@
+"""
+profiler.py — Opt-In Sampling Profiler for Slow Requests
+========================================================
+Shows where the Python time of a slow /ask went — JSON decode in odata.py,
+backorder filtering, prompt building or the server itself — without any
+third-party profiler.
+
+Responsibilities:
+  - Sampling: a background thread snapshots every thread's Python stack
+    (sys._current_frames) every PROFILE_INTERVAL_MS, so work run with
+    asyncio.to_thread (fetch_context) is seen as well as the event loop
+  - Idle filtering: threads parked in the selector, a queue or a lock wait
+    are dropped unless asked for
+  - Output as collapsed stacks (flamegraph.pl, speedscope) or speedscope
+    JSON, returned directly or saved under PROFILE_DIR
+
+Usage:
+  from profiler import Sampler, save
+
+  sampler = Sampler().start()
+  ...                                        # the work to profile
+  sampler.stop()
+  save(sampler, "/ask", "speedscope")        # -> file name under PROFILE_DIR
+
+Notes:
+  - Only active with PROFILING_ENABLED=true; otherwise server.py installs
+    no middleware and /debug/profile answers 404, so it costs nothing
+  - A per-request profile also contains any other request that ran at the
+    same time — profile on a quiet server for clean results
+  - Time spent waiting on Ollama or the AOS shows up as the HTTP call that
+    is waiting, not as Python work
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from config import PROFILE_DIR, PROFILE_INTERVAL_MS
+
+log = logging.getLogger(__name__)
+
+FORMATS = ("speedscope", "collapsed")
+MAX_DEPTH = 128
+
+# (file name, function) of leaf frames that mean "waiting, not working"
+_IDLE = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+}
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Sampler:
+    """Samples all thread stacks into a Counter of collapsed stacks."""
+
+    def __init__(self, interval_ms: float = None, include_idle: bool = False):
+        self.interval = max(1.0, interval_ms or PROFILE_INTERVAL_MS) / 1000
+        self.include_idle = include_idle
+        self.stacks  = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        self._stop   = threading.Event()
+        self._thread = None
+
+    def start(self) -> "Sampler":
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "Sampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def _run(self) -> None:
+        me    = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in _IDLE:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    # ── Output ────────────────────────────────────────────────────────────────
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed stacks, heaviest first."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def speedscope(self, name: str = "profile") -> str:
+        """speedscope.app file: one sampled profile, weights in milliseconds."""
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, n in self.stacks.most_common():
+            ids = []
+            for f in stack.split(";"):
+                if f not in index:
+                    index[f] = len(frames)
+                    frames.append({"name": f})
+                ids.append(index[f])
+            samples.append(ids)
+            weights.append(round(n * self.interval * 1000, 3))
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared":  {"frames": frames},
+            "profiles": [{
+                "type":       "sampled",
+                "name":       name,
+                "unit":       "milliseconds",
+                "startValue": 0,
+                "endValue":   round(sum(weights), 3),
+                "samples":    samples,
+                "weights":    weights,
+            }],
+            "name":     name,
+            "exporter": "d365-sales-assistant profiler",
+        })
+
+    def render(self, fmt: str, name: str = "profile") -> str:
+        return self.speedscope(name) if fmt == "speedscope" else self.collapsed()
+
+
+def save(sampler: Sampler, label: str, fmt: str = "speedscope") -> str:
+    """
+    Write a finished profile under PROFILE_DIR.
+
+    Args:
+        sampler (Sampler): A stopped sampler
+        label   (str):     Used in the file name, e.g. the request path
+        fmt     (str):     "speedscope" or "collapsed"
+
+    Returns:
+        str: The file name (served by /debug/profiles/{name})
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-") or "root"
+    ext  = "speedscope.json" if fmt == "speedscope" else "collapsed.txt"
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{slug}.{ext}"
+    with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+        f.write(sampler.render(fmt, label))
+    log.info(f"Profile saved: {name} ({sampler.samples} samples, {sampler.elapsed * 1000:.0f} ms)")
+    return name
+
+
+def path_for(name: str):
+    """Full path of a saved profile, or None (also for anything outside PROFILE_DIR)."""
+    if os.path.basename(name) != name or not name.endswith((".speedscope.json", ".collapsed.txt")):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
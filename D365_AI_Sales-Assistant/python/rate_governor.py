@@ -0,0 +1,134 @@
+"""
+rate_governor.py — Client-Side Pacing Under F&O Service Protection Limits
+=========================================================================
+A process-wide token bucket that every OData request passes through, so
+bursts of questions are queued and paced instead of running into the
+AOS service protection limits and failing with 429 Too Many Requests.
+
+Responsibilities:
+  - Burst shaping: the bucket holds up to ODATA_BURST tokens refilled at
+    the current rate; callers that find it empty reserve a future token
+    and sleep until it is theirs, in arrival order
+  - Honouring Retry-After: a 429 pauses every caller for the advertised
+    delay (delta-seconds or HTTP-date) with no refill while paused
+  - Adaptive rate (AIMD): starts at ODATA_RATE_PER_SECOND, halves on a
+    429 (down to ODATA_RATE_MIN_PER_SECOND) and recovers by
+    ODATA_RATE_PER_SECOND / 50 per successful request, so sustained
+    throughput settles just under what the AOS accepts
+
+Usage:
+  from rate_governor import governor
+
+  governor.acquire()            # before each request — may sleep
+  governor.throttled(seconds)   # on 429 with Retry-After
+  governor.success()            # on any non-throttled answer
+
+Notes:
+  - resilience.get() drives the governor; callers never need to
+  - Queue length, current rate and average wait are reported by /health
+"""
+
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from config import ODATA_RATE_PER_SECOND, ODATA_RATE_MIN_PER_SECOND, ODATA_BURST
+
+log = logging.getLogger(__name__)
+
+
+def retry_after_seconds(value, default: float) -> float:
+    """Retry-After header (delta-seconds or HTTP-date) in seconds."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class RateGovernor:
+    """Token bucket with FIFO reservations, Retry-After pauses and AIMD rate."""
+
+    def __init__(self, rate: float, min_rate: float, burst: int):
+        self.max_rate = max(0.01, rate)
+        self.min_rate = max(0.01, min(min_rate, self.max_rate))
+        self.rate     = self.max_rate
+        self.burst    = max(1, burst)
+        self.tokens   = float(self.burst)
+        self.updated  = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting   = 0
+        self.granted   = 0
+        self.throttles = 0
+        self.wait_total = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self) -> float:
+        """Take one token, sleeping for it if needed; returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate if self.tokens < 0 else 0.0, self.paused_until - now)
+            self.granted += 1
+            self.wait_total += wait
+            if wait > 0:
+                self.waiting += 1
+        if wait > 0:
+            time.sleep(wait)
+            # a 429 may have paused everyone while this caller slept
+            while True:
+                with self._lock:
+                    pause = self.paused_until - time.monotonic()
+                    if pause <= 0:
+                        self.waiting -= 1
+                        break
+                    self.wait_total += pause
+                time.sleep(pause)
+        return wait
+
+    def throttled(self, seconds: float) -> None:
+        """429 with Retry-After: pause all requests and halve the rate (once per pause)."""
+        with self._lock:
+            now = time.monotonic()
+            if now >= self.paused_until:   # requests in flight during a pause count once
+                self.rate = max(self.min_rate, self.rate / 2)
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens  = min(self.tokens, 0.0)
+            self.updated = self.paused_until   # no refill while paused
+            self.throttles += 1
+        log.warning(f"OData throttled (429) — pausing {seconds:.1f}s, rate now {self.rate:.2f}/s")
+
+    def success(self) -> None:
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate_per_second":  round(self.rate, 2),
+                "max_per_second":   self.max_rate,
+                "burst":            self.burst,
+                "tokens":           round(max(self.tokens, 0.0), 1),
+                "queued":           self.waiting,
+                "granted":          self.granted,
+                "throttled":        self.throttles,
+                "paused_seconds":   round(max(0.0, self.paused_until - time.monotonic()), 1),
+                "avg_wait_ms":      round(self.wait_total / self.granted * 1000, 1) if self.granted else 0,
+            }
+
+
+governor = RateGovernor(ODATA_RATE_PER_SECOND, ODATA_RATE_MIN_PER_SECOND, ODATA_BURST)
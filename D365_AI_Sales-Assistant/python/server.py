@@ -10,7 +10,14 @@ Responsibilities:
   - CORS middleware for cross-origin requests
   - Request/response model definitions
   - API endpoint routing and orchestration
-  - Ollama model warm-up on server startup
+  - Background warm-up on server startup (Ollama model, Azure AD token)
+  - Choosing between a templated fast-path answer (fast_answers.py) and
+    the LLM for each question
+  - Keeping the precomputed backorder digest (backorder_digest.py) on its
+    refresh schedule, and stamping answers built from it with its time
+  - Request tracing: every request gets a request id (X-Request-ID) and a
+    span tree of its intent, OData, prompt, Ollama and render steps
+    (tracing.py), viewable under /debug/traces
   - Delegates all business logic to ai_engine.py and odata.py
 
 Endpoints:
@@ -18,6 +25,12 @@ Endpoints:
   GET  /test-odata  — Tests OData connectivity, returns 3 sample records
   POST /ask         — Main endpoint, returns full JSON response with answer
   POST /ask-text    — Same as /ask but returns plain text only (used by X++)
+  GET  /backorder-digest — State of the precomputed backorder digest
+  POST /backorder-digest/refresh — Rebuild the backorder digest now
+  GET  /debug/profile — Samples the whole process for N seconds (PROFILING_ENABLED)
+  GET  /debug/profiles/{name} — A saved per-request profile (PROFILING_ENABLED)
+  GET  /debug/traces  — Slowest / latest recent request traces (TRACING_ENABLED)
+  GET  /debug/traces/{request_id} — One trace's spans (TRACING_ENABLED)
 
 Dependencies:
   - fastapi: Web framework
@@ -35,22 +48,40 @@ Environment:
   Python 3.14+ compatible (no pinned package versions)
 """
 
+import asyncio
+import hashlib
 import logging
+import time
 
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from config import OLLAMA_MODEL, COMPANY
-from odata import fetch_odata
-from ai_engine import detect_intent, fetch_context, build_prompt, call_ollama, warm_up_ollama
+from config import (
+    OLLAMA_MODEL, COMPANY, FAST_PATH_ENABLED,
+    PROFILING_ENABLED, PROFILE_MAX_SECONDS, TRACING_ENABLED,
+)
+from odata import fetch_odata, get_token
+from ai_engine import (
+    detect_intent, fetch_context, build_prompt, call_ollama, warm_up_ollama, load_backorder_digest,
+)
+from startup_tasks import launch, progress as startup_progress
+from resilience import AOSUnavailableError, stats as odata_stats
+from ollama_pool import pool as ollama_pool
+from model_router import route_for, stats as route_stats
+import fast_answers
+import backorder_digest
+import profiler
+import tracing
 
 # ── LOGGING ───────────────────────────────────────────────────────────────────
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
+    format="%(asctime)s [%(levelname)s] [%(request_id)s] %(message)s"
 )
+tracing.install_log_filter()   # request_id: the current request's trace id, "-" outside one
 log = logging.getLogger(__name__)
 
 
@@ -69,22 +100,91 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile", "X-Request-ID"],
 )
 
 
+# ── PROFILING ─────────────────────────────────────────────────────────────────
+# Installed only when PROFILING_ENABLED=true, so it costs nothing when off.
+
+if PROFILING_ENABLED:
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        """
+        Run a request under the sampling profiler when it carries a
+        ?profile= query flag (value speedscope or collapsed; anything else
+        means speedscope) — the same flag as the revenue server, and one a
+        browser or an X++ HttpClient can add without custom headers. The
+        profile is saved under PROFILE_DIR and linked from the response's
+        X-Profile header.
+        """
+        fmt = request.query_params.get("profile")
+        if not fmt:
+            return await call_next(request)
+        fmt = fmt if fmt in profiler.FORMATS else "speedscope"
+        sampler = profiler.Sampler().start()
+        try:
+            response = await call_next(request)
+        finally:
+            sampler.stop()
+        name = await asyncio.to_thread(profiler.save, sampler, request.url.path, fmt)
+        response.headers["X-Profile"] = f"/debug/profiles/{name}"
+        return response
+
+
+# ── TRACING ───────────────────────────────────────────────────────────────────
+# Installed only when TRACING_ENABLED=true (the default).
+
+if TRACING_ENABLED:
+    @app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        """
+        Run every request except /debug/* as a trace. The request id is the
+        caller's X-Request-ID header (or a generated one); it is returned in
+        the X-Request-ID response header and tagged on every log line.
+        """
+        if request.url.path.startswith("/debug/"):
+            return await call_next(request)
+        with tracing.trace(f"{request.method} {request.url.path}", request.headers.get("X-Request-ID")) as t:
+            response = await call_next(request)
+            t.attrs["status"] = response.status_code
+        response.headers["X-Request-ID"] = t.id
+        return response
+
+
 # ── STARTUP ───────────────────────────────────────────────────────────────────
 
 @app.on_event("startup")
 async def startup_event():
     """
     Run once when the FastAPI server starts.
-    Warms up the Ollama model so it is loaded into memory before the
-    first real request arrives. Prevents cold-start timeouts on the
-    first question after server restart.
+    Launches the Ollama warm-up and the first Azure AD token acquisition
+    as concurrent background tasks and returns immediately, so the server
+    starts listening and /health answers while the model is still loading.
+    Progress is reported by /health under "startup". Also starts the
+    periodic Ollama backend health checks and the backorder digest
+    refresh, whose first build runs straight away in the background.
     """
-    log.info("Server starting — warming up Ollama model...")
-    await warm_up_ollama()
-    log.info("Startup complete — server ready.")
+    log.info("Server starting — warm-up runs in the background (see /health)")
+    launch("ollama", warm_up_ollama)
+    ollama_pool.start_health_checks()
+    launch("token", _acquire_token)
+    backorder_digest.start(load_backorder_digest)
+
+
+def _acquire_token():
+    """Pre-acquire the Azure AD token so the first question does not wait for it."""
+    if not get_token():
+        raise RuntimeError("Could not acquire Azure AD token — check .env credentials")
+    return "cached"
+
+
+# Answer returned by /ask-text when D365 cannot be reached
+AOS_UNAVAILABLE_TEXT = (
+    "D365 is not responding right now, so no order data could be read. "
+    "Open Accounts Receivable > Orders > All Sales Orders to wake the AOS, "
+    "then ask again in a minute."
+)
 
 
 # ── REQUEST / RESPONSE MODELS ─────────────────────────────────────────────────
@@ -97,10 +197,13 @@ class AskRequest(BaseModel):
         question       (str): Natural language question from the user (required)
         sales_order_id (str): Optional explicit order number e.g. '000697'
         customer_id    (str): Optional explicit customer account e.g. 'US-001'
+        force_llm      (bool): Always ask the LLM, even for simple lookups
+                               the fast path could answer from a template
     """
     question:       str
     sales_order_id: str = ""
     customer_id:    str = ""
+    force_llm:      bool = False
 
 
 class AskResponse(BaseModel):
@@ -125,11 +228,30 @@ async def health():
     Health check endpoint.
     Returns server status, configured model, and active company.
     Use this to verify the server is running before testing other endpoints.
+
+    Answers as soon as the server listens. "ready" turns true once the
+    background startup tasks (Ollama warm-up, token) have finished;
+    "startup" shows each task's status and timing. "odata" shows the AOS
+    circuit breaker state, retry / hedge counters and adaptive timeouts;
+    "ollama" shows each inference backend's health, load and latency;
+    "routes" shows each model route's model, options and latency;
+    "fast_path" shows how many questions were answered without the LLM;
+    "backorder_digest" shows the digest's age, size and refresh counters;
+    "tracing" counts the request traces recorded and written.
     """
+    startup = startup_progress()
     return {
         "status":  "ok",
+        "ready":   startup["ready"],
         "model":   OLLAMA_MODEL,
-        "company": COMPANY
+        "ollama":  ollama_pool.stats(),
+        "routes":  route_stats(),
+        "fast_path": fast_answers.stats(),
+        "backorder_digest": backorder_digest.stats(),
+        "company": COMPANY,
+        "startup": startup,
+        "odata":   odata_stats(),
+        "tracing": tracing.stats() if TRACING_ENABLED else "disabled",
     }
 
 
@@ -138,52 +260,126 @@ async def test_odata():
     """
     OData connectivity test endpoint.
     Fetches 3 sample sales orders from D365 to verify authentication
-    and OData connectivity are working correctly.
+    and OData connectivity are working correctly. If the AOS cannot be
+    reached, "error" explains why (timeout, refused, circuit open).
 
     If connected=false, check:
     1. F&O AOS is awake (open All Sales Orders in browser first)
     2. Azure AD credentials in .env are correct
     3. VPN or network connectivity to F&O
     """
-    records = fetch_odata(
-        "SalesOrderHeadersV2",
-        select="SalesOrderNumber,SalesOrderStatus,OrderingCustomerAccountNumber",
-        top=3
-    )
+    try:
+        records = await asyncio.to_thread(
+            fetch_odata,
+            "SalesOrderHeadersV2",
+            select="SalesOrderNumber,SalesOrderStatus,OrderingCustomerAccountNumber",
+            top=3
+        )
+    except AOSUnavailableError as e:
+        return {"connected": False, "error": str(e), "sample": []}
     return {
         "connected": len(records) > 0,
         "sample":    records
     }
 
 
+async def _answer(req):
+    """
+    Answer one question — from a template when the fast path can, else via the LLM.
+
+    Args:
+        req (AskRequest): The request body
+
+    Returns:
+        tuple: (answer, intent, context, route) — route is "fast_path" for
+               templated answers, else the model_router route name (also
+               when a templated count would not be exact). An
+               answer built from the backorder digest ends with its time.
+
+    Raises:
+        AOSUnavailableError: D365 could not be reached
+    """
+    # the question itself stays out of traces (they are served by /debug/traces
+    # and may be written to disk) — a hash still groups repeats of one question
+    tracing.annotate(
+        question_sha=hashlib.sha256(req.question.encode()).hexdigest()[:12],
+        question_chars=len(req.question),
+    )
+    with tracing.span("intent") as span:
+        intent = detect_intent(req.question, req.sales_order_id, req.customer_id)
+        kind = None
+        if FAST_PATH_ENABLED and not req.force_llm:
+            kind = fast_answers.classify(req.question, intent)
+        span.set(fetch=[k[6:] for k, v in intent.items() if k.startswith("fetch_") and v], fast_path=kind)
+
+    if kind:
+        started  = time.perf_counter()
+        with tracing.span("fetch_context"):
+            context = await asyncio.to_thread(fetch_context, fast_answers.narrow(intent, kind))
+        fetched  = time.perf_counter()
+        with tracing.span("render", kind=kind) as span:
+            answer = fast_answers.render(kind, intent, context)
+            span.set(chars=len(answer) if answer else None)
+        if answer is not None:
+            fast_answers.record(hit=True, seconds=time.perf_counter() - fetched)
+            log.info(f"Fast-path answer ({kind}) in {(time.perf_counter() - started) * 1000:.0f} ms, no LLM call")
+            tracing.annotate(route="fast_path")
+            return _stamp(answer, context), intent, context, "fast_path"
+        log.info(f"Fast path ({kind}) has no exact answer (fetch cap reached) — asking the LLM")
+
+    with tracing.span("fetch_context"):
+        context = await asyncio.to_thread(fetch_context, intent)
+    with tracing.span("prompt_build") as span:
+        prompt = build_prompt(req.question, context, intent)
+        span.set(chars=len(prompt))
+    route   = route_for(intent)
+    answer  = await call_ollama(prompt, route)
+    fast_answers.record(hit=False, forced=req.force_llm)
+    tracing.annotate(route=route)
+    return _stamp(answer, context), intent, context, route
+
+
+def _stamp(answer, context):
+    """Append the digest time to an answer built from the backorder digest."""
+    if context.get("backorder_source") != "digest":
+        return answer
+    return f"{answer}\n\n(Backorder data as of {backorder_digest.as_of_text(context['data_as_of'])}.)"
+
+
 @app.post("/ask", response_model=AskResponse)
 async def ask(req: AskRequest):
     """
     Main AI assistant endpoint — returns full JSON response.
     Use this endpoint for testing via Postman or the /docs UI.
 
-    Flow:
+    Flow (see _answer):
         1. Detect intent from question + optional context fields
-        2. Fetch relevant D365 data based on intent
-        3. Build structured prompt with D365 data
-        4. Call Ollama LLM and get answer
-        5. Return answer with metadata
+        2. Simple lookups: fetch just the record(s) needed and render a
+           templated answer (fast_answers.py) — no LLM call
+        3. Otherwise fetch relevant D365 data based on intent,
+           build a structured prompt and call the Ollama LLM
+           (model chosen from the intent, see model_router.py)
+        4. Return answer with metadata
     """
     log.info(f"Question: {req.question}")
 
-    intent  = detect_intent(req.question, req.sales_order_id, req.customer_id)
-    context = fetch_context(intent)
-    prompt  = build_prompt(req.question, context, intent)
-    answer  = await call_ollama(prompt)
+    try:
+        answer, intent, context, route = await _answer(req)
+    except AOSUnavailableError as e:
+        headers = {"Retry-After": str(max(1, round(e.retry_in)))} if e.retry_in else None
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
 
     return AskResponse(
         answer=answer,
         question=req.question,
         data_used={
             "intent":          intent,
+            "route":           route,
             "order_found":     context.get("order") is not None,
             "backorders":      len(context.get("backorders", [])),
             "customer_orders": len(context.get("customer_orders", [])),
+            "backorder_source": context.get("backorder_source"),
+            "data_as_of":      context.get("data_as_of"),
         }
     )
 
@@ -199,17 +395,144 @@ async def ask_text(req: AskRequest):
 
     The X++ SalesAIAssistantService class calls this endpoint directly
     and displays the response text in the AnswerDisplay form control.
+
+    Simple lookups are answered from a template without the LLM, exactly
+    as in /ask (force_llm=true in the body asks the LLM anyway).
+
+    If the AOS is down or asleep the answer is AOS_UNAVAILABLE_TEXT (still
+    HTTP 200, so the form can display it) instead of an LLM answer built on
+    empty data.
     """
     log.info(f"Question (text): {req.question}")
 
-    intent  = detect_intent(req.question, req.sales_order_id, req.customer_id)
-    context = fetch_context(intent)
-    prompt  = build_prompt(req.question, context, intent)
-    answer  = await call_ollama(prompt)
+    try:
+        answer, _, _, _ = await _answer(req)
+    except AOSUnavailableError as e:
+        # Plain 200 text so the X++ form shows the reason instead of failing
+        log.warning(f"/ask-text: {e}")
+        return Response(content=AOS_UNAVAILABLE_TEXT, media_type="text/plain")
 
     return Response(content=answer, media_type="text/plain")
 
 
+@app.get("/backorder-digest")
+async def get_backorder_digest():
+    """
+    State of the precomputed backorder digest: when it was built, how many
+    backorders and customers it holds, the refresh schedule and counters,
+    and the ten customers with the most backorders — count, sample orders,
+    credit limit, on-hold and credit status.
+    """
+    return {**backorder_digest.stats(), "top_customers": backorder_digest.top_customers()}
+
+
+@app.post("/backorder-digest/refresh")
+async def refresh_backorder_digest():
+    """
+    Rebuild the backorder digest now (e.g. after a large shipment run)
+    instead of waiting for BACKORDER_DIGEST_REFRESH_MINUTES. Waits for the
+    scan to finish; a refresh already running is joined, not repeated.
+    Answers 503 if D365 cannot be reached — the previous digest is kept.
+    """
+    try:
+        await backorder_digest.refresh("on_demand")
+    except AOSUnavailableError as e:
+        headers = {"Retry-After": str(max(1, round(e.retry_in)))} if e.retry_in else None
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
+    return backorder_digest.stats()
+
+
+# ── DEBUG ─────────────────────────────────────────────────────────────────────
+
+@app.get("/debug/profile")
+async def debug_profile(
+    seconds: float = Query(5, gt=0, le=PROFILE_MAX_SECONDS),
+    format:  str = "speedscope",
+    idle:    bool = False,
+):
+    """
+    Sample every thread in the process for a number of seconds and return
+    the profile as a download. Ask the slow question while it runs.
+
+    Query parameters:
+        seconds (float): Sampling window, at most PROFILE_MAX_SECONDS
+        format  (str):   "speedscope" (open at speedscope.app) or
+                         "collapsed" (flamegraph.pl / speedscope)
+        idle    (bool):  Keep threads that are only waiting
+
+    Returns 404 unless PROFILING_ENABLED=true.
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if format not in profiler.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}' — use {', '.join(profiler.FORMATS)}")
+    sampler = profiler.Sampler(include_idle=idle).start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    body = sampler.render(format, f"process {seconds:g}s")
+    ext  = "speedscope.json" if format == "speedscope" else "collapsed.txt"
+    return Response(
+        content=body,
+        media_type="application/json" if format == "speedscope" else "text/plain",
+        headers={"Content-Disposition": f'attachment; filename="process.{ext}"'},
+    )
+
+
+@app.get("/debug/profiles/{name}")
+async def debug_saved_profile(name: str):
+    """
+    Download a per-request profile saved under PROFILE_DIR — the URL is in
+    the X-Profile response header of the profiled request.
+    Returns 404 unless PROFILING_ENABLED=true.
+    """
+    path = profiler.path_for(name) if PROFILING_ENABLED else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path, filename=name)
+
+
+@app.get("/debug/traces")
+async def debug_traces(
+    limit:  int = Query(20, ge=1, le=500),
+    sort:   str = "slowest",
+    min_ms: float = Query(0, ge=0),
+):
+    """
+    List recent request traces from the in-memory buffer.
+
+    Query parameters:
+        limit  (int):   Maximum number of traces
+        sort   (str):   "slowest" (default) or "recent" (newest first)
+        min_ms (float): Leave out requests faster than this
+
+    Each entry has the request id, question hash, duration, status and the three
+    slowest spans; open /debug/traces/{request_id} for the full span tree.
+    Returns 404 unless TRACING_ENABLED=true.
+    """
+    if not TRACING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if sort not in ("slowest", "recent"):
+        raise HTTPException(status_code=400, detail=f"Unknown sort '{sort}' — use slowest, recent")
+    return {"tracing": tracing.stats(), "traces": tracing.recent(limit, sort, min_ms)}
+
+
+@app.get("/debug/traces/{request_id}")
+async def debug_trace(request_id: str, format: str = "json"):
+    """
+    One request's trace: every span with its offset, duration, thread and
+    attributes as JSON, or with format=text an indented span tree.
+    Returns 404 if the trace is no longer buffered or TRACING_ENABLED=false.
+    """
+    data = tracing.get(request_id) if TRACING_ENABLED else None
+    if data is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if format == "text":
+        return Response(content=tracing.tree(data), media_type="text/plain")
+    return data
+
+
 # ── LOCAL DEV ENTRY POINT ─────────────────────────────────────────────────────
 
 if __name__ == "__main__":
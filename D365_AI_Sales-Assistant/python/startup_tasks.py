@@ -0,0 +1,95 @@
+"""
+startup_tasks.py — Background Startup Work with Progress Reporting
+==================================================================
+Runs server warm-up work (Ollama model load, first Azure AD token) as
+background tasks so the FastAPI startup hook returns immediately.
+uvicorn starts listening straight away and /health answers within
+milliseconds of process start, while the slow work completes behind it.
+
+Responsibilities:
+  - Launching async functions on the event loop and plain functions in
+    worker threads
+  - Tracking per-task status, start offset and elapsed time
+  - Reporting overall readiness for the /health endpoint
+
+Usage:
+  from startup_tasks import launch, progress
+
+  launch("ollama", warm_up_ollama)     # inside the startup hook
+  progress()  ->  {"ready": False, "tasks": {"ollama": {"status": "running", ...}}}
+
+Notes:
+  - Failures are logged and reported, never fatal — every resource is
+    also initialised lazily by the request path that needs it
+  - Task states: pending → running → done | failed
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+_started = time.time()   # module import ≈ process start
+_tasks   = {}            # name -> progress dict, see launch()
+_handles = set()         # keeps the asyncio tasks referenced until they finish
+
+
+def launch(name, fn, *args):
+    """
+    Start fn(*args) in the background as the startup task `name`.
+
+    Must be called from the running event loop (e.g. the startup hook).
+
+    Args:
+        name (str):      Task name shown in /health
+        fn   (callable): Async function, or plain function run in a thread
+        args:            Positional arguments for fn
+    """
+    entry = {"status": "pending", "started_ms": None, "elapsed_ms": None, "detail": None}
+    _tasks[name] = entry
+
+    async def run():
+        entry["status"]     = "running"
+        entry["started_ms"] = round((time.time() - _started) * 1000)
+        t0 = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(fn):
+                result = await fn(*args)
+            else:
+                result = await asyncio.to_thread(fn, *args)
+            entry["status"] = "done"
+            entry["detail"] = result if isinstance(result, (str, int, float, bool)) else None
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["detail"] = str(e)[:200]
+            log.warning(f"Startup task '{name}' failed (non-fatal): {e}")
+        entry["elapsed_ms"] = round((time.perf_counter() - t0) * 1000)
+        log.info(f"Startup task '{name}' {entry['status']} in {entry['elapsed_ms']} ms")
+
+    task = asyncio.get_running_loop().create_task(run(), name=f"startup-{name}")
+    _handles.add(task)
+    task.add_done_callback(_handles.discard)
+
+
+def ready():
+    """
+    Returns:
+        bool: True once every launched task has finished (done or failed)
+    """
+    return all(t["status"] in ("done", "failed") for t in _tasks.values())
+
+
+def progress():
+    """
+    Startup state for the /health endpoint.
+
+    Returns:
+        dict: ready flag, milliseconds since process start, and per-task state
+    """
+    return {
+        "ready":     ready(),
+        "uptime_ms": round((time.time() - _started) * 1000),
+        "tasks":     {name: dict(t) for name, t in _tasks.items()},
+    }
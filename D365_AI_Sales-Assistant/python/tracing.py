@@ -0,0 +1,404 @@
+"""
+tracing.py — Distributed-Trace Style Spans per Request
+======================================================
+Records where the time of one /ask went — intent detection, each OData
+call, prompt building, each Ollama attempt and backend, the templated
+answer — as a tree of timed spans tagged with the request id.
+
+Responsibilities:
+  - Request id: taken from the X-Request-ID header or generated, carried
+    in a contextvar so every span and log line of the request shares it
+  - Spans: nested, timed blocks with attributes (entity, rows, bytes,
+    tokens, model, status...) opened with span() and extended with
+    set() / annotate()
+  - Storage: the last TRACE_BUFFER_SIZE traces in memory for
+    /debug/traces, and every trace as one JSON line in TRACE_FILE
+  - Viewing: slowest / most recent summaries and an indented span tree
+  - Logging: RequestIdFilter puts the request id on every log record
+
+Usage:
+  import tracing
+
+  with tracing.trace("POST /ask", request_id) as t:      # server.py middleware
+      with tracing.span("odata", entity="SalesOrderHeadersV2") as s:
+          ...
+          s.set(rows=len(records), bytes=len(r.content))
+  tracing.annotate(attempts=2)       # attribute on the innermost open span
+  tracing.recent(20, "slowest")      # summaries for /debug/traces
+  tracing.tree(tracing.get(rid))     # indented text view of one trace
+
+Notes:
+  - asyncio tasks and asyncio.to_thread (fetch_context) inherit the
+    contextvar; ThreadPoolExecutor.submit does not, so the hedged OData
+    requests in resilience.py wrap their callable with bind()
+  - Outside a trace span() and annotate() do nothing, so startup work and
+    health probes cost one contextvar lookup
+  - Traces stay in memory unless TRACE_FILE is set; the JSON file is then
+    written by a background thread and rotated to TRACE_FILE.1 at
+    TRACE_FILE_MAX_MB
+  - A caller's X-Request-ID that is already buffered or running gets a
+    -2, -3... suffix, so one id never overwrites another trace
+  - Question text is never stored, only its hash and length (server.py)
+  - With TRACING_ENABLED=false server.py installs no middleware and the
+    /debug/traces endpoints answer 404
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from config import TRACING_ENABLED, TRACE_BUFFER_SIZE, TRACE_FILE, TRACE_FILE_MAX_MB
+
+log = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("trace", default=None)   # (Trace, Span | None)
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+
+# ── SPANS AND TRACES ──────────────────────────────────────────────────────────
+
+class Span:
+    """One timed operation inside a trace; set() adds attributes."""
+
+    __slots__ = ("trace", "id", "parent", "name", "attrs", "start_ms", "error")
+
+    def __init__(self, trace, name, parent, attrs):
+        self.trace    = trace
+        self.id       = trace.next_id()
+        self.parent   = parent.id if parent is not None else None
+        self.name     = name
+        self.attrs    = attrs
+        self.start_ms = trace.elapsed_ms()
+        self.error    = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self):
+        self.trace.add({
+            "id":          self.id,
+            "parent":      self.parent,
+            "name":        self.name,
+            "start_ms":    round(self.start_ms, 2),
+            "duration_ms": round(self.trace.elapsed_ms() - self.start_ms, 2),
+            "thread":      threading.current_thread().name,
+            "attrs":       self.attrs,
+            **({"error": self.error} if self.error else {}),
+        })
+
+
+class _NoSpan:
+    """What span() yields outside a trace — set() does nothing."""
+
+    def set(self, **attrs):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    """All spans of one request."""
+
+    def __init__(self, name, request_id=None):
+        self.id       = request_id if request_id and _REQUEST_ID.match(request_id) else uuid.uuid4().hex[:16]
+        self.name     = name
+        self.started  = time.time()
+        self.attrs    = {}
+        self.spans    = []
+        self.error    = None
+        self.duration_ms = None
+        self._t0      = time.perf_counter()
+        self._next    = 0
+        self._lock    = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            self._next += 1
+            return self._next
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._t0) * 1000
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "request_id":  self.id,
+            "name":        self.name,
+            "started":     time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_ms": self.duration_ms,
+            "attrs":       self.attrs,
+            **({"error": self.error} if self.error else {}),
+            "spans":       spans,
+        }
+
+    def summary(self):
+        with self._lock:
+            slowest = sorted(self.spans, key=lambda s: -s["duration_ms"])[:3]
+            count   = len(self.spans)
+        return {
+            "request_id":  self.id,
+            "name":        self.name,
+            "started":     time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_ms": self.duration_ms,
+            "status":      self.attrs.get("status", "error" if self.error else None),
+            "question_sha": self.attrs.get("question_sha"),
+            "spans":       count,
+            "slowest":     [f"{s['name']} {s['duration_ms']:.0f} ms" for s in slowest],
+        }
+
+
+# ── RECORDING ─────────────────────────────────────────────────────────────────
+
+@contextmanager
+def trace(name, request_id=None):
+    """
+    Run the block as a new trace and store it when the block ends.
+
+    Args:
+        name       (str): Trace name, e.g. "POST /ask"
+        request_id (str): Caller's X-Request-ID; a new id is generated if
+                          missing or not a plain token
+
+    Yields:
+        Trace: The trace (None when TRACING_ENABLED=false)
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+    request_id = _claim(request_id)
+    t = Trace(name, request_id)
+    token = _current.set((t, None))
+    try:
+        yield t
+    except BaseException as e:
+        t.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _finish(t)
+        with _lock:
+            _active.discard(t.id)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time the block as a child of the current span.
+
+    Args:
+        name    (str): Span name, e.g. "odata" or "ollama"
+        **attrs:       Initial attributes
+
+    Yields:
+        Span: Call set(**attrs) on it to add attributes; outside a trace
+              a stand-in whose set() does nothing
+    """
+    cur = _current.get()
+    if cur is None:
+        yield _NO_SPAN
+        return
+    s = Span(cur[0], name, cur[1], attrs)
+    token = _current.set((cur[0], s))
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span (or the trace itself)."""
+    cur = _current.get()
+    if cur is not None:
+        (cur[1] or cur[0]).attrs.update(attrs)
+
+
+def bind(fn):
+    """
+    Wrap fn to run in a copy of the caller's context.
+
+    ThreadPoolExecutor.submit does not carry contextvars into the worker
+    thread; submit(bind(fn), ...) does, so spans opened there join the trace.
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+class RequestIdFilter(logging.Filter):
+    """Sets record.request_id ("-" outside a trace) for the log format."""
+
+    def filter(self, record):
+        cur = _current.get()
+        record.request_id = cur[0].id if cur else "-"
+        return True
+
+
+def install_log_filter():
+    """Attach RequestIdFilter to every root handler (call after logging.basicConfig)."""
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(RequestIdFilter())
+
+
+# ── BUFFER AND FILE ───────────────────────────────────────────────────────────
+
+_recent  = deque(maxlen=max(1, TRACE_BUFFER_SIZE))
+_by_id   = {}
+_lock    = threading.Lock()
+_queue   = queue.Queue(maxsize=1000)
+_writer  = None
+_counts  = {"traces": 0, "written": 0, "dropped": 0}
+_active  = set()   # ids of traces still running
+
+
+def _claim(request_id):
+    """A unique id: a caller's X-Request-ID already buffered or running gets a -2, -3... suffix."""
+    if not request_id or not _REQUEST_ID.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    with _lock:
+        rid, n = request_id, 1
+        while rid in _by_id or rid in _active:
+            n  += 1
+            rid = f"{request_id[:56]}-{n}"
+        _active.add(rid)
+    return rid
+
+
+def _finish(t):
+    t.duration_ms = round(t.elapsed_ms(), 2)
+    with _lock:
+        if len(_recent) == _recent.maxlen:
+            _by_id.pop(_recent[0].id, None)
+        _recent.append(t)
+        _by_id[t.id] = t
+        _counts["traces"] += 1
+    if TRACE_FILE:
+        _start_writer()
+        try:
+            _queue.put_nowait(t)
+        except queue.Full:
+            _counts["dropped"] += 1
+
+
+def _start_writer():
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="trace-writer", daemon=True)
+            _writer.start()
+
+
+def _write_loop():
+    while True:
+        t = _queue.get()
+        try:
+            _append(json.dumps(t.to_dict(), default=str))
+            _counts["written"] += 1
+        except Exception as e:
+            _counts["dropped"] += 1
+            log.warning(f"Trace write failed: {e}")
+
+
+def _append(line):
+    folder = os.path.dirname(TRACE_FILE)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > TRACE_FILE_MAX_MB * 1024 * 1024:
+        os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+# ── VIEWING ───────────────────────────────────────────────────────────────────
+
+def recent(limit=20, sort="slowest", min_ms=0.0):
+    """
+    Summaries of the buffered traces.
+
+    Args:
+        limit  (int):   Maximum number of traces
+        sort   (str):   "slowest" (longest first) or "recent" (newest first)
+        min_ms (float): Leave out traces faster than this
+
+    Returns:
+        list: One dict per trace — request_id, name, duration_ms, status,
+              question hash, span count and the three slowest spans
+    """
+    with _lock:
+        traces = [t for t in _recent if (t.duration_ms or 0) >= min_ms]
+    if sort == "slowest":
+        traces.sort(key=lambda t: -(t.duration_ms or 0))
+    else:
+        traces.reverse()
+    return [t.summary() for t in traces[:limit]]
+
+
+def get(request_id):
+    """
+    One buffered trace with all its spans.
+
+    Returns:
+        dict: The trace, spans in start order, or None if not buffered
+    """
+    with _lock:
+        t = _by_id.get(request_id)
+    return t.to_dict() if t else None
+
+
+def tree(data):
+    """
+    Indented text view of a trace from get().
+
+    Returns:
+        str: One line per span — name, start offset, duration, thread and
+             attributes — children indented under their parent
+    """
+    children = {}
+    for s in data["spans"]:
+        children.setdefault(s["parent"], []).append(s)
+
+    lines = [f"{data['name']}  {data['duration_ms']:.1f} ms  request_id={data['request_id']}"
+             + "".join(f"  {k}={v}" for k, v in data["attrs"].items())]
+
+    def walk(parent, depth):
+        for s in children.get(parent, []):
+            attrs = "".join(f"  {k}={v}" for k, v in s["attrs"].items())
+            error = f"  ERROR {s['error']}" if s.get("error") else ""
+            lines.append(
+                f"{'  ' * depth}{s['name']:<{max(1, 30 - 2 * depth)}} "
+                f"+{s['start_ms']:>9.1f} ms {s['duration_ms']:>9.1f} ms  [{s['thread']}]{attrs}{error}"
+            )
+            walk(s["id"], depth + 1)
+
+    walk(None, 1)
+    return "\n".join(lines) + "\n"
+
+
+def stats():
+    """
+    Tracing counters for /health.
+
+    Returns:
+        dict: traces recorded, written to / dropped from the file,
+              currently buffered, and the file path
+    """
+    with _lock:
+        buffered = len(_recent)
+    return {**_counts, "buffered": buffered, "file": TRACE_FILE or None}